@@ -1,16 +1,87 @@
 from dotenv import load_dotenv
 load_dotenv()
-from langgraph.graph import StateGraph
+from langgraph.graph import StateGraph, START
+from langgraph.types import Send
 from langchain_openai import ChatOpenAI
-from langchain.schema import HumanMessage
+from langchain.schema import HumanMessage, SystemMessage
 from langchain_core.runnables import RunnableLambda
-from typing import Dict, List, TypedDict, Any
-from app.prompt import make_review_prompt
+from typing import Annotated, Dict, List, TypedDict, Any
+from app.llm_cache import get_llm_cache
+from app.prompt import REVIEW_INSTRUCTIONS
+from app.llm_usage import llm_usage
+from app.review_planner import LLM_MODEL, ReviewRequest, assign_findings, locate_issue, plan_requests
+from app.lib.json_stream import JSONItemStream
+import asyncio
+import httpx
+import operator
 import os
-import json
+import threading
+from collections import Counter
 from app.lib.logger import logger 
 
-llm = ChatOpenAI(model="gpt-4", temperature=0.3)
+llm = ChatOpenAI(model=LLM_MODEL, temperature=0.3, stream_usage=True)
+
+# Two-tier review: a small, fast model screens every request and only requests it
+# flags (or that are too complex to trust it with) are reviewed again by LLM_MODEL
+LLM_CASCADE = os.getenv("LLM_CASCADE", "false").lower() in ("1", "true", "yes")
+LLM_SCREEN_MODEL = os.getenv("LLM_SCREEN_MODEL", "gpt-4o-mini")
+# Requests with more changed lines than this skip screening and go straight to LLM_MODEL
+CASCADE_MAX_LINES = int(os.getenv("CASCADE_MAX_LINES", "150"))
+# Screening findings that escalate a request to LLM_MODEL
+CASCADE_ESCALATE_ISSUES = int(os.getenv("CASCADE_ESCALATE_ISSUES", "1"))
+
+screen_llm = ChatOpenAI(model=LLM_SCREEN_MODEL, temperature=0, stream_usage=True)
+
+# Files of one batch analyzed in parallel
+ANALYZE_CONCURRENCY = int(os.getenv("ANALYZE_CONCURRENCY", "8"))
+# LLM requests in flight at once, shared by every chunk of every file in the event loop
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+# Stream completions so findings surface while the model is still writing
+LLM_STREAM = os.getenv("LLM_STREAM", "true").lower() in ("1", "true", "yes")
+
+_llm_semaphores = {}
+_loop_models = {}
+
+def llm_semaphore():
+    loop = asyncio.get_running_loop()
+    for stale in [l for l in _llm_semaphores if l.is_closed()]:
+        _llm_semaphores.pop(stale)
+    if loop not in _llm_semaphores:
+        _llm_semaphores[loop] = asyncio.Semaphore(LLM_CONCURRENCY)
+    return _llm_semaphores[loop]
+
+def loop_model(model):
+    """
+    A copy of `model` with an HTTP pool of its own for the running event loop.
+    The OpenAI SDK's default async pool is shared by the whole process, and each
+    asyncio.run() of a task would otherwise find its connections bound to a closed
+    loop and retry every request. Callers end the loop's run with close_loop_models().
+    """
+    if not isinstance(model, ChatOpenAI):
+        return model
+    loop = asyncio.get_running_loop()
+    for stale in [key for key in _loop_models if key[0].is_closed()]:
+        # A pool can only be closed on its own loop; this one was not closed in time
+        logger.warning("Dropping an LLM HTTP pool whose event loop ended without close_loop_models()")
+        _loop_models.pop(stale)
+    key = (loop, id(model))
+    if key not in _loop_models:
+        client = httpx.AsyncClient()
+        _loop_models[key] = (type(model)(**model.model_dump(exclude_none=True), http_async_client=client), client)
+    return _loop_models[key][0]
+
+async def close_loop_models():
+    """Close the HTTP pools loop_model() opened on the running loop; call it before the loop ends."""
+    loop = asyncio.get_running_loop()
+    for key in [key for key in _loop_models if key[0] is loop]:
+        await _loop_models.pop(key)[1].aclose()
+
+async def run_graph(graph, state, config=None):
+    """Run the review graph, then close the LLM HTTP pools of this loop (for asyncio.run callers)."""
+    try:
+        return await graph.ainvoke(state, config)
+    finally:
+        await close_loop_models()
 
 class ReviewState(TypedDict):
     files: List[Dict[str, Any]]
@@ -18,101 +89,208 @@ class ReviewState(TypedDict):
     current_file: Dict[str, Any]
     results: List[Any]
     current_result: Any
+    # (file position, part, chunk) triples written concurrently by the fan-out branches
+    mapped_results: Annotated[List[Any], operator.add]
     owner: str
     repo: str
     pr_number: int
 
 ### NODES ###
 
-def analyze_file(state: Dict) -> Dict:
-    try:
-        file = state["current_file"]
-        logger.info(f"Analyzing file: {file.get('filename')}")
-        state['owner'] = file['owner']
-        state['repo'] = file['repo']
-        state['pr_number'] = file['pr_number'] 
-
-        content_lines = file["content"].splitlines()
-        chunk_size = 500  # Adjust as needed to stay well below token limit
-        results = []
-
-        for i in range(0, len(content_lines), chunk_size):
-            chunk = content_lines[i:i+chunk_size]
-            chunk_text = "\n".join(chunk)
-            prompt = make_review_prompt(file["filename"], chunk_text)
-            logger.debug(f"Prompt sent to LLM (lines {i+1}-{i+len(chunk)}): {prompt[:200]}...")
-            response = llm.invoke([HumanMessage(content=prompt)]).content
-            try:
-                review = json.loads(response)
-            except Exception as e:
-                logger.error(f"Failed to parse LLM response as JSON for chunk {i//chunk_size+1}: {e}")
-                review = {"error": f"Failed to parse LLM response: {str(e)}", "raw_response": response}
-            results.append(review)
-
-        # Aggregate all chunk reviews into one result
-        aggregated_review = {
-            "filename": file["filename"],
-            "code_review": results
-        }
-
-        logger.info(f"Received LLM responses for all chunks of {file['filename']}")
-        return {**state, "current_result": aggregated_review}
-    except Exception as e:
-        logger.error(f"Error in analyze_file: {e}")
-        file = state.get("current_file", {})
-        return {**state, "current_result": {"filename": file.get("filename", "unknown"), "code_review": str(e)}}
+def partial_review(stream: JSONItemStream) -> Dict:
+    """Review built from the issues that streamed in before the reply broke off or went malformed."""
+    files = {}
+    for name, issue in stream.items:
+        files.setdefault(name, []).append(issue)
+    return {
+        "files": [{"name": name, "issues": issues} for name, issues in files.items()],
+        "summary": {"total_files": len(files), "total_issues": len(stream.items), "critical_issues": 0},
+        "partial": True,
+    }
+
+async def review_chunk(prompt: str, chunk_number: int, use_cache: bool = True, on_issue=None, model=None, tier: str = "review") -> Dict:
+    """
+    Send one prompt to the LLM, answering from the response cache when an identical
+    prompt was reviewed before. `use_cache=False` skips the lookup (forced
+    re-reviews) but still refreshes the cached reply.
+
+    The reply is read through a tolerant incremental parser: with LLM_STREAM on,
+    `on_issue(name, issue)` is called for each issue as soon as it is complete,
+    fenced or chatty replies are still understood, and a reply that breaks off
+    keeps the issues received so far.
 
+    `prompt` is the per-request part (see app.prompt); it is sent after the static
+    REVIEW_INSTRUCTIONS system message. `model` defaults to the review model; usage
+    is recorded under `tier`.
+    """
+    model = model or llm
+    cache = get_llm_cache()
+    key = cache.key(model.model_name, model.temperature, REVIEW_INSTRUCTIONS + prompt) if cache is not None else None
+    cached = cache.get(key) if cache is not None and use_cache else None
+    stream = JSONItemStream()
 
+    def emit(items):
+        if on_issue is not None:
+            for name, issue in items:
+                on_issue(name, issue)
+
+    if cached is not None:
+        logger.info(f"LLM cache hit for chunk {chunk_number}")
+        llm_usage.record(tier, cache_hits=1)
+        emit(stream.feed(cached))
+    else:
+        # Static instructions first and unchanged, so the provider can serve them from its prompt cache
+        messages = [SystemMessage(content=REVIEW_INSTRUCTIONS), HumanMessage(content=prompt)]
+        llm_usage.record(tier, requests=1)
+        model = loop_model(model)
+        async with llm_semaphore():
+            if LLM_STREAM:
+                async for piece in model.astream(messages):
+                    llm_usage.record_message(tier, piece)
+                    emit(stream.feed(piece.content))
+            else:
+                response = await model.ainvoke(messages)
+                llm_usage.record_message(tier, response)
+                emit(stream.feed(response.content))
+
+    parsed = stream.document()
+    if isinstance(parsed, dict):
+        if cache is not None and cached is None:
+            cache.set(key, stream.text)
+        return parsed
+    if stream.items:
+        logger.warning(f"Incomplete LLM response for chunk {chunk_number}; kept {len(stream.items)} streamed issue(s)")
+        return partial_review(stream)
+    logger.error(f"Failed to parse LLM response as JSON for chunk {chunk_number}: no complete JSON object")
+    return {"error": "Failed to parse LLM response: no complete JSON object", "raw_response": stream.text}
+
+def needs_escalation(screened: Dict) -> bool:
+    """Whether a screening review must be redone by the review model."""
+    if "error" in screened or screened.get("partial"):
+        return True
+    issues = sum(len(f.get("issues", [])) for f in screened.get("files", []) if isinstance(f, dict))
+    return issues >= CASCADE_ESCALATE_ISSUES
+
+async def review_request(request: ReviewRequest, number: int, use_cache: bool = True, on_issue=None) -> List[Dict]:
+    """
+    Send one planned request and split the reply back into one chunk per segment.
+    With LLM_CASCADE on, small requests go to the screening model first and are
+    only sent to the review model when it finds something or its reply is unusable.
+    """
+    def located(name, issue):
+        found = locate_issue(request, name, issue)
+        if found is not None:
+            on_issue(*found)
 
-def collect_result(state: Dict) -> Dict:
     try:
-        if "current_result" not in state:
-            logger.warning("'current_result' missing in state during collect_result. Appending error placeholder.")
-            file = state.get("current_file", {})
-            result_to_add = {"filename": file.get("filename", "unknown"), "code_review": "Error: current_result missing"}
-        else:
-            result_to_add = state["current_result"]
-        results = state["results"] + [result_to_add]
-        new_state = dict(state)
-        new_state["results"] = results
-        new_state.pop("current_result", None)
-        logger.info(f"Collected result for file: {result_to_add.get('filename')}")
-        return new_state
+        response = None
+        prompt = request.prompt()
+        if LLM_CASCADE and request.changed_lines() <= CASCADE_MAX_LINES:
+            screened = await review_chunk(prompt, number, use_cache, model=screen_llm, tier="screen")
+            if needs_escalation(screened):
+                logger.info(f"Escalating request {number} to {llm.model_name}")
+                llm_usage.record("screen", escalated=1)
+            else:
+                logger.info(f"Request {number} cleared by {screen_llm.model_name}")
+                llm_usage.record("screen", cleared=1)
+                response = screened
+                # Only a kept screening reply reaches the results, so its findings are streamed now, not while screening
+                if on_issue:
+                    for entry in screened.get("files", []):
+                        for issue in entry.get("issues", []) if isinstance(entry, dict) else []:
+                            located(entry.get("name"), issue)
+        if response is None:
+            response = await review_chunk(prompt, number, use_cache, located if on_issue else None)
     except Exception as e:
-        logger.error(f"Error in collect_result: {e}")
-        file = state.get("current_file", {})
-        return {**state, "error": str(e), "current_result": {"filename": file.get("filename", "unknown"), "code_review": str(e)}}
+        logger.error(f"LLM request {number} failed: {e}")
+        response = {"error": str(e)}
+    return assign_findings(request, response)
 
-def add_inline_comments(state: Dict) -> Dict:
+def add_inline_comments(state: Dict, publisher=None) -> Dict:
     try:
         owner = state.get("owner")
         repo = state.get("repo")
         pr_number = state.get("pr_number")
         results = state.get("results", [])
         logger.info(f"Preparing to add inline comments for PR {owner}/{repo}#{pr_number}")
-        # (Your inline comment logic here, add logger.info/error as needed)
-        return state
+        # Findings are only collected here; the publisher submits them for the whole PR at once
+        if publisher is not None:
+            publisher.collect(results)
+        return {k: v for k, v in state.items() if k != "mapped_results"}
     except Exception as e:
         logger.error(f"Error in add_inline_comments: {e}")
         return {**state, "error": str(e)}
 
-def increment_index(state: Dict) -> Dict:
+class FileProgress:
+    """Reports each file to `on_file` once every request carrying a part of it has been answered."""
+
+    def __init__(self, files, requests, on_file):
+        self.files = files
+        self.on_file = on_file
+        self.remaining = Counter(segment.position for request in requests for segment in request.segments)
+        self.issues = Counter()
+        self.failed = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, segments, chunks):
+        done = []
+        with self._lock:
+            for segment, chunk in zip(segments, chunks):
+                if not isinstance(chunk, dict) or "error" in chunk:
+                    self.failed.add(segment.position)
+                else:
+                    self.issues[segment.position] += sum(len(f.get("issues", [])) for f in chunk.get("files", []))
+                self.remaining[segment.position] -= 1
+                if self.remaining[segment.position] == 0:
+                    done.append(segment.position)
+        for position in done:
+            try:
+                self.on_file(self.files[position]["filename"], self.issues[position], position in self.failed)
+            except Exception as e:
+                logger.warning(f"File progress callback failed: {e}")
+
+async def analyze_one(state: Dict) -> Dict:
+    """
+    Map step: send one planned request (a part of a large file, or several small
+    files packed together) and tag every chunk with its file position and part
+    so the reduce step can rebuild per-file results in PR order.
+    """
+    request = state["request"]
+    chunks = await review_request(request, state["number"], state.get("use_cache", True), state.get("on_issue"))
+    if state.get("on_done") is not None:
+        state["on_done"](request.segments, chunks)
+    return {"mapped_results": [
+        (segment.position, segment.part, chunk) for segment, chunk in zip(request.segments, chunks)
+    ]}
+
+def analyze_one_sync(state: Dict) -> Dict:
+    # Lets graph.invoke drive the async node; LangGraph runs it off the caller's loop
+    async def run():
+        try:
+            return await analyze_one(state)
+        finally:
+            await close_loop_models()
+    return asyncio.run(run())
+
+def reduce_results(state: Dict) -> Dict:
     try:
-        state = dict(state)
-        state["index"] += 1
-        logger.debug(f"Incremented file index to {state['index']}")
-        if state["index"] < len(state["files"]):
-            state["current_file"] = state["files"][state["index"]]
-            logger.info(f"Set current_file to {state['current_file'].get('filename')}")
-        return state
+        files = state["files"]
+        chunks = {position: [] for position in range(len(files))}
+        for position, part, chunk in sorted(state.get("mapped_results", []), key=lambda item: item[:2]):
+            chunks[position].append(chunk)
+        results = [{"filename": file["filename"], "code_review": chunks[position]} for position, file in enumerate(files)]
+        logger.info(f"Reduced {len(results)} file result(s)")
+        return {"results": results, "index": len(files)}
     except Exception as e:
-        logger.error(f"Error in increment_index: {e}")
-        return {**state, "error": str(e)}
+        logger.error(f"Error in reduce_results: {e}")
+        return {"error": str(e)}
 
 def cleanup_state(state: Dict) -> Dict:
     try:
         new_state = dict(state)
         new_state.pop("current_result", None)
+        # Echoing the reducer key back would append the mapped results a second time
+        new_state.pop("mapped_results", None)
         logger.debug("Cleaned up 'current_result' from state.")
         return new_state
     except Exception as e:
@@ -121,7 +299,17 @@ def cleanup_state(state: Dict) -> Dict:
 
 ### GRAPH ###
 
-def build_graph(files: List[Dict]):
+def build_graph(files: List[Dict], review_publisher=None, max_concurrency=ANALYZE_CONCURRENCY, use_cache=True, on_issue=None,
+                on_file=None):
+    """
+    Map/reduce review graph: the files are planned into token-budgeted LLM
+    requests (large files split, small files packed), every request runs in its
+    own `analyze_file` branch (at most `max_concurrency` at once) and
+    `reduce_results` puts the findings back together per file, in file order.
+    `use_cache=False` bypasses the LLM response cache for forced re-reviews and
+    `on_issue(filename, issue)` receives findings as they stream in and
+    `on_file(filename, issues, failed)` every file once all of it is reviewed.
+    """
     logger.info(f"Building review graph for {len(files)} files.")
     builder = StateGraph(ReviewState)
 
@@ -130,28 +318,34 @@ def build_graph(files: List[Dict]):
         "index": 0,
         "current_file": files[0] if files else {},
         "results": [],
-        # if needed for context
-        # "owner": owner,
-        # "repo": repo,
-        # "pr_number": pr_number,
+        "mapped_results": [],
     }
 
-    builder.add_node("analyze_file", RunnableLambda(analyze_file))
-    builder.add_node("collect_result", RunnableLambda(collect_result))
-    # builder.add_node("add_inline_comments", RunnableLambda(add_inline_comments))  --> add if you want inline comments
-    builder.add_node("increment_index", RunnableLambda(increment_index))
+    builder.add_node("analyze_file", RunnableLambda(analyze_one_sync, afunc=analyze_one))
+    builder.add_node("reduce_results", RunnableLambda(reduce_results))
+    if review_publisher is not None:
+        builder.add_node("add_inline_comments", RunnableLambda(lambda state: add_inline_comments(state, review_publisher)))
     builder.add_node("cleanup_state", RunnableLambda(cleanup_state))
 
-    builder.set_entry_point("analyze_file")
-    builder.add_edge("analyze_file", "collect_result")
-    # builder.add_edge("collect_result", "add_inline_comments")  --> add if want in line comments
-    builder.add_edge("collect_result", "increment_index")
-
-    def should_continue(state: Dict):
-        return "analyze_file" if state["index"] < len(state["files"]) else "cleanup_state"
+    def fan_out(state: Dict):
+        requests = plan_requests(state["files"])
+        if not requests:
+            return "reduce_results"
+        on_done = FileProgress(state["files"], requests, on_file) if on_file is not None else None
+        return [
+            Send("analyze_file", {"request": request, "number": number, "use_cache": use_cache, "on_issue": on_issue,
+                                  "on_done": on_done})
+            for number, request in enumerate(requests, start=1)
+        ]
 
-    builder.add_conditional_edges("increment_index", should_continue)
+    builder.add_conditional_edges(START, fan_out, ["analyze_file", "reduce_results"])
+    builder.add_edge("analyze_file", "reduce_results")
+    if review_publisher is not None:
+        builder.add_edge("reduce_results", "add_inline_comments")
+        builder.add_edge("add_inline_comments", "cleanup_state")
+    else:
+        builder.add_edge("reduce_results", "cleanup_state")
     builder.set_finish_point("cleanup_state")
 
     logger.info("Graph build complete.")
-    return builder.compile(), initial_state
\ No newline at end of file
+    return builder.compile().with_config({"max_concurrency": max_concurrency}), initial_state
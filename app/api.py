@@ -1,32 +1,120 @@
-from fastapi import APIRouter
-from app.schemas import AnalyzePRRequest
+import uuid
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+from app.schemas import AnalyzePRRequest, BulkStatusRequest
 from app.tasks import analyze_pr_task
 from fastapi import HTTPException
 from app.worker import celery_app
+from app.dedup import REVIEW_DEDUP, claim_review, release_review, review_dedup_key
+from app.github import get_pr_context, parse_repo_url
+from app.result_store import aexpand_result
+from app.task_status import STATUS_BULK_MAX, fetch_task_metas, status_payload, task_ready
+from app.review_events import format_sse, get_event_bus, publish_event, review_event_stream
 from app.lib.logger import logger  # <-- Add this import
 
 router = APIRouter()
 
+def reusable_review(task_id):
+    """Whether an earlier review task can be handed out again: anything but a failed one."""
+    result = celery_app.AsyncResult(task_id)
+    if result.status in ("FAILURE", "REVOKED"):
+        return False
+    if result.status == "SUCCESS" and isinstance(result.result, dict) and result.result.get("status") == "failed":
+        return False
+    return True
+
+def dedup_key_for(request: AnalyzePRRequest):
+    """Dedup key for the PR's current head, or None when it cannot be resolved (the task reports why)."""
+    if not REVIEW_DEDUP:
+        return None
+    try:
+        owner, repo = parse_repo_url(request.repo_url)
+        ctx = get_pr_context(owner, repo, request.pr_number, request.github_token)
+    except Exception as e:
+        logger.warning(f"Could not resolve PR head for deduplication, enqueueing anyway: {e}")
+        return None
+    return review_dedup_key(owner, repo, request.pr_number, ctx.head_sha)
+
 @router.post("/analyze-pr")
 def analyze_pr(request: AnalyzePRRequest):
     logger.info(f"Received analyze-pr request: repo_url={request.repo_url}, pr_number={request.pr_number}")
-    task = analyze_pr_task.delay(request.repo_url, request.pr_number, request.github_token)
+    task_id = str(uuid.uuid4())
+    key = dedup_key_for(request)
+    if key is not None:
+        try:
+            existing = claim_review(key, task_id, force=request.force, reusable=reusable_review)
+        except Exception as e:
+            logger.warning(f"Review deduplication unavailable, enqueueing anyway: {e}")
+            existing, key = None, None
+        if existing is not None:
+            logger.info(f"Duplicate analyze-pr request for {key}; returning task {existing}")
+            return {"task_id": existing, "deduplicated": True}
+    # Marks the task id as known to /events before a worker picks it up
+    publish_event(task_id, "queued", {})
+    try:
+        task = analyze_pr_task.apply_async(
+            args=(request.repo_url, request.pr_number, request.github_token, request.force), task_id=task_id
+        )
+    except Exception as e:
+        if key is not None:
+            release_review(key, task_id)
+        publish_event(task_id, "failed", {"status": "failed", "error": f"Could not enqueue the review: {e}"})
+        raise
     logger.info(f"Dispatched analyze_pr_task with id: {task.id}")
-    return {"task_id": task.id}
+    return {"task_id": task.id, "deduplicated": False}
 
 @router.get("/status/{task_id}")
-def get_status(task_id: str):
+async def get_status(task_id: str):
     logger.info(f"Checking status for task_id: {task_id}")
-    result = celery_app.AsyncResult(task_id)
-    logger.info(f"Task {task_id} status: {result.status}")
-    return {"task_id": task_id, "status": result.status}
+    meta, = await fetch_task_metas([task_id])
+    status = status_payload(task_id, meta)
+    logger.info(f"Task {task_id} status: {status['status']}")
+    return status
+
+@router.post("/status")
+async def get_statuses(request: BulkStatusRequest):
+    """Status of many tasks at once, read from the result backend in one round trip."""
+    task_ids = list(dict.fromkeys(request.task_ids))
+    if len(task_ids) > STATUS_BULK_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {STATUS_BULK_MAX} task ids per request")
+    logger.info(f"Checking status for {len(task_ids)} task(s)")
+    metas = await fetch_task_metas(task_ids)
+    return {"statuses": [status_payload(task_id, meta) for task_id, meta in zip(task_ids, metas)]}
+
+def finished_review_stream(task_id, result):
+    """Outcome of a review whose events are gone (expired, or it predates them), as one event."""
+    data = result.result if isinstance(result.result, dict) else {"error": str(result.result)}
+    completed = result.status == "SUCCESS" and data.get("status") == "completed"
+    event = "completed" if completed else "failed"
+    yield format_sse(0, event, {"status": event, "error": data.get("error")})
+
+@router.get("/events/{task_id}")
+def stream_events(task_id: str, request: Request):
+    """
+    Progress of a review as Server-Sent Events on one connection: "queued",
+    "planned", a "file" event per reviewed file, then "completed" or "failed".
+    Reconnecting clients resume after their Last-Event-ID. Unknown task ids get a 404.
+    """
+    logger.info(f"Streaming events for task_id: {task_id}")
+    try:
+        after = max(int(request.headers.get("last-event-id") or 0), 0)
+    except ValueError:
+        after = 0
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if not get_event_bus().has_events(task_id):
+        result = celery_app.AsyncResult(task_id)
+        if result.ready():
+            return StreamingResponse(finished_review_stream(task_id, result), media_type="text/event-stream", headers=headers)
+        # Every review publishes "queued" when it is enqueued, so this id was never issued or its events expired
+        raise HTTPException(status_code=404, detail=f"Unknown review {task_id}")
+    return StreamingResponse(review_event_stream(task_id, after), media_type="text/event-stream", headers=headers)
 
 @router.get("/results/{task_id}")
-def get_results(task_id: str):
+async def get_results(task_id: str):
     logger.info(f"Fetching results for task_id: {task_id}")
-    result = celery_app.AsyncResult(task_id)
-    if result.ready():
+    meta, = await fetch_task_metas([task_id])
+    if task_ready(meta):
         logger.info(f"Task {task_id} completed. Returning result.")
-        return result.result
+        return await aexpand_result(meta["result"])
     logger.warning(f"Task {task_id} not yet complete.")
-    raise HTTPException(status_code=202, detail="Task not yet complete")
\ No newline at end of file
+    raise HTTPException(status_code=202, detail="Task not yet complete")
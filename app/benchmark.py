@@ -0,0 +1,503 @@
+"""
+End-to-end benchmark for analyze_pr_task against local stand-ins for the GitHub
+REST API and the OpenAI chat-completions endpoint.
+
+Both stand-ins are real HTTP servers on localhost, so the GitHub client pools,
+the OpenAI SDK (streaming included), the LangGraph fan-out and the Celery task
+all run unchanged. PRs are synthetic or replayed from a recorded fixture.
+
+    python -m app.benchmark --prs 20 --files 15 --llm-latency 0.5 --concurrency 4
+    python -m app.benchmark --record octocat/hello-world#42 --fixture prs.json   # needs GITHUB_TOKEN
+    python -m app.benchmark --fixture prs.json --repeat 5 --force
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import re
+import resource
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+from langchain_openai import ChatOpenAI
+import app.agent_langgraph as agent
+from app.github import fetch_file_content, fetch_pr_files, get_pr_context
+from app.lib.cache import make_cache
+from app.lib.github_client import GitHubClient, get_github_client, make_response_cache, run_with_client, set_github_client
+from app.lib.logger import logger
+from app.llm_usage import llm_usage
+from app.review_state import get_review_state_store, set_review_state_store
+from app.tasks import analyze_pr_task
+
+BENCHMARK_TOKEN = "benchmark-token"
+
+
+@dataclass
+class StandInConfig:
+    """Injected behaviour of a stand-in: mean latency in seconds (+-50% jitter) and error rate."""
+    latency: float = 0.0
+    error_rate: float = 0.0
+    seed: int = 0
+
+
+class StandIn:
+    """Base for the stand-ins: latency/error injection and per-route request counts."""
+
+    def __init__(self, config):
+        self.config = config
+        self.requests = {}
+        self._rng = random.Random(config.seed)
+        self._lock = threading.Lock()
+
+    def count(self, route):
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+
+    def delay(self, scale=1.0):
+        with self._lock:
+            jitter = self._rng.uniform(0.5, 1.5)
+        if self.config.latency > 0:
+            time.sleep(self.config.latency * scale * jitter)
+
+    def fails(self):
+        with self._lock:
+            return self._rng.random() < self.config.error_rate
+
+    def handle(self, method, path, query, headers, body):
+        """Return (status, headers, body); body is bytes or an iterator of bytes (streamed)."""
+        raise NotImplementedError
+
+
+class FakeGitHub(StandIn):
+    """
+    The GitHub REST endpoints used by app/github.py: PR metadata, paginated PR
+    files (with Link headers), contents (with ETags), compare, comments and reviews.
+    """
+
+    def __init__(self, prs, config=None):
+        super().__init__(config or StandInConfig())
+        self.base_url = ""
+        self.prs = {(pr["owner"], pr["repo"], pr["number"]): pr for pr in prs}
+
+    def handle(self, method, path, query, headers, body):
+        match = re.match(r"^/repos/([^/]+)/([^/]+)/(pulls|issues|contents|compare)(?:/(.*))?$", path)
+        if not match:
+            self.count("unknown")
+            return 404, {}, b'{"message": "Not Found"}'
+        owner, repo, kind, rest = match.groups()
+        rest = unquote(rest or "")
+        route = f"{method} {kind}"
+        if kind == "pulls" and rest.endswith("/files"):
+            route += "/files"
+        elif kind == "pulls" and rest.endswith(("/comments", "/reviews")):
+            route += "/" + rest.rsplit("/", 1)[1]
+        self.count(route)
+        self.delay()
+        if self.fails():
+            return 502, {}, b'{"message": "Server Error"}'
+
+        if kind == "contents":
+            return self._contents(owner, repo, rest, headers)
+        if kind == "compare":
+            return 404, {}, b'{"message": "Not Found"}'
+        number = int(rest.split("/", 1)[0]) if rest.split("/", 1)[0].isdigit() else None
+        pr = self.prs.get((owner, repo, number))
+        if pr is None:
+            return 404, {}, b'{"message": "Not Found"}'
+        if method == "POST":
+            status = 200 if rest.endswith("/reviews") else 201
+            return status, {}, json.dumps({"id": self._rng.randint(1, 10 ** 9)}).encode()
+        if kind == "pulls" and rest == str(number):
+            return 200, {}, json.dumps({
+                "number": number,
+                "title": pr.get("title", ""),
+                "head": {"sha": pr["head_sha"], "ref": "feature"},
+                "base": {"sha": pr.get("base_sha", "0" * 40), "ref": "main"},
+            }).encode()
+        if kind == "pulls" and rest.endswith("/files"):
+            return self._files(pr, path, query)
+        return 404, {}, b'{"message": "Not Found"}'
+
+    def _files(self, pr, path, query):
+        per_page = int(query.get("per_page", ["30"])[0])
+        page = int(query.get("page", ["1"])[0])
+        entries = [{k: v for k, v in f.items() if k != "content"} for f in pr["files"]]
+        last = max((len(entries) + per_page - 1) // per_page, 1)
+        headers = {}
+        if last > 1:
+            links = [f'<{self.base_url}{path}?per_page={per_page}&page={n}>; rel="{rel}"'
+                     for n, rel in ((page + 1, "next"), (last, "last")) if page < last]
+            headers["Link"] = ", ".join(links)
+        page_entries = entries[(page - 1) * per_page:page * per_page]
+        return 200, headers, json.dumps(page_entries).encode()
+
+    def _contents(self, owner, repo, file_path, headers):
+        for (pr_owner, pr_repo, _), pr in self.prs.items():
+            if (pr_owner, pr_repo) != (owner, repo):
+                continue
+            for f in pr["files"]:
+                if f["filename"] == file_path and f.get("content") is not None:
+                    etag = f'"{hashlib.sha1(f["content"].encode("utf-8")).hexdigest()}"'
+                    if headers.get("if-none-match") == etag:
+                        return 304, {"ETag": etag}, b""
+                    data = base64.b64encode(f["content"].encode("utf-8")).decode()
+                    return 200, {"ETag": etag}, json.dumps({"path": file_path, "encoding": "base64", "content": data}).encode()
+        return 404, {}, b'{"message": "Not Found"}'
+
+
+class FakeChat(StandIn):
+    """
+    OpenAI-compatible /chat/completions: answers with a valid review JSON holding
+    `issues_per_file` findings per "File:" section, streamed in pieces when asked.
+    Token usage is estimated, and a repeated system prompt is reported as cached
+    the way the provider's prompt cache would.
+    """
+
+    def __init__(self, config=None, issues_per_file=1, stream_pieces=20):
+        super().__init__(config or StandInConfig())
+        self.issues_per_file = issues_per_file
+        self.stream_pieces = stream_pieces
+        self._prefixes = set()
+
+    def handle(self, method, path, query, headers, body):
+        if method != "POST" or not path.endswith("/chat/completions"):
+            self.count("unknown")
+            return 404, {}, b'{"error": {"message": "Not Found"}}'
+        self.count("POST chat/completions")
+        request = json.loads(body or b"{}")
+        self.delay()
+        if self.fails():
+            return 500, {}, b'{"error": {"message": "stand-in failure", "type": "server_error"}}'
+
+        messages = request.get("messages", [])
+        text = "\n".join(m.get("content") or "" for m in messages if isinstance(m.get("content"), str))
+        reply = json.dumps(self.review(messages[-1].get("content", "") if messages else ""))
+        usage = self.usage(messages, text, reply)
+        model = request.get("model", "stand-in")
+        if not request.get("stream"):
+            return 200, {}, json.dumps({
+                "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": usage,
+            }).encode()
+        include_usage = (request.get("stream_options") or {}).get("include_usage")
+        return 200, {"Content-Type": "text/event-stream"}, self._stream(model, reply, usage if include_usage else None)
+
+    def review(self, prompt):
+        files = []
+        for section in re.split(r"^File: ", prompt, flags=re.M)[1:]:
+            name, _, code = section.partition("\n")
+            numbers = [int(n) for n in re.findall(r"^\s*(\d+) ", code, flags=re.M)]
+            issues = [{
+                "type": "readability",
+                "line": numbers[i % len(numbers)],
+                "description": "Stand-in finding.",
+                "suggestion": "Nothing to change; generated by the benchmark.",
+            } for i in range(self.issues_per_file if numbers else 0)]
+            files.append({"name": name.strip(), "issues": issues, "critical_issues": 0})
+        total = sum(len(f["issues"]) for f in files)
+        return {"files": files, "summary": {"total_files": len(files), "total_issues": total, "critical_issues": 0}}
+
+    def usage(self, messages, text, reply):
+        prompt_tokens = len(text) // 4 + 1
+        cached = 0
+        system = next((m.get("content") for m in messages if m.get("role") == "system"), None)
+        if system:
+            with self._lock:
+                seen = system in self._prefixes
+                self._prefixes.add(system)
+            # Providers only cache a shared prefix of at least 1024 tokens, in 128-token steps;
+            # the per-request suffix never matches, so only the system prompt counts
+            prefix_tokens = len(system) // 4
+            if seen and prefix_tokens >= 1024:
+                cached = prefix_tokens // 128 * 128
+        completion_tokens = len(reply) // 4 + 1
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached},
+        }
+
+    def _stream(self, model, reply, usage):
+        size = max(len(reply) // max(self.stream_pieces, 1), 1)
+
+        def event(payload):
+            return f"data: {json.dumps(payload)}\n\n".encode()
+
+        base = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+        yield event({**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]})
+        for i in range(0, len(reply), size):
+            self.delay(0.1 / max(self.stream_pieces, 1))
+            yield event({**base, "choices": [{"index": 0, "delta": {"content": reply[i:i + size]}, "finish_reason": None}]})
+        yield event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if usage is not None:
+            yield event({**base, "choices": [], "usage": usage})
+        yield b"data: [DONE]\n\n"
+
+
+class StandInServer:
+    """Serve a stand-in over HTTP/1.1 on localhost, one thread per connection."""
+
+    def __init__(self, stand_in, host="127.0.0.1", port=0):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _serve(self):
+                parsed = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                headers = {k.lower(): v for k, v in self.headers.items()}
+                status, extra, payload = stand_in.handle(self.command, parsed.path, parse_qs(parsed.query), headers, body)
+                self.send_response(status)
+                if "Content-Type" not in extra:
+                    self.send_header("Content-Type", "application/json")
+                for name, value in extra.items():
+                    self.send_header(name, value)
+                if isinstance(payload, bytes):
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for piece in payload:
+                    self.wfile.write(f"{len(piece):x}\r\n".encode() + piece + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+            do_GET = do_POST = _serve
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def synthetic_pr(number, files=10, lines=80, owner="bench", repo="service", seed=0):
+    """A PR modifying `files` Python files of `lines` lines, each with one changed hunk."""
+    rng = random.Random(seed * 100003 + number)
+    entries = []
+    for i in range(files):
+        new = []
+        for j in range(1, lines + 1):
+            if j % 12 == 1:
+                new.append(f"def handler_{number}_{i}_{j}(request, retries={rng.randint(1, 5)}):")
+            else:
+                new.append(f"    value_{j} = request.get('field_{rng.randint(0, 999)}') or {rng.randint(0, 10 ** 6)}")
+        changed = max(lines // 4, 1)
+        start = rng.randint(1, lines - changed + 1)
+        hunk = [f"@@ -{start},{changed} +{start},{changed} @@"]
+        hunk += [f"-    legacy_{k} = None" for k in range(changed)]
+        hunk += [f"+{line}" for line in new[start - 1:start - 1 + changed]]
+        content = "\n".join(new) + "\n"
+        entries.append({
+            "sha": hashlib.sha1(content.encode("utf-8")).hexdigest(),
+            "filename": f"src/pkg_{number}/module_{i}.py",
+            "status": "modified",
+            "additions": changed,
+            "deletions": changed,
+            "changes": 2 * changed,
+            "patch": "\n".join(hunk),
+            "content": content,
+        })
+    return {
+        "owner": owner,
+        "repo": repo,
+        "number": number,
+        "title": f"Synthetic PR {number}",
+        "head_sha": hashlib.sha1(f"head-{seed}-{number}".encode()).hexdigest(),
+        "base_sha": hashlib.sha1(f"base-{seed}-{number}".encode()).hexdigest(),
+        "files": entries,
+    }
+
+
+def record_pr(owner, repo, number, token):
+    """Fetch a real PR (metadata, file entries and head contents) into the fixture format."""
+    ctx = get_pr_context(owner, repo, number, token)
+
+    async def gather():
+        entries = await fetch_pr_files(ctx)
+        for entry in entries:
+            if entry.get("status") == "removed":
+                continue
+            try:
+                entry["content"] = await fetch_file_content(ctx, entry["filename"])
+            except Exception as e:
+                logger.warning(f"Recording {entry['filename']} without content: {e}")
+        return entries
+
+    return {
+        "owner": owner,
+        "repo": repo,
+        "number": number,
+        "title": ctx.title,
+        "head_sha": ctx.head_sha,
+        "base_sha": ctx.base_sha,
+        "files": run_with_client(gather()),
+    }
+
+
+def percentiles(values, points=(50, 90, 99)):
+    """Nearest-rank percentiles, e.g. {"p50": ..., "p90": ..., "p99": ...}."""
+    if not values:
+        return {}
+    ordered = sorted(values)
+    return {f"p{p}": round(ordered[min(max(-(-p * len(ordered) // 100) - 1, 0), len(ordered) - 1)], 4) for p in points}
+
+
+@contextmanager
+def stand_ins(github_url, chat_url):
+    """Point the GitHub client, both LLM tiers and the review state store at the stand-ins."""
+    saved = (get_github_client(), agent.llm, agent.screen_llm, get_review_state_store())
+
+    def chat_model(model):
+        return ChatOpenAI(model=model.model_name, temperature=model.temperature, stream_usage=True,
+                          base_url=f"{chat_url}/v1", api_key="benchmark")
+
+    set_github_client(GitHubClient(base_url=github_url, response_cache=make_response_cache()))
+    agent.llm, agent.screen_llm = chat_model(saved[1]), chat_model(saved[2])
+    set_review_state_store(make_cache(64 * 1024 * 1024))
+    try:
+        yield
+    finally:
+        get_github_client().close()
+        set_github_client(saved[0])
+        agent.llm, agent.screen_llm = saved[1], saved[2]
+        set_review_state_store(saved[3])
+
+
+def run_benchmark(prs, github_config=None, chat_config=None, concurrency=1, repeat=1, force=False,
+                  issues_per_file=1, trace_memory=False):
+    """
+    Review every PR `repeat` times through analyze_pr_task, `concurrency` at a
+    time, and return throughput, latency percentiles (end to end and per task
+    stage), peak memory, LLM usage and the requests each stand-in served.
+    """
+    github = FakeGitHub(prs, github_config)
+    chat = FakeChat(chat_config, issues_per_file=issues_per_file)
+    runs = [pr for _ in range(repeat) for pr in prs]
+    outcomes = []
+    if trace_memory:
+        tracemalloc.start()
+    with StandInServer(github) as github_server, StandInServer(chat) as chat_server:
+        github.base_url = github_server.url
+        with stand_ins(github_server.url, chat_server.url):
+            usage_before = llm_usage.snapshot()
+
+            def review(pr):
+                start = time.perf_counter()
+                repo_url = f"https://github.com/{pr['owner']}/{pr['repo']}"
+                result = analyze_pr_task.apply(args=(repo_url, pr["number"], BENCHMARK_TOKEN), kwargs={"force": force}).get()
+                return time.perf_counter() - start, result
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                outcomes = list(pool.map(review, runs))
+            wall = time.perf_counter() - started
+            usage = llm_usage.since(usage_before)
+
+    traced_peak = None
+    if trace_memory:
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    completed = [(seconds, result) for seconds, result in outcomes if result.get("status") == "completed"]
+    stages = {}
+    for _, result in completed:
+        for name, seconds in result.get("timings", {}).items():
+            stages.setdefault(name, []).append(seconds)
+    report = {
+        "prs": len(runs),
+        "completed": len(completed),
+        "failed": len(runs) - len(completed),
+        "errors": sorted({result.get("error", "") for _, result in outcomes if result.get("status") != "completed"}),
+        "concurrency": concurrency,
+        "wall_seconds": round(wall, 3),
+        "prs_per_minute": round(len(completed) / wall * 60, 2) if wall else 0.0,
+        "latency": {"total": percentiles([seconds for seconds, _ in completed])},
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "llm_usage": usage,
+        "requests": {"github": dict(github.requests), "chat": dict(chat.requests)},
+    }
+    report["latency"].update({name: percentiles(values) for name, values in stages.items()})
+    if traced_peak is not None:
+        report["peak_traced_mb"] = round(traced_peak / (1024 * 1024), 1)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fixture", help="JSON list of recorded PRs to replay (or the output of --record)")
+    parser.add_argument("--record", help="owner/repo#number to record into --fixture (uses GITHUB_TOKEN)")
+    parser.add_argument("--prs", type=int, default=10, help="synthetic PRs when no fixture is given")
+    parser.add_argument("--files", type=int, default=10, help="files per synthetic PR")
+    parser.add_argument("--lines", type=int, default=80, help="lines per synthetic file")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=1, help="PRs reviewed at once")
+    parser.add_argument("--force", action="store_true", help="bypass stored reviews and the LLM cache")
+    parser.add_argument("--github-latency", type=float, default=0.02)
+    parser.add_argument("--github-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--issues-per-file", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-memory", action="store_true", help="also report the tracemalloc peak (slower)")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="write the JSON report here as well")
+    args = parser.parse_args(argv)
+    logger.setLevel(args.log_level.upper())
+
+    if args.record:
+        if not args.fixture:
+            parser.error("--record needs --fixture to write to")
+        owner_repo, _, number = args.record.partition("#")
+        owner, repo = owner_repo.split("/", 1)
+        pr = record_pr(owner, repo, int(number), os.getenv("GITHUB_TOKEN"))
+        with open(args.fixture, "w") as f:
+            json.dump([pr], f)
+        print(f"Recorded {args.record} ({len(pr['files'])} files) to {args.fixture}")
+        return
+
+    if args.fixture:
+        with open(args.fixture) as f:
+            prs = json.load(f)
+    else:
+        prs = [synthetic_pr(n, args.files, args.lines, seed=args.seed) for n in range(1, args.prs + 1)]
+    report = run_benchmark(
+        prs,
+        github_config=StandInConfig(args.github_latency, args.github_error_rate, args.seed),
+        chat_config=StandInConfig(args.llm_latency, args.llm_error_rate, args.seed),
+        concurrency=args.concurrency,
+        repeat=args.repeat,
+        force=args.force,
+        issues_per_file=args.issues_per_file,
+        trace_memory=args.trace_memory,
+    )
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import os
+from dotenv import load_dotenv
+from app.lib.cache import make_cache
+from app.lib.logger import logger
+load_dotenv()
+
+BLOB_CACHE_MAX_BYTES = int(os.getenv("BLOB_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+BLOB_CACHE_BACKEND = os.getenv("BLOB_CACHE_BACKEND", "none")  # none | redis | disk
+BLOB_CACHE_REDIS_URL = os.getenv("BLOB_CACHE_REDIS_URL", os.getenv("REDIS_BROKER_URL"))
+BLOB_CACHE_DIR = os.getenv("BLOB_CACHE_DIR", "/tmp/code-review/blobs")
+BLOB_CACHE_DISK_MAX_BYTES = int(os.getenv("BLOB_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024)))
+BLOB_CACHE_TTL = int(os.getenv("BLOB_CACHE_TTL", str(7 * 24 * 3600)))
+
+_blob_cache = None
+
+
+def get_blob_cache():
+    global _blob_cache
+    if _blob_cache is None:
+        _blob_cache = make_cache(
+            BLOB_CACHE_MAX_BYTES,
+            backend=BLOB_CACHE_BACKEND,
+            redis_url=BLOB_CACHE_REDIS_URL,
+            redis_prefix="blob",
+            disk_dir=BLOB_CACHE_DIR,
+            disk_max_bytes=BLOB_CACHE_DISK_MAX_BYTES,
+            ttl=BLOB_CACHE_TTL,
+        )
+    return _blob_cache
+
+
+def set_blob_cache(cache):
+    global _blob_cache
+    _blob_cache = cache
+
+
+def get_blob(blob_sha):
+    """
+    Return the cached decoded content for a git blob sha, or None.
+    Blobs are immutable, so a hit never needs revalidating.
+    """
+    if not blob_sha:
+        return None
+    value = get_blob_cache().get(blob_sha)
+    if value is None:
+        return None
+    logger.info(f"Blob cache hit: {blob_sha}")
+    return value.decode("utf-8")
+
+
+def put_blob(blob_sha, content):
+    if not blob_sha:
+        return
+    get_blob_cache().set(blob_sha, content.encode("utf-8"))
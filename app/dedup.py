@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from app.lib.logger import logger
+load_dotenv()
+
+# Requests for a PR head that is already queued, running or reviewed get that task's id back
+REVIEW_DEDUP = os.getenv("REVIEW_DEDUP", "true").lower() in ("1", "true", "yes")
+# How long a head stays claimed; keep it within the result backend's expiry (Celery's default is a day)
+REVIEW_DEDUP_TTL = int(os.getenv("REVIEW_DEDUP_TTL", str(24 * 3600)))
+REVIEW_DEDUP_REDIS_URL = os.getenv("REVIEW_DEDUP_REDIS_URL", os.getenv("REDIS_BROKER_URL"))
+
+
+def review_dedup_key(owner, repo, pr_number, head_sha):
+    return f"review_dedup:{owner}/{repo}#{pr_number}@{head_sha}"
+
+
+class MemoryDedupStore:
+    """Per-process store, used when no Redis is configured."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key, task_id, ttl):
+        """Store `task_id` under `key` unless a live entry exists; returns that entry's task id or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                return entry[0]
+            self._entries[key] = (task_id, time.monotonic() + ttl)
+            return None
+
+    def replace(self, key, task_id, ttl):
+        with self._lock:
+            self._entries[key] = (task_id, time.monotonic() + ttl)
+
+    def release(self, key, task_id):
+        with self._lock:
+            if self._entries.get(key, (None,))[0] == task_id:
+                del self._entries[key]
+
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisDedupStore:
+    """Claims shared by every API process, set atomically with SET NX and expired by Redis."""
+
+    def __init__(self, url, client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self._release = client.register_script(RELEASE_SCRIPT)
+
+    def claim(self, key, task_id, ttl):
+        if self.client.set(key, task_id, nx=True, ex=ttl):
+            return None
+        existing = self.client.get(key)
+        if existing is None:
+            # Expired between the two calls
+            return self.claim(key, task_id, ttl)
+        return existing.decode("utf-8")
+
+    def replace(self, key, task_id, ttl):
+        self.client.set(key, task_id, ex=ttl)
+
+    def release(self, key, task_id):
+        self._release(keys=[key], args=[task_id])
+
+
+_dedup_store = None
+
+
+def get_dedup_store():
+    global _dedup_store
+    if _dedup_store is None:
+        _dedup_store = RedisDedupStore(REVIEW_DEDUP_REDIS_URL) if REVIEW_DEDUP_REDIS_URL else MemoryDedupStore()
+    return _dedup_store
+
+
+def set_dedup_store(store):
+    global _dedup_store
+    _dedup_store = store
+
+
+def claim_review(key, task_id, force=False, reusable=None):
+    """
+    Record `task_id` as the review of `key` (see review_dedup_key). Returns the id
+    of the task that already holds it, or None when the caller should enqueue
+    `task_id`. `force` always takes over, and so does a new task when
+    `reusable(existing_id)` says the earlier one cannot be reused (it failed).
+    """
+    store = get_dedup_store()
+    if force:
+        store.replace(key, task_id, REVIEW_DEDUP_TTL)
+        return None
+    existing = store.claim(key, task_id, REVIEW_DEDUP_TTL)
+    if existing is None:
+        return None
+    if reusable is not None and not reusable(existing):
+        logger.info(f"Earlier review {existing} of {key} cannot be reused; starting a new one")
+        store.replace(key, task_id, REVIEW_DEDUP_TTL)
+        return None
+    return existing
+
+
+def release_review(key, task_id):
+    """Drop the claim of `task_id`, e.g. when it could not be enqueued."""
+    get_dedup_store().release(key, task_id)
@@ -0,0 +1,119 @@
+import re
+from app.lib.logger import logger
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+def parse_patch(patch):
+    """
+    Parse a unified diff (the `patch` field of a PR file entry) into hunks.
+    Each hunk is a list of (kind, old_line, new_line, text) tuples where kind is
+    " ", "+" or "-"; old_line/new_line are None on the side the line is absent from.
+    """
+    hunks = []
+    current = None
+    old_no = new_no = 0
+    for raw in (patch or "").splitlines():
+        header = HUNK_HEADER.match(raw)
+        if header:
+            old_no = int(header.group(1))
+            new_no = int(header.group(3))
+            current = []
+            hunks.append(current)
+            continue
+        if current is None or raw.startswith("\\"):
+            # Preamble or "\ No newline at end of file"
+            continue
+        kind, text = (raw[0], raw[1:]) if raw else (" ", "")
+        if kind == "+":
+            current.append(("+", None, new_no, text))
+            new_no += 1
+        elif kind == "-":
+            current.append(("-", old_no, None, text))
+            old_no += 1
+        else:
+            current.append((" ", old_no, new_no, text))
+            old_no += 1
+            new_no += 1
+    return hunks
+
+
+def trim_context(hunk, context_lines):
+    """
+    Keep at most `context_lines` unchanged lines around each change, splitting
+    the hunk where two changes are further apart than that.
+    """
+    changed = [i for i, line in enumerate(hunk) if line[0] != " "]
+    if not changed:
+        return []
+    keep = set()
+    for i in changed:
+        keep.update(range(max(0, i - context_lines), min(len(hunk), i + context_lines + 1)))
+    trimmed = []
+    previous = None
+    for i in sorted(keep):
+        if previous is None or i != previous + 1:
+            trimmed.append([])
+        trimmed[-1].append(hunk[i])
+        previous = i
+    return trimmed
+
+
+def render_hunks(hunks):
+    """
+    Render hunks for the LLM with the new-file line number in the left column.
+    Removed lines carry no number since they cannot be commented on.
+    """
+    lines = []
+    for hunk in hunks:
+        new_numbers = [line[2] for line in hunk if line[2] is not None]
+        if new_numbers:
+            lines.append(f"@@ lines {new_numbers[0]}-{new_numbers[-1]} @@")
+        else:
+            lines.append("@@ removed lines @@")
+        for kind, _, new_no, text in hunk:
+            number = "" if new_no is None else str(new_no)
+            lines.append(f"{number:>6} {kind} {text}")
+    return "\n".join(lines)
+
+
+def build_diff_view(patch, context_lines=3):
+    hunks = []
+    for hunk in parse_patch(patch):
+        hunks.extend(trim_context(hunk, context_lines))
+    logger.debug(f"Built diff view with {len(hunks)} hunk(s)")
+    return render_hunks(hunks)
+
+
+def added_lines(patch):
+    """New-file line numbers added or modified by the patch."""
+    return {line[2] for hunk in parse_patch(patch) for line in hunk if line[0] == "+"}
+
+
+def commentable_lines(patch):
+    """New-file line numbers GitHub accepts review comments on (added and context lines in the diff)."""
+    return {line[2] for hunk in parse_patch(patch) for line in hunk if line[2] is not None}
+
+
+def map_line(patch, old_line):
+    """
+    Where an old-file line ends up in the new file after `patch`, or None when the
+    line was removed or rewritten by it. Lines outside every hunk shift by the
+    lines added and removed above them.
+    """
+    offset = 0
+    for hunk in parse_patch(patch):
+        old_numbers = [line[1] for line in hunk if line[1] is not None]
+        if not old_numbers:
+            # Insertion into an empty file: there were no old lines to shift
+            offset += len(hunk)
+            continue
+        if old_line < old_numbers[0]:
+            return old_line + offset
+        if old_line <= old_numbers[-1]:
+            for kind, old_no, new_no, _ in hunk:
+                if old_no == old_line:
+                    return new_no if kind == " " else None
+            return None
+        offset += sum(1 for line in hunk if line[0] == "+") - sum(1 for line in hunk if line[0] == "-")
+    return old_line + offset
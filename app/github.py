@@ -1,52 +1,178 @@
-import httpx
+import asyncio
 import base64
-from urllib.parse import urlparse
+import os
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, List
+from urllib.parse import urlparse, parse_qs
 from dotenv import load_dotenv
 from app.lib.logger import logger
+from app.lib.github_client import get_github_client
+from app.triage import decode_text
 load_dotenv()
 
+PR_FILES_PER_PAGE = 100
+PR_FILES_PREFETCH = int(os.getenv("PR_FILES_PREFETCH", "4"))
+# The compare API lists at most this many files; larger comparisons fall back to a full review
+COMPARE_MAX_FILES = 300
+
 def parse_repo_url(repo_url):
     parsed = urlparse(repo_url)
     parts = parsed.path.strip("/").split("/")
     logger.info(f"Parsed repo URL: owner={parts[0]}, repo={parts[1]}")
     return parts[0], parts[1]  # owner, repo
 
-async def fetch_pr_files(owner, repo, pr_number, GITHUB_TOKEN):
-    url = f"https://api.github.com/repos/{owner}/{repo}/pulls/{pr_number}/files"
-    logger.info(f"Fetching PR files: {owner}/{repo} PR#{pr_number}")
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url,headers={
-            "Authorization": f"Bearer {GITHUB_TOKEN}",
-            "Accept": "application/vnd.github.v3+json"
-        })
-        logger.info(f"GitHub API GET {url} status: {resp.status_code}")
+@dataclass
+class PRContext:
+    """
+    Pull request metadata resolved once per task and passed to every GitHub helper.
+    """
+    owner: str
+    repo: str
+    pr_number: int
+    token: str
+    head_sha: str
+    base_sha: str
+    head_ref: str = ""
+    base_ref: str = ""
+    title: str = ""
+    metadata: Dict[str, Any] = field(default_factory=dict, repr=False)
+    files: List[Dict[str, Any]] = field(default_factory=list, repr=False)
+
+    def to_payload(self):
+        """
+        JSON-serializable copy for task arguments: no raw PR metadata, and file
+        entries cut to the name and patch that publishing inline comments needs.
+        """
+        payload = {f.name: getattr(self, f.name) for f in fields(self) if f.name not in ("metadata", "files")}
+        payload["files"] = [{"filename": e["filename"], "patch": e.get("patch")} for e in self.files]
+        return payload
+
+    @classmethod
+    def from_payload(cls, payload):
+        return cls(**payload)
+
+def get_pr_context(owner, repo, pr_number, GITHUB_TOKEN):
+    """
+    Fetch the pull request once and wrap it in a PRContext.
+    """
+    url = f"/repos/{owner}/{repo}/pulls/{pr_number}"
+    logger.info(f"Fetching PR metadata for {owner}/{repo} PR#{pr_number}")
+    resp = get_github_client().request("GET", url, GITHUB_TOKEN)
+    resp.raise_for_status()
+    data = resp.json()
+    ctx = PRContext(
+        owner=owner,
+        repo=repo,
+        pr_number=pr_number,
+        token=GITHUB_TOKEN,
+        head_sha=data["head"]["sha"],
+        base_sha=data.get("base", {}).get("sha", ""),
+        head_ref=data["head"].get("ref", ""),
+        base_ref=data.get("base", {}).get("ref", ""),
+        title=data.get("title", ""),
+        metadata=data,
+    )
+    logger.info(f"PR #{pr_number} head={ctx.head_sha} base={ctx.base_sha}")
+    return ctx
+
+def _last_page(resp):
+    last = resp.links.get("last", {}).get("url")
+    if not last:
+        return None
+    page = parse_qs(urlparse(last).query).get("page")
+    return int(page[0]) if page else None
+
+async def iter_pr_files(ctx, per_page=PR_FILES_PER_PAGE, prefetch=PR_FILES_PREFETCH):
+    """
+    Yield the PR's file entries page by page as they arrive, recording them in `ctx.files`.
+    When GitHub reports the last page up front, the remaining pages are
+    prefetched concurrently (at most `prefetch` at a time) and yielded in order;
+    otherwise `next` links are followed one by one.
+    """
+    url = f"/repos/{ctx.owner}/{ctx.repo}/pulls/{ctx.pr_number}/files"
+    logger.info(f"Fetching PR files: {ctx.owner}/{ctx.repo} PR#{ctx.pr_number}")
+    ctx.files = []
+    client = get_github_client()
+    semaphore = asyncio.Semaphore(prefetch)
+
+    async def fetch_page(page):
+        async with semaphore:
+            resp = await client.arequest("GET", url, ctx.token, params={"per_page": per_page, "page": page})
         resp.raise_for_status()
-        return resp.json()
-
-async def fetch_file_content(owner, repo, file_path, head_sha, GITHUB_TOKEN):
-    url = f"https://api.github.com/repos/{owner}/{repo}/contents/{file_path}?ref={head_sha}"
-    logger.info(f"Fetching file content: {owner}/{repo}/{file_path}")
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url, headers={
-            "Authorization": f"Bearer {GITHUB_TOKEN}",
-            "Accept": "application/vnd.github.v3+json"
-        })
-        logger.info(f"GitHub API GET {url} status: {resp.status_code}")
+        return resp
+
+    resp = await fetch_page(1)
+    for entry in resp.json():
+        ctx.files.append(entry)
+        yield entry
+
+    last_page = _last_page(resp)
+    if last_page is not None:
+        pages = [asyncio.ensure_future(fetch_page(page)) for page in range(2, last_page + 1)]
+        try:
+            for page in pages:
+                for entry in (await page).json():
+                    ctx.files.append(entry)
+                    yield entry
+        finally:
+            for page in pages:
+                page.cancel()
+        return
+
+    next_url = resp.links.get("next", {}).get("url")
+    while next_url:
+        resp = await client.arequest("GET", next_url, ctx.token)
         resp.raise_for_status()
-        data = resp.json()
-        return base64.b64decode(data["content"]).decode("utf-8")
+        for entry in resp.json():
+            ctx.files.append(entry)
+            yield entry
+        next_url = resp.links.get("next", {}).get("url")
+
+async def fetch_pr_files(ctx):
+    return [entry async for entry in iter_pr_files(ctx)]
 
-def post_general_pr_comment(owner, repo, pr_number, body, GITHUB_TOKEN):
+async def compare_commits(ctx, base, head):
+    """
+    Files changed between two commits of the PR as {filename: patch}. Returns None
+    when the comparison is unavailable (the old head is gone after a force-push,
+    the list is truncated, or `head` is not a descendant of `base`) so callers
+    can fall back to a full review.
+    """
+    url = f"/repos/{ctx.owner}/{ctx.repo}/compare/{base}...{head}"
+    logger.info(f"Comparing {ctx.owner}/{ctx.repo} {base[:7]}...{head[:7]}")
+    resp = await get_github_client().arequest("GET", url, ctx.token)
+    if resp.status_code != 200:
+        logger.warning(f"Compare {base[:7]}...{head[:7]} unavailable (status {resp.status_code})")
+        return None
+    data = resp.json()
+    if data.get("status") not in ("ahead", "identical"):
+        # After a rebase the old head often still exists, but "diverged" files and
+        # patches are measured from the merge base, not from the old head
+        logger.warning(f"Compare {base[:7]}...{head[:7]} is {data.get('status')}, not a fast-forward")
+        return None
+    files = data.get("files", [])
+    if len(files) >= COMPARE_MAX_FILES:
+        logger.warning(f"Compare {base[:7]}...{head[:7]} lists {len(files)} files, too many to diff incrementally")
+        return None
+    return {f["filename"]: f.get("patch") for f in files}
+
+async def fetch_file_content(ctx, file_path, ref=None):
+    """Decoded content of `file_path` at `ref` (the PR head by default)."""
+    url = f"/repos/{ctx.owner}/{ctx.repo}/contents/{file_path}"
+    logger.info(f"Fetching file content: {ctx.owner}/{ctx.repo}/{file_path}")
+    resp = await get_github_client().arequest("GET", url, ctx.token, params={"ref": ref or ctx.head_sha})
+    resp.raise_for_status()
+    data = resp.json()
+    return decode_text(base64.b64decode(data["content"]))
+
+def post_general_pr_comment(ctx, body):
     '''
     Post a general (non-inline) comment on a pull request.
     '''
-    url = f"https://api.github.com/repos/{owner}/{repo}/issues/{pr_number}/comments"
-    logger.info(f"Posting general PR comment to {owner}/{repo} PR#{pr_number}")
+    url = f"/repos/{ctx.owner}/{ctx.repo}/issues/{ctx.pr_number}/comments"
+    logger.info(f"Posting general PR comment to {ctx.owner}/{ctx.repo} PR#{ctx.pr_number}")
     data = {"body": body}
-    response = httpx.post(url, headers={
-        "Authorization": f"Bearer {GITHUB_TOKEN}",
-        "Accept": "application/vnd.github+json"
-    }, json=data)
+    response = get_github_client().request("POST", url, ctx.token, accept="application/vnd.github+json", json=data)
     if response.status_code != 201:
         logger.error(f"❌ Failed to post comment: {response.status_code} {response.reason_phrase}")
         logger.error(f"🔎 Response: {response.text}")
@@ -56,26 +182,23 @@ def post_general_pr_comment(owner, repo, pr_number, body, GITHUB_TOKEN):
     response.raise_for_status()
     return response.json()
 
-def post_inline_comment(owner, repo, pr_number, filename, line: int, body, GITHUB_TOKEN):
+def post_inline_comment(ctx, filename, line: int, body, start_line=None):
     """
-    Post an inline comment to a pull request on a specific file and line.
+    Post an inline comment to a pull request on a specific file and line,
+    or on the lines `start_line` to `line` when a start line is given.
     """
-    url = f"https://api.github.com/repos/{owner}/{repo}/pulls/{pr_number}/comments"
-    logger.info(f"Posting inline comment to {owner}/{repo} PR#{pr_number} file {filename} line {line}")
-    headers = {
-        "Authorization": f"{GITHUB_TOKEN}",
-        "Accept": "application/vnd.github.v3+json",
-    }
+    url = f"/repos/{ctx.owner}/{ctx.repo}/pulls/{ctx.pr_number}/comments"
+    logger.info(f"Posting inline comment to {ctx.owner}/{ctx.repo} PR#{ctx.pr_number} file {filename} line {line}")
     data = {
         "body": body,
-        "commit_id": get_latest_commit_sha(owner, repo, pr_number, GITHUB_TOKEN),
+        "commit_id": ctx.head_sha,
         "path": filename,
         "side": "RIGHT",
-        "start_line":1,
-        "start_side":"RIGHT",
         "line": line
     }
-    response = httpx.post(url, headers=headers, json=data)
+    if start_line is not None and start_line < line:
+        data.update({"start_line": start_line, "start_side": "RIGHT"})
+    response = get_github_client().request("POST", url, ctx.token, json=data)
     if response.status_code != 201:
         logger.error(f"Failed to post inline comment: {response.status_code} {response.reason_phrase}")
         logger.error(f"Response content: {response.text}")
@@ -86,19 +209,33 @@ def post_inline_comment(owner, repo, pr_number, filename, line: int, body, GITHU
     response.raise_for_status()
     return response.json()
 
+def submit_review(ctx, comments, body="", event="COMMENT"):
+    """
+    Create one pull request review carrying many inline comments.
+    Each comment is a dict with "path", "line" and "body".
+    """
+    url = f"/repos/{ctx.owner}/{ctx.repo}/pulls/{ctx.pr_number}/reviews"
+    logger.info(f"Submitting review with {len(comments)} inline comment(s) to {ctx.owner}/{ctx.repo} PR#{ctx.pr_number}")
+    data = {
+        "commit_id": ctx.head_sha,
+        "body": body,
+        "event": event,
+        "comments": [{**comment, "side": "RIGHT"} for comment in comments],
+    }
+    response = get_github_client().request("POST", url, ctx.token, accept="application/vnd.github+json", json=data)
+    if response.status_code != 200:
+        logger.error(f"Failed to submit review: {response.status_code} {response.reason_phrase}")
+        logger.error(f"Response content: {response.text}")
+    else:
+        logger.info("Successfully submitted review.")
+    response.raise_for_status()
+    return response.json()
+
 def get_latest_commit_sha(owner, repo, pr_number, GITHUB_TOKEN):
     """
     Get the latest commit SHA for a pull request.
+    Prefer get_pr_context when other PR fields are needed too.
     """
-    url = f"https://api.github.com/repos/{owner}/{repo}/pulls/{pr_number}"
-    logger.info(f"Fetching latest commit SHA for {owner}/{repo} PR#{pr_number}")
-    headers = {
-        "Authorization": f"Bearer {GITHUB_TOKEN}",
-        "Accept": "application/vnd.github.v3+json",
-    }
-    resp = httpx.get(url, headers=headers)
-    logger.info(f"GitHub API GET {url} status: {resp.status_code}")
-    resp.raise_for_status()
-    sha = resp.json()["head"]["sha"]
+    sha = get_pr_context(owner, repo, pr_number, GITHUB_TOKEN).head_sha
     logger.info(f"Latest commit SHA: {sha}")
     return sha
\ No newline at end of file
@@ -0,0 +1,381 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from app.lib.logger import logger
+
+
+class LRUCache:
+    """
+    In-process LRU for bytes values, bounded by total size and entry count.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_items=None):
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._data[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes or (self.max_items and len(self._data) > self.max_items):
+                _, evicted = self._data.popitem(last=False)
+                self.size -= len(evicted)
+
+    def delete(self, key):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisCache:
+    """
+    Redis tier shared by all workers. Entries expire after `ttl` seconds; beyond
+    that, eviction is left to the server's maxmemory policy.
+    """
+
+    def __init__(self, url, prefix, ttl=7 * 24 * 3600, client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, key):
+        return f"{self.prefix}:{key}"
+
+    def get(self, key):
+        try:
+            value = self.client.get(self._key(key))
+        except Exception as e:
+            logger.warning(f"Redis cache get failed for {key}: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        try:
+            self.client.set(self._key(key), value, ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Redis cache set failed for {key}: {e}")
+
+    def delete(self, key):
+        try:
+            self.client.delete(self._key(key))
+        except Exception as e:
+            logger.warning(f"Redis cache delete failed for {key}: {e}")
+
+    def get_many(self, keys):
+        """Values of `keys` (None where missing) in one MGET."""
+        if not keys:
+            return []
+        try:
+            values = self.client.mget([self._key(key) for key in keys])
+        except Exception as e:
+            logger.warning(f"Redis cache get failed for {len(keys)} keys: {e}")
+            values = [None] * len(keys)
+        found = sum(value is not None for value in values)
+        self.hits += found
+        self.misses += len(keys) - found
+        return values
+
+    def set_many(self, items):
+        """Store every {key: value} of `items` with its expiry in one pipelined round trip."""
+        if not items:
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key, value in items.items():
+                pipe.set(self._key(key), value, ex=self.ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Redis cache set failed for {len(items)} keys: {e}")
+
+    def delete_many(self, keys):
+        if not keys:
+            return
+        try:
+            self.client.delete(*[self._key(key) for key in keys])
+        except Exception as e:
+            logger.warning(f"Redis cache delete failed for {len(keys)} keys: {e}")
+
+
+class DiskCache:
+    """
+    On-disk tier: one file per key, evicted least-recently-used first once the
+    directory grows past `max_bytes` or entries are older than `ttl`. A file's
+    mtime is its write time, which `ttl` counts from; its atime is its last use.
+    """
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024, ttl=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = None  # running estimate; rescanned when it crosses the budget
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, name[:2], name)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            written = os.stat(path).st_mtime
+            if self.ttl is not None and time.time() - written > self.ttl:
+                os.remove(path)
+                raise FileNotFoundError(path)
+            with open(path, "rb") as fh:
+                value = fh.read()
+            # Mark as recently used; the mtime keeps the write time so hot entries still expire
+            os.utime(path, (time.time(), written))
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "wb") as fh:
+                fh.write(value)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Disk cache set failed for {key}: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan()[1]
+            else:
+                self._size += len(value)
+            over_budget = self._size > self.max_bytes
+        if over_budget:
+            self._evict()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _scan(self):
+        entries = []
+        total = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_atime, stat.st_size, path))
+                total += stat.st_size
+        return entries, total
+
+    def _evict(self):
+        with self._lock:
+            entries, total = self._scan()
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+            self._size = total
+
+
+class SQLiteCache:
+    """
+    Single-file tier that survives restarts and is shared by the workers of one
+    host. Entries expire after `ttl`; least recently used entries are evicted once
+    the stored values grow past `max_bytes`. Errors are logged and treated as misses.
+    """
+
+    def __init__(self, path, max_bytes=1024 * 1024 * 1024, ttl=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = None  # running estimate; recomputed when it crosses the budget
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def get(self, key):
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                    self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    row = None
+                if row is not None:
+                    self._conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            logger.warning(f"SQLite cache get failed for {key}: {e}")
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return bytes(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, len(value), now, now),
+                )
+                if self._size is None:
+                    self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                else:
+                    self._size += len(value)
+                if self._size > self.max_bytes:
+                    self._evict(now)
+        except sqlite3.Error as e:
+            logger.warning(f"SQLite cache set failed for {key}: {e}")
+
+    def delete(self, key):
+        try:
+            with self._lock:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.warning(f"SQLite cache delete failed for {key}: {e}")
+
+    def _evict(self, now):
+        # Called with the lock held: drop expired entries, then the least recently used
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total > self.max_bytes:
+            evicted = []
+            for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY accessed"):
+                if total <= self.max_bytes:
+                    break
+                evicted.append((key,))
+                total -= size
+            self._conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        self._size = total
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+class TieredCache:
+    """
+    Looks keys up tier by tier (fastest first) and backfills the faster tiers on a hit.
+    """
+
+    def __init__(self, *tiers):
+        self.tiers = [tier for tier in tiers if tier is not None]
+
+    def get(self, key):
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for faster in self.tiers[:i]:
+                    faster.set(key, value)
+                return value
+        return None
+
+    def set(self, key, value):
+        for tier in self.tiers:
+            tier.set(key, value)
+
+    def delete(self, key):
+        for tier in self.tiers:
+            tier.delete(key)
+
+    def stats(self):
+        return {
+            type(tier).__name__: {"hits": tier.hits, "misses": tier.misses}
+            for tier in self.tiers
+        }
+
+
+def make_cache(memory_max_bytes, backend=None, redis_url=None, redis_prefix="cache", disk_dir=None,
+               disk_max_bytes=1024 * 1024 * 1024, ttl=None, sqlite_path=None):
+    """
+    Build an in-process LRU, optionally backed by a "redis", "disk" or "sqlite" tier.
+    """
+    second = None
+    if backend == "redis" and redis_url:
+        second = RedisCache(redis_url, redis_prefix, ttl=ttl)
+    elif backend == "disk" and disk_dir:
+        second = DiskCache(disk_dir, max_bytes=disk_max_bytes, ttl=ttl)
+    elif backend == "sqlite" and sqlite_path:
+        second = SQLiteCache(sqlite_path, max_bytes=disk_max_bytes, ttl=ttl)
+    elif backend not in (None, "", "none"):
+        logger.warning(f"Unknown or unconfigured cache backend '{backend}'. Using in-process cache only.")
+    return TieredCache(LRUCache(memory_max_bytes), second)
+
+
+def stats_since(before, after):
+    """Hits and misses counted between two `stats()` snapshots of a cache (the counters are per process)."""
+    hits = after["hits"] - before["hits"]
+    misses = after["misses"] - before["misses"]
+    return {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses) if hits + misses else 0.0}
+
+
+def merge_stats(stats):
+    """Sum `stats_since` reports, e.g. from the tasks of one review."""
+    stats = list(stats)
+    hits = sum(s.get("hits", 0) for s in stats)
+    misses = sum(s.get("misses", 0) for s in stats)
+    return {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses) if hits + misses else 0.0}
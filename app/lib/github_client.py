@@ -0,0 +1,303 @@
+import asyncio
+import hashlib
+import os
+import time
+import httpx
+import orjson
+from dotenv import load_dotenv
+from app.lib.cache import make_cache
+from app.lib.logger import logger
+from app.lib.rate_limit import make_rate_limiter
+load_dotenv()
+
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+GITHUB_HTTP2 = os.getenv("GITHUB_HTTP2", "false").lower() in ("1", "true", "yes")
+GITHUB_MAX_CONNECTIONS = int(os.getenv("GITHUB_MAX_CONNECTIONS", "20"))
+GITHUB_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GITHUB_MAX_KEEPALIVE_CONNECTIONS", "10"))
+GITHUB_KEEPALIVE_EXPIRY = float(os.getenv("GITHUB_KEEPALIVE_EXPIRY", "30"))
+GITHUB_TIMEOUT = float(os.getenv("GITHUB_TIMEOUT", "30"))
+# Conditional-request (ETag / Last-Modified) cache for GET responses; backend: none | redis | disk
+GITHUB_ETAG_CACHE = os.getenv("GITHUB_ETAG_CACHE", "true").lower() in ("1", "true", "yes")
+GITHUB_ETAG_CACHE_MAX_BYTES = int(os.getenv("GITHUB_ETAG_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+GITHUB_ETAG_CACHE_BACKEND = os.getenv("GITHUB_ETAG_CACHE_BACKEND", "none")
+GITHUB_ETAG_CACHE_REDIS_URL = os.getenv("GITHUB_ETAG_CACHE_REDIS_URL", os.getenv("REDIS_BROKER_URL"))
+GITHUB_ETAG_CACHE_DIR = os.getenv("GITHUB_ETAG_CACHE_DIR", "/tmp/code-review/etags")
+GITHUB_ETAG_CACHE_TTL = int(os.getenv("GITHUB_ETAG_CACHE_TTL", str(24 * 3600)))
+# Cross-worker rate-limit scheduling, shared through Redis when REDIS_BROKER_URL is set
+GITHUB_RATE_LIMIT = os.getenv("GITHUB_RATE_LIMIT", "true").lower() in ("1", "true", "yes")
+GITHUB_RATE_LIMIT_PACE_BELOW = int(os.getenv("GITHUB_RATE_LIMIT_PACE_BELOW", "500"))
+GITHUB_RATE_LIMIT_MAX_DELAY = float(os.getenv("GITHUB_RATE_LIMIT_MAX_DELAY", "900"))
+GITHUB_RATE_LIMIT_RETRIES = int(os.getenv("GITHUB_RATE_LIMIT_RETRIES", "3"))
+
+# Response headers kept with a cached body so a 304 can be replayed as the original 200
+CACHED_HEADERS = ("content-type", "link", "etag", "last-modified")
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class ResponseCache:
+    """
+    Stores GET response bodies with their validators and turns repeat reads into
+    conditional requests. GitHub does not count 304s against the rate limit.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, method, url, params, token, accept):
+        if method != "GET":
+            return None
+        full_url = str(httpx.URL(url, params=params))
+        token_hash = hashlib.sha256((token or "").encode("utf-8")).hexdigest()[:16]
+        return hashlib.sha256(f"{token_hash}|{accept}|{full_url}".encode("utf-8")).hexdigest()
+
+    def lookup(self, key, headers):
+        """Return the cached entry and add its validators to `headers`."""
+        if key is None:
+            return None
+        raw = self.store.get(key)
+        if raw is None:
+            return None
+        entry = orjson.loads(raw)
+        if entry["headers"].get("etag"):
+            headers["If-None-Match"] = entry["headers"]["etag"]
+        if entry["headers"].get("last-modified"):
+            headers["If-Modified-Since"] = entry["headers"]["last-modified"]
+        return entry
+
+    def resolve(self, key, entry, resp):
+        """Serve a 304 from the cached entry, or store a fresh cacheable 200."""
+        if key is None:
+            return resp
+        if resp.status_code == 304 and entry is not None:
+            self.hits += 1
+            return httpx.Response(
+                200,
+                headers={**entry["headers"], "x-from-cache": "1"},
+                content=entry["body"].encode("utf-8"),
+                request=resp.request,
+            )
+        self.misses += 1
+        if resp.status_code == 200 and (resp.headers.get("etag") or resp.headers.get("last-modified")):
+            headers = {name: resp.headers[name] for name in CACHED_HEADERS if name in resp.headers}
+            self.store.set(key, orjson.dumps({"headers": headers, "body": resp.text}))
+        return resp
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+
+def make_response_cache():
+    if not GITHUB_ETAG_CACHE:
+        return None
+    return ResponseCache(make_cache(
+        GITHUB_ETAG_CACHE_MAX_BYTES,
+        backend=GITHUB_ETAG_CACHE_BACKEND,
+        redis_url=GITHUB_ETAG_CACHE_REDIS_URL,
+        redis_prefix="etag",
+        disk_dir=GITHUB_ETAG_CACHE_DIR,
+        ttl=GITHUB_ETAG_CACHE_TTL,
+    ))
+
+
+class GitHubClient:
+    """
+    Pooled HTTP client for the GitHub REST API.
+
+    One instance lives per worker process. The sync pool is shared by every
+    caller; async callers get one pool per event loop, since httpx connections
+    cannot be reused across loops. GETs go through the optional response cache
+    as conditional requests, and every request is paced by the optional rate
+    limiter; rate-limited responses are retried after the advised delay.
+    """
+
+    def __init__(
+        self,
+        base_url=GITHUB_API_URL,
+        http2=GITHUB_HTTP2,
+        max_connections=GITHUB_MAX_CONNECTIONS,
+        max_keepalive_connections=GITHUB_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=GITHUB_KEEPALIVE_EXPIRY,
+        timeout=GITHUB_TIMEOUT,
+        transport=None,
+        response_cache=None,
+        rate_limiter=None,
+        max_retries=GITHUB_RATE_LIMIT_RETRIES,
+    ):
+        if http2 and not _http2_available():
+            logger.warning("GITHUB_HTTP2 is enabled but the 'h2' package is not installed. Falling back to HTTP/1.1.")
+            http2 = False
+        self.base_url = base_url.rstrip("/")
+        self.http2 = http2
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout)
+        self.transport = transport
+        self.response_cache = response_cache
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self._client = None
+        self._async_clients = {}
+
+    def headers(self, token, accept="application/vnd.github.v3+json"):
+        headers = {"Accept": accept}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        return headers
+
+    def url(self, path):
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _client_kwargs(self):
+        kwargs = {"limits": self.limits, "timeout": self.timeout, "http2": self.http2}
+        if self.transport is not None:
+            kwargs["transport"] = self.transport
+        return kwargs
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.Client(**self._client_kwargs())
+        return self._client
+
+    @property
+    def async_client(self):
+        loop = asyncio.get_running_loop()
+        # A pool can only be closed on its own loop (see run_with_client); drop the ones left behind
+        for stale in [l for l in self._async_clients if l.is_closed()]:
+            logger.warning("Dropping a GitHub HTTP pool whose event loop ended without aclose()")
+            self._async_clients.pop(stale)
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(**self._client_kwargs())
+            self._async_clients[loop] = client
+        return client
+
+    def _prepare(self, method, path, token, accept, kwargs):
+        url = self.url(path)
+        headers = {**self.headers(token, accept), **kwargs.pop("headers", {})}
+        key = entry = None
+        if self.response_cache is not None:
+            key = self.response_cache.key(method, url, kwargs.get("params"), token, accept)
+            entry = self.response_cache.lookup(key, headers)
+        return url, headers, key, entry
+
+    def _finish(self, method, url, resp, key, entry):
+        logger.info(f"GitHub API {method} {url} status: {resp.status_code}")
+        if self.response_cache is not None:
+            resp = self.response_cache.resolve(key, entry, resp)
+        return resp
+
+    def _should_retry(self, token, resp, attempt):
+        if self.rate_limiter is None:
+            return False
+        self.rate_limiter.update(token, resp)
+        return attempt < self.max_retries and self.rate_limiter.is_rate_limited(resp)
+
+    def request(self, method, path, token, accept="application/vnd.github.v3+json", **kwargs):
+        url, headers, key, entry = self._prepare(method, path, token, accept, kwargs)
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                delay = self.rate_limiter.delay(token)
+                if delay > 0:
+                    time.sleep(delay)
+            resp = self.client.request(method, url, headers=headers, **kwargs)
+            if not self._should_retry(token, resp, attempt):
+                break
+        return self._finish(method, url, resp, key, entry)
+
+    async def _off_loop(self, func, *args):
+        # The response cache's tiers may be Redis or disk round trips; keep them off the event loop
+        if self.response_cache is None:
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    async def arequest(self, method, path, token, accept="application/vnd.github.v3+json", **kwargs):
+        url, headers, key, entry = await self._off_loop(self._prepare, method, path, token, accept, kwargs)
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                # The limiter's store may be a Redis round trip; keep it off the event loop
+                delay = await asyncio.to_thread(self.rate_limiter.delay, token)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            resp = await self.async_client.request(method, url, headers=headers, **kwargs)
+            if self.rate_limiter is None or not await asyncio.to_thread(self._should_retry, token, resp, attempt):
+                break
+        return await self._off_loop(self._finish, method, url, resp, key, entry)
+
+    def cache_stats(self):
+        if self.response_cache is None:
+            return {"hits": 0, "misses": 0, "hit_rate": 0.0}
+        return self.response_cache.stats()
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+        self._async_clients.clear()
+
+    async def aclose(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.pop(loop, None)
+        if client is not None:
+            await client.aclose()
+
+
+_github_client = None
+
+
+def get_github_client():
+    global _github_client
+    if _github_client is None:
+        rate_limiter = None
+        if GITHUB_RATE_LIMIT:
+            rate_limiter = make_rate_limiter(
+                os.getenv("REDIS_BROKER_URL"),
+                pace_below=GITHUB_RATE_LIMIT_PACE_BELOW,
+                max_delay=GITHUB_RATE_LIMIT_MAX_DELAY,
+            )
+        _github_client = GitHubClient(response_cache=make_response_cache(), rate_limiter=rate_limiter)
+        logger.info(
+            f"Created GitHub client (http2={_github_client.http2}, "
+            f"max_connections={_github_client.limits.max_connections})"
+        )
+    return _github_client
+
+
+def set_github_client(client):
+    global _github_client
+    _github_client = client
+
+
+def run_with_client(coro):
+    """
+    asyncio.run() for work that uses the shared GitHub client: the pool it opens
+    for the new loop is closed before the loop ends instead of leaking its sockets.
+    """
+    async def run():
+        try:
+            return await coro
+        finally:
+            await get_github_client().aclose()
+    return asyncio.run(run())
+
+
+def close_github_client():
+    global _github_client
+    if _github_client is not None:
+        _github_client.close()
+        _github_client = None
@@ -0,0 +1,105 @@
+import json
+
+
+class JSONItemStream:
+    """
+    Incremental, tolerant scanner for a JSON object arriving in pieces (a
+    streamed LLM reply).
+
+    Every object inside an `item_key` array is emitted as soon as its closing
+    brace arrives, together with the `label_key` value of its nearest enclosing
+    object (for a review: each issue with its file name). Anything before the
+    first "{" (prose, a ```json fence) and after the top-level object closes is
+    ignored.
+    """
+
+    def __init__(self, item_key="issues", label_key="name"):
+        self.item_key = item_key
+        self.label_key = label_key
+        self.text = ""
+        self.items = []
+        self.start = None  # index of the top-level "{"
+        self.end = None  # index just past its closing "}"
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None
+        self._key = None  # key whose value is being read
+
+    def feed(self, text):
+        """Add the next piece of the reply; returns the (label, item) pairs completed by it."""
+        self.text += text or ""
+        completed = []
+        while self._pos < len(self.text) and self.end is None:
+            i = self._pos
+            c = self.text[i]
+            self._pos += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._end_string(i)
+                continue
+            if self.start is None:
+                if c == "{":
+                    self.start = i
+                    self._stack.append({"kind": c, "key": None, "start": i, "label": None})
+                continue
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == ":":
+                self._key = self._last_string
+            elif c == ",":
+                self._key = None
+            elif c in "{[":
+                self._stack.append({"kind": c, "key": self._key, "start": i, "label": None})
+                self._key = None
+            elif c in "}]" and self._stack:
+                entry = self._stack.pop()
+                self._key = None
+                if not self._stack:
+                    self.end = i + 1
+                elif c == "}" and self._stack[-1]["kind"] == "[" and self._stack[-1]["key"] == self.item_key:
+                    try:
+                        item = json.loads(self.text[entry["start"]:i + 1])
+                    except ValueError:
+                        continue
+                    if isinstance(item, dict):
+                        completed.append((self._label(), item))
+        self.items.extend(completed)
+        return completed
+
+    def _end_string(self, end):
+        raw = self.text[self._string_start:end + 1]
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            value = raw[1:-1]
+        top = self._stack[-1] if self._stack else None
+        if top is None or top["kind"] != "{":
+            return
+        if self._key is None:
+            self._last_string = value
+        elif self._key == self.label_key:
+            top["label"] = value
+
+    def _label(self):
+        for entry in reversed(self._stack):
+            if entry["label"] is not None:
+                return entry["label"]
+        return None
+
+    def document(self):
+        """The complete top-level object, or None if it never closed or does not parse."""
+        if self.end is None:
+            return None
+        try:
+            return json.loads(self.text[self.start:self.end])
+        except ValueError:
+            return None
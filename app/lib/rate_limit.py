@@ -0,0 +1,174 @@
+import hashlib
+import threading
+import time
+from app.lib.logger import logger
+
+# Pacing only kicks in once a token's remaining budget drops below this
+RATE_LIMIT_PACE_BELOW = 500
+# Never sleep longer than this for a single request; past it the request is sent anyway
+RATE_LIMIT_MAX_DELAY = 900.0
+
+
+def token_key(token):
+    return hashlib.sha256((token or "anonymous").encode("utf-8")).hexdigest()[:16]
+
+
+def _reserve(state, now, pace_below):
+    """
+    Shared pacing rule: wait out any Retry-After block (or the reset, once the
+    budget is spent), then spread the remaining budget evenly until the reset
+    time. Mutates `state`, returns the delay.
+    """
+    remaining = state.get("remaining")
+    reset = state.get("reset")
+    start = max(now, state.get("blocked_until") or 0)
+    if remaining == 0 and reset is not None and reset > start:
+        # Nothing can succeed before the window resets
+        start = reset
+    interval = 0.0
+    if remaining is not None:
+        if reset is not None and reset > start and remaining < pace_below:
+            interval = (reset - start) / max(remaining, 1)
+        # Count the request locally so other callers see it before GitHub answers
+        state["remaining"] = max(remaining - 1, 0)
+    slot = max(start, state.get("next_slot") or 0)
+    state["next_slot"] = slot + interval
+    return slot - now
+
+
+class MemoryRateLimitStore:
+    """Per-process store, used when no Redis is configured."""
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, key, now, pace_below):
+        with self._lock:
+            return _reserve(self._states.setdefault(key, {}), now, pace_below)
+
+    def update(self, key, fields):
+        with self._lock:
+            state = self._states.setdefault(key, {})
+            if "reset" in fields and state.get("reset") != fields["reset"]:
+                state["next_slot"] = 0  # a new window starts
+            state.update(fields)
+
+
+RESERVE_SCRIPT = """
+local s = redis.call('HMGET', KEYS[1], 'remaining', 'reset', 'blocked_until', 'next_slot')
+local now = tonumber(ARGV[1])
+local pace_below = tonumber(ARGV[2])
+local remaining = tonumber(s[1])
+local reset = tonumber(s[2])
+local start = math.max(now, tonumber(s[3]) or 0)
+if remaining == 0 and reset and reset > start then
+  start = reset
+end
+local interval = 0
+if remaining then
+  if reset and reset > start and remaining < pace_below then
+    interval = (reset - start) / math.max(remaining, 1)
+  end
+  redis.call('HSET', KEYS[1], 'remaining', math.max(remaining - 1, 0))
+end
+local slot = math.max(start, tonumber(s[4]) or 0)
+redis.call('HSET', KEYS[1], 'next_slot', tostring(slot + interval))
+redis.call('EXPIRE', KEYS[1], 7200)
+return tostring(slot - now)
+"""
+
+UPDATE_SCRIPT = """
+local reset = redis.call('HGET', KEYS[1], 'reset')
+for i = 1, #ARGV, 2 do
+  if ARGV[i] == 'reset' and ARGV[i + 1] ~= reset then
+    redis.call('HSET', KEYS[1], 'next_slot', '0')
+  end
+  redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], 7200)
+return 1
+"""
+
+
+class RedisRateLimitStore:
+    """
+    Store shared by every worker, so all of them draw on one budget per token.
+    Reservations run as a Lua script to stay atomic across workers.
+    """
+
+    def __init__(self, url, prefix="gh_rate", client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self._reserve = client.register_script(RESERVE_SCRIPT)
+        self._update = client.register_script(UPDATE_SCRIPT)
+
+    def reserve(self, key, now, pace_below):
+        return float(self._reserve(keys=[f"{self.prefix}:{key}"], args=[now, pace_below]))
+
+    def update(self, key, fields):
+        args = []
+        for name, value in fields.items():
+            args.extend([name, value])
+        self._update(keys=[f"{self.prefix}:{key}"], args=args)
+
+
+class RateLimiter:
+    """
+    Token-aware scheduler for GitHub requests. Callers ask for a delay before each
+    request and report every response back so the shared budget stays current.
+    """
+
+    def __init__(self, store, pace_below=RATE_LIMIT_PACE_BELOW, max_delay=RATE_LIMIT_MAX_DELAY):
+        self.store = store
+        self.pace_below = pace_below
+        self.max_delay = max_delay
+
+    def delay(self, token):
+        try:
+            delay = self.store.reserve(token_key(token), time.time(), self.pace_below)
+        except Exception as e:
+            logger.warning(f"Rate limit store unavailable, sending request unpaced: {e}")
+            return 0.0
+        if delay > 0:
+            logger.info(f"Delaying GitHub request by {min(delay, self.max_delay):.2f}s to respect the rate limit")
+        return min(max(delay, 0.0), self.max_delay)
+
+    def update(self, token, resp):
+        headers = resp.headers
+        fields = {}
+        if headers.get("x-ratelimit-remaining") is not None:
+            fields["remaining"] = int(headers["x-ratelimit-remaining"])
+        if headers.get("x-ratelimit-reset") is not None:
+            fields["reset"] = int(headers["x-ratelimit-reset"])
+        if self.is_rate_limited(resp):
+            retry_after = headers.get("retry-after")
+            if retry_after is not None:
+                fields["blocked_until"] = time.time() + float(retry_after)
+            elif "reset" in fields:
+                fields["blocked_until"] = fields["reset"]
+            else:
+                fields["blocked_until"] = time.time() + 60  # GitHub's advice for secondary limits
+            logger.warning(f"GitHub rate limit hit ({resp.status_code}); blocked until {fields['blocked_until']:.0f}")
+        if not fields:
+            return
+        try:
+            self.store.update(token_key(token), fields)
+        except Exception as e:
+            logger.warning(f"Rate limit store unavailable, could not record budget: {e}")
+
+    @staticmethod
+    def is_rate_limited(resp):
+        if resp.status_code == 429:
+            return True
+        if resp.status_code != 403:
+            return False
+        return resp.headers.get("retry-after") is not None or resp.headers.get("x-ratelimit-remaining") == "0"
+
+
+def make_rate_limiter(redis_url=None, pace_below=RATE_LIMIT_PACE_BELOW, max_delay=RATE_LIMIT_MAX_DELAY):
+    store = RedisRateLimitStore(redis_url) if redis_url else MemoryRateLimitStore()
+    return RateLimiter(store, pace_below=pace_below, max_delay=max_delay)
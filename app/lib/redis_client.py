@@ -0,0 +1,35 @@
+import os
+from dotenv import load_dotenv
+from app.lib.logger import logger
+load_dotenv()
+
+# Connections per Redis URL in the API's async pool; requests wait up to REDIS_POOL_TIMEOUT seconds for one
+REDIS_POOL_MAX_CONNECTIONS = int(os.getenv("REDIS_POOL_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+
+_async_clients = {}
+
+
+def get_async_redis(url):
+    """Async Redis client for `url`; every caller in the process shares its connection pool."""
+    client = _async_clients.get(url)
+    if client is None:
+        import redis.asyncio
+        pool = redis.asyncio.BlockingConnectionPool.from_url(
+            url, max_connections=REDIS_POOL_MAX_CONNECTIONS, timeout=REDIS_POOL_TIMEOUT
+        )
+        client = _async_clients[url] = redis.asyncio.Redis(connection_pool=pool)
+        logger.info(f"Created async Redis pool (max_connections={REDIS_POOL_MAX_CONNECTIONS})")
+    return client
+
+
+def set_async_redis(url, client):
+    if client is None:
+        _async_clients.pop(url, None)
+    else:
+        _async_clients[url] = client
+
+
+async def close_async_redis():
+    for url in list(_async_clients):
+        await _async_clients.pop(url).aclose(close_connection_pool=True)
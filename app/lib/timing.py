@@ -0,0 +1,20 @@
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """Wall-clock seconds spent in each named stage of a task; repeated stages add up."""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def as_dict(self):
+        return {name: round(seconds, 4) for name, seconds in self.stages.items()}
@@ -0,0 +1,87 @@
+import hashlib
+import os
+from dotenv import load_dotenv
+from app.lib.cache import make_cache
+from app.lib.logger import logger
+load_dotenv()
+
+LLM_CACHE = os.getenv("LLM_CACHE", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "none")  # none | redis | sqlite | disk
+LLM_CACHE_REDIS_URL = os.getenv("LLM_CACHE_REDIS_URL", os.getenv("REDIS_BROKER_URL"))
+LLM_CACHE_SQLITE_PATH = os.getenv("LLM_CACHE_SQLITE_PATH", "/tmp/code-review/llm-cache.sqlite3")
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "/tmp/code-review/llm")
+LLM_CACHE_STORE_MAX_BYTES = int(os.getenv("LLM_CACHE_STORE_MAX_BYTES", str(512 * 1024 * 1024)))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600)))
+
+
+class LLMResponseCache:
+    """
+    Raw LLM replies keyed by (model, temperature, prompt hash), so an identical
+    chunk (unchanged file, revert, vendored copy) is never paid for twice.
+    Only replies that parsed as JSON are stored.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, model, temperature, prompt):
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return f"{model}:{temperature}:{prompt_hash}"
+
+    def get(self, key):
+        value = self.store.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value.decode("utf-8")
+
+    def set(self, key, response):
+        self.store.set(key, response.encode("utf-8"))
+
+    def stats(self):
+        total = self.hits + self.misses
+        stats = {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+        if hasattr(self.store, "stats"):
+            stats["tiers"] = self.store.stats()
+        return stats
+
+
+_llm_cache = None
+
+
+def get_llm_cache():
+    """Process-wide LLM response cache, or None when LLM_CACHE is off."""
+    global _llm_cache
+    if _llm_cache is None and LLM_CACHE:
+        try:
+            store = make_cache(
+                LLM_CACHE_MAX_BYTES,
+                backend=LLM_CACHE_BACKEND,
+                redis_url=LLM_CACHE_REDIS_URL,
+                redis_prefix="llm",
+                disk_dir=LLM_CACHE_DIR,
+                disk_max_bytes=LLM_CACHE_STORE_MAX_BYTES,
+                ttl=LLM_CACHE_TTL,
+                sqlite_path=LLM_CACHE_SQLITE_PATH,
+            )
+        except Exception as e:
+            logger.warning(f"LLM cache backend '{LLM_CACHE_BACKEND}' unavailable, using in-process cache only: {e}")
+            store = make_cache(LLM_CACHE_MAX_BYTES)
+        _llm_cache = LLMResponseCache(store)
+    return _llm_cache
+
+
+def set_llm_cache(cache):
+    global _llm_cache
+    _llm_cache = cache
+
+
+def llm_cache_stats():
+    cache = get_llm_cache()
+    if cache is None:
+        return {"hits": 0, "misses": 0, "hit_rate": 0.0}
+    return cache.stats()
@@ -0,0 +1,71 @@
+import threading
+from app.lib.logger import logger
+
+
+class LLMUsage:
+    """
+    Per-tier LLM usage counters for this process: requests, cache hits and token
+    counts, plus how many requests the screening tier cleared or escalated.
+    Tasks take a snapshot before reviewing and report the difference.
+    """
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, tier, **counts):
+        with self._lock:
+            tier_counts = self._counts.setdefault(tier, {})
+            for name, value in counts.items():
+                tier_counts[name] = tier_counts.get(name, 0) + value
+
+    def record_message(self, tier, message):
+        """Add the token usage LangChain attaches to a reply (or the last streamed chunk)."""
+        usage = getattr(message, "usage_metadata", None)
+        if not isinstance(usage, dict):
+            return
+        details = usage.get("input_token_details") or {}
+        self.record(
+            tier,
+            input_tokens=usage.get("input_tokens", 0),
+            # Input tokens the provider served from its prompt cache
+            cached_input_tokens=details.get("cache_read", 0) or 0,
+            output_tokens=usage.get("output_tokens", 0),
+        )
+
+    def snapshot(self):
+        with self._lock:
+            return {tier: dict(counts) for tier, counts in self._counts.items()}
+
+    def since(self, before):
+        """Usage recorded after `before` (a snapshot)."""
+        delta = {}
+        for tier, counts in self.snapshot().items():
+            previous = before.get(tier, {})
+            changed = {name: value - previous.get(name, 0) for name, value in counts.items()}
+            changed = {name: value for name, value in changed.items() if value}
+            if changed:
+                delta[tier] = changed
+        return delta
+
+
+llm_usage = LLMUsage()
+
+
+def merge_usage(usages):
+    """Sum usage reports (as returned by `since`), e.g. from the subtasks of one review."""
+    merged = {}
+    for usage in usages:
+        for tier, counts in usage.items():
+            tier_counts = merged.setdefault(tier, {})
+            for name, value in counts.items():
+                tier_counts[name] = tier_counts.get(name, 0) + value
+    return merged
+
+
+def log_usage(usage):
+    for tier, counts in usage.items():
+        logger.info(f"LLM usage [{tier}]: {counts}")
+        if counts.get("input_tokens"):
+            share = counts.get("cached_input_tokens", 0) / counts["input_tokens"]
+            logger.info(f"LLM usage [{tier}]: {share:.0%} of input tokens served from the prompt cache")
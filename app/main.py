@@ -1,7 +1,17 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app import api, ui
+from app.lib.redis_client import close_async_redis
+from app.review_events import close_event_bus
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await close_event_bus()
+    await close_async_redis()
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(api.router)
-app.include_router(ui.router)
\ No newline at end of file
+app.include_router(ui.router)
@@ -0,0 +1,194 @@
+import asyncio
+import base64
+import fcntl
+import hashlib
+import os
+import shutil
+import subprocess
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from app.lib.logger import logger
+from app.triage import decode_text
+load_dotenv()
+
+# "api" reads file contents through the contents API, "mirror" from a local bare clone
+CONTENT_SOURCE = os.getenv("CONTENT_SOURCE", "api")
+GITHUB_GIT_URL = os.getenv("GITHUB_GIT_URL", "https://github.com")
+MIRROR_DIR = os.getenv("MIRROR_DIR", "/tmp/code-review/mirrors")
+MIRROR_DISK_BUDGET = int(os.getenv("MIRROR_DISK_BUDGET", str(10 * 1024 * 1024 * 1024)))
+
+
+class MirrorError(Exception):
+    pass
+
+
+class MirrorFileNotFound(MirrorError):
+    pass
+
+
+def _git_env(token):
+    env = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
+    if token:
+        # Passed through the environment so the token never lands in argv or the mirror's config
+        basic = base64.b64encode(f"x-access-token:{token}".encode("utf-8")).decode("ascii")
+        env.update({
+            "GIT_CONFIG_COUNT": "1",
+            "GIT_CONFIG_KEY_0": "http.extraHeader",
+            "GIT_CONFIG_VALUE_0": f"Authorization: Basic {basic}",
+        })
+    return env
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def split_diff(output):
+    """Split `git diff` output into {new_path: patch}, keeping only the hunks like the files API does."""
+    patches = {}
+    for section in output.split("\ndiff --git "):
+        lines = section.splitlines()
+        path = None
+        for i, line in enumerate(lines):
+            if line.startswith("+++ b/"):
+                path = line[len("+++ b/"):]
+            elif line.startswith("--- a/") and path is None:
+                path = line[len("--- a/"):]
+            elif line.startswith("@@"):
+                if path is not None:
+                    patches[path] = "\n".join(lines[i:])
+                break
+    return patches
+
+
+class RepoMirror:
+    """
+    Bare mirror of one repository, kept on the worker between tasks.
+
+    PR heads are fetched incrementally into it, and blobs and diffs are read
+    locally instead of one contents API call per file.
+    """
+
+    def __init__(self, remote_url, root=MIRROR_DIR, disk_budget=MIRROR_DISK_BUDGET):
+        self.remote_url = remote_url
+        self.root = root
+        self.disk_budget = disk_budget
+        name = hashlib.sha256(remote_url.encode("utf-8")).hexdigest()[:32]
+        self.path = os.path.join(root, f"{name}.git")
+
+    def _git(self, *args, token=None, check=True):
+        result = subprocess.run(
+            ["git", "--git-dir", self.path, *args],
+            env=_git_env(token), capture_output=True,
+        )
+        if check and result.returncode != 0:
+            raise MirrorError(f"git {args[0]} failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+        return result
+
+    @contextmanager
+    def _locked(self, operation=fcntl.LOCK_EX):
+        """Exclusive for fetches, shared for reads; eviction takes it exclusively, so never under a reader."""
+        os.makedirs(self.root, exist_ok=True)
+        with open(f"{self.path}.lock", "w") as lock:
+            fcntl.flock(lock, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def fetch_pull(self, pr_number, token=None):
+        """
+        Fetch the PR head (and GitHub's merge ref when present) into the mirror.
+        Returns True when the merge ref was fetched, so the PR base can be derived locally.
+        """
+        with self._locked():
+            if not os.path.isdir(self.path):
+                logger.info(f"Creating bare mirror for {self.remote_url} at {self.path}")
+                subprocess.run(["git", "init", "--bare", "-q", self.path], check=True, capture_output=True)
+            started = time.time()
+            self._git("fetch", "--no-tags", "--quiet", self.remote_url,
+                      f"+refs/pull/{pr_number}/head:refs/pull/{pr_number}/head", token=token)
+            merge = self._git("fetch", "--no-tags", "--quiet", self.remote_url,
+                              f"+refs/pull/{pr_number}/merge:refs/pull/{pr_number}/merge", token=token, check=False)
+            os.utime(self.path)  # mark as recently used for eviction
+            logger.info(f"Fetched PR #{pr_number} into mirror in {time.time() - started:.2f}s")
+        evict_mirrors(self.root, self.disk_budget, keep=self.path)
+        return merge.returncode == 0
+
+    def merge_base(self, pr_number):
+        """Base commit GitHub diffs the PR against, derived from the merge ref."""
+        with self._locked(fcntl.LOCK_SH):
+            result = self._git("merge-base", f"refs/pull/{pr_number}/merge^1", f"refs/pull/{pr_number}/head", check=False)
+        if result.returncode != 0:
+            return None
+        return result.stdout.decode("utf-8").strip()
+
+    def has_commit(self, sha):
+        with self._locked(fcntl.LOCK_SH):
+            return self._git("cat-file", "-e", f"{sha}^{{commit}}", check=False).returncode == 0
+
+    def diff(self, base_sha, head_sha, context_lines=3):
+        with self._locked(fcntl.LOCK_SH):
+            result = self._git("-c", "core.quotePath=false", "diff", f"-U{context_lines}", "--no-color",
+                               "--no-ext-diff", base_sha, head_sha)
+        return split_diff(result.stdout.decode("utf-8", "replace"))
+
+    async def read_file(self, head_sha, file_path):
+        os.makedirs(self.root, exist_ok=True)
+        with open(f"{self.path}.lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # A fetch holds the lock; wait for it without blocking the event loop
+                await asyncio.to_thread(fcntl.flock, lock, fcntl.LOCK_SH)
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    "git", "--git-dir", self.path, "cat-file", "blob", f"{head_sha}:{file_path}",
+                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                )
+                stdout, stderr = await proc.communicate()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        if proc.returncode != 0:
+            message = stderr.decode("utf-8", "replace").strip()
+            # git words a missing path and a missing commit alike; callers check has_commit first to tell them apart
+            error = MirrorFileNotFound if "does not exist in" in message else MirrorError
+            raise error(f"git cat-file failed for {file_path}: {message}")
+        return decode_text(stdout)
+
+
+def evict_mirrors(root, budget, keep=None):
+    """Remove least recently used mirrors until the mirror directory fits in `budget` bytes."""
+    if not os.path.isdir(root):
+        return
+    mirrors = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name.endswith(".git") and os.path.isdir(path):
+            mirrors.append((os.path.getmtime(path), _dir_size(path), path))
+    total = sum(size for _, size, _ in mirrors)
+    for _, size, path in sorted(mirrors):
+        if total <= budget:
+            break
+        if path == keep:
+            continue
+        with open(f"{path}.lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                continue  # being fetched or read by another worker
+            logger.info(f"Evicting mirror {path} ({size} bytes)")
+            shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def get_repo_mirror(owner, repo):
+    return RepoMirror(f"{GITHUB_GIT_URL}/{owner}/{repo}.git")
@@ -1,36 +1,122 @@
 
-def make_review_prompt(filename: str, code: str) -> str:
-    return f"""
+# Static instructions sent as the system message of every review request. Nothing
+# request-specific belongs here: keeping this prefix byte-identical across requests
+# lets the provider's prompt cache reuse it; the files go in the per-request suffix.
+# OpenAI only caches prompts whose shared prefix is at least 1024 tokens, so keep the
+# full schema, definitions and example here (prefix_tokens warns when it gets shorter).
+REVIEW_INSTRUCTIONS = """
 You are a senior software engineer reviewing a pull request.
 
 Your review should follow professional standards as outlined here:
 https://google.github.io/eng-practices/review/reviewer/standard.html
 
-Please analyze the following file and return your review as a JSON object in the following format:
+You are given one or more files of the pull request. Each file starts with a "File:" line.
+"Code:" sections hold whole files (or consecutive parts of a larger file); "Diff:" sections
+hold only the changed hunks, where a "+" marks an added line, "-" a removed line (no line
+number) and " " unchanged context. Every line is prefixed with its line number in the new
+version of the file; line numbers always refer to the whole file.
+
+Review every file and return your review as a JSON object in the following format:
 
-{{
+{
     "files": [
-        {{
-            "name": "{filename}",
+        {
+            "name": "<file name exactly as given after File:>",
             "issues": [
-                {{
+                {
                     "type": "bug" | "style" | "performance" | "best_practice" | "readability" | "future_risk",
                     "line": <line_number>,
                     "description": "<clear explanation of the issue or concern>",
                     "suggestion": "<concise, actionable recommendation>"
-                }},
+                },
                 ...
-            ]
-        }}
+            ],
+            "critical_issues": <number_of_critical_issues_in_this_file>
+        },
+        ...
     ],
-    "summary": {{
+    "summary": {
         "total_files": <number_of_files_reviewed>,
         "total_issues": <total_number_of_issues_found>,
         "critical_issues": <number_of_critical_issues>
-    }}
-}}
+    }
+}
+
+Issue types:
+- "bug": incorrect behaviour — logic errors, wrong conditions, off-by-one errors, unhandled
+  None/null values, resource leaks, race conditions, broken error handling, security holes
+  such as injection, unsafe deserialization or secrets committed to the code.
+- "performance": needless work — repeated I/O or queries inside loops, quadratic algorithms
+  over unbounded input, blocking calls on an event loop, missing batching or caching where
+  the surrounding code already relies on it, unbounded memory growth.
+- "style": departures from the language's or the file's own conventions — naming, formatting,
+  import order, dead code, commented-out code, inconsistent quoting or typing.
+- "best_practice": code that works today but ignores an established practice — swallowing
+  exceptions, mutable default arguments, hard-coded configuration, missing timeouts on
+  network calls, missing input validation at a trust boundary, tests that assert nothing.
+- "readability": code that is hard to follow — long functions doing several things, deep
+  nesting, unclear names, magic numbers, misleading comments or docstrings.
+- "future_risk": fragile logic that will break under foreseeable change — assumptions about
+  ordering, sizes or formats that are not enforced, duplicated logic that must be kept in
+  sync, scalability bottlenecks, behaviour that depends on undocumented external state.
+
+Critical issues:
+Count an issue as critical only if it would cause incorrect results, data loss, a crash,
+a security vulnerability or a severe performance regression in production. Style,
+readability and best-practice findings are never critical. "critical_issues" of a file is
+the number of its issues that are critical; the summary's "critical_issues" is the sum
+over all files, and "total_issues" the number of issues over all files.
+
+Line numbers:
+- Use the number printed at the start of the line the issue is on, never a position
+  counted from the start of the section.
+- Removed ("-") lines have no number in the new file; report an issue about a removal on
+  the nearest added or context line instead.
+- If an issue spans several lines, report the first line of the span.
+- Each issue must point at exactly one line; report the same problem on several lines
+  as separate issues only when each occurrence needs its own fix.
+
+Example. For this input:
+
+File: app/users.py
+Diff:
+@@ lines 10-14 @@
+    10   def find_user(users, name):
+    11 +     for i in range(len(users) + 1):
+    12 +         if users[i]["name"] == name:
+    13 +             return users[i]
+    14       return None
+
+a correct reply is:
+
+{
+    "files": [
+        {
+            "name": "app/users.py",
+            "issues": [
+                {
+                    "type": "bug",
+                    "line": 11,
+                    "description": "range(len(users) + 1) goes one past the end, so users[i] raises IndexError when no user matches.",
+                    "suggestion": "Iterate over the list directly: for user in users: if user[\"name\"] == name: return user"
+                }
+            ],
+            "critical_issues": 1
+        }
+    ],
+    "summary": {
+        "total_files": 1,
+        "total_issues": 1,
+        "critical_issues": 1
+    }
+}
+
+Files without issues are still listed, with an empty "issues" list and "critical_issues": 0.
 
 Guidelines:
+- Report each issue under the file it belongs to; never mix lines from different files.
+- "line" must be the line number shown at the start of the line.
+- In diffs, focus on the added ("+") lines; use context lines only to understand them.
 - Identify any potential **bugs or logic errors**.
 - Flag violations of **style, naming, or formatting conventions**.
 - Suggest improvements for **readability, maintainability**, and **performance**.
@@ -38,11 +124,33 @@ Guidelines:
 - Only flag real issues — do not invent problems or give vague advice.
 - Do not review the code as if you're rewriting it yourself — focus on improving what's already there.
 
-Now review the following file:
+Only output the JSON object, nothing else.
+"""
+
+def make_review_prompt(filename: str, code: str) -> str:
+    """Per-request part of a review of one file (or part of one), sent after REVIEW_INSTRUCTIONS."""
+    return make_batch_review_prompt([(filename, "full", code)])
+
+def make_diff_review_prompt(filename: str, diff: str) -> str:
+    """Per-request part of a review of one file's changed hunks, sent after REVIEW_INSTRUCTIONS."""
+    return make_batch_review_prompt([(filename, "diff", diff)])
+
+def render_batch_sections(sections) -> str:
+    parts = []
+    for filename, mode, text in sections:
+        label = "Diff" if mode == "diff" else "Code"
+        parts.append(f"File: {filename}\n{label}:\n{text}")
+    return "\n\n".join(parts)
+
+def make_batch_review_prompt(sections) -> str:
+    """
+    Per-request part of a review of several files, sent after REVIEW_INSTRUCTIONS.
+    `sections` is a list of (filename, mode, text) with mode "diff" or "full",
+    rendered as by `build_diff_view` / `number_lines`.
+    """
+    return f"""Now review the following files:
 
-File: {filename}
-Code:
-{code}
+{render_batch_sections(sections)}
 
 Only output the JSON object, nothing else.
-"""
\ No newline at end of file
+"""
@@ -0,0 +1,205 @@
+import os
+import orjson
+import ormsgpack
+import zstandard
+from dotenv import load_dotenv
+from kombu.serialization import register
+from app.lib.cache import RedisCache
+from app.lib.redis_client import get_async_redis
+from app.lib.logger import logger
+load_dotenv()
+
+# Serializer of task results and progress in the Celery backend: "msgpack-zstd" or "json"
+RESULT_SERIALIZER = os.getenv("RESULT_SERIALIZER", "msgpack-zstd")
+RESULT_ZSTD_LEVEL = int(os.getenv("RESULT_ZSTD_LEVEL", "3"))
+# Seconds task results, progress and per-file results are kept
+RESULT_EXPIRES = int(os.getenv("RESULT_EXPIRES", str(24 * 3600)))
+# Store each file's review under its own key; the task result keeps references
+RESULT_FILE_KEYS = os.getenv("RESULT_FILE_KEYS", "true").lower() in ("1", "true", "yes")
+RESULT_STORE_REDIS_URL = os.getenv("RESULT_STORE_REDIS_URL", os.getenv("REDIS_BROKER_URL"))
+
+_compressor = zstandard.ZstdCompressor(level=RESULT_ZSTD_LEVEL)
+_decompressor = zstandard.ZstdDecompressor()
+
+
+def pack(obj):
+    return _compressor.compress(ormsgpack.packb(obj, option=ormsgpack.OPT_NON_STR_KEYS))
+
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def unpack(data):
+    if isinstance(data, str) or not data.startswith(ZSTD_MAGIC):
+        # The backend decodes every result with the configured serializer, including json ones written before the switch
+        return orjson.loads(data)
+    # Frames written by ZstdCompressor.compress carry their size, so no max_output_size is needed
+    return ormsgpack.unpackb(_decompressor.decompress(data), option=ormsgpack.OPT_NON_STR_KEYS)
+
+
+register(
+    "msgpack-zstd", pack, unpack,
+    content_type="application/x-msgpack-zstd",
+    content_encoding="binary",
+)
+
+
+def celery_result_config():
+    """Result settings for the Celery app; json results written before the switch still decode (see unpack)."""
+    return {
+        "result_serializer": RESULT_SERIALIZER,
+        "result_accept_content": ["json", RESULT_SERIALIZER],
+        "result_expires": RESULT_EXPIRES,
+    }
+
+
+_result_store = None
+
+
+def get_result_store():
+    """Shared store of per-file results, or None without Redis (results then stay inline)."""
+    global _result_store
+    if _result_store is None and RESULT_FILE_KEYS and RESULT_STORE_REDIS_URL:
+        _result_store = RedisCache(RESULT_STORE_REDIS_URL, "review_result", ttl=RESULT_EXPIRES)
+    return _result_store
+
+
+def set_result_store(store):
+    global _result_store
+    _result_store = store
+
+
+def result_file_key(task_id, position, filename):
+    return f"{task_id}:{position}:{filename}"
+
+
+def _store_files(prefix, files):
+    """
+    Write each file result under its own key of the result store, in one round
+    trip where the store supports it; returns its references and the bytes
+    stored, or (None, 0) without a store.
+    """
+    store = get_result_store()
+    if store is None:
+        return None, 0
+    entries = {}
+    refs = []
+    for position, file_result in enumerate(files):
+        key = result_file_key(prefix, position, file_result.get("filename", "unknown"))
+        entries[key] = pack(file_result)
+        refs.append({"filename": file_result.get("filename", "unknown"), "result_key": key})
+    if hasattr(store, "set_many"):
+        store.set_many(entries)
+    else:
+        for key, value in entries.items():
+            store.set(key, value)
+    return refs, sum(len(value) for value in entries.values())
+
+
+def _load_files(refs):
+    store = get_result_store()
+    keys = [ref["result_key"] for ref in refs if "result_key" in ref]
+    if store is None:
+        found = {}
+    elif hasattr(store, "get_many"):
+        found = dict(zip(keys, store.get_many(keys)))
+    else:
+        found = {key: store.get(key) for key in keys}
+    return [found.get(ref.get("result_key")) for ref in refs]
+
+
+def _is_ref_list(files):
+    return isinstance(files, list) and any(isinstance(f, dict) and "result_key" in f for f in files)
+
+
+def compact_result(result):
+    """
+    Move every file's review of a completed task result into its own entry of the
+    result store, leaving {"filename", "result_key"} references in `raw_output`,
+    and record the bytes stored for the task under "stored_bytes".
+    """
+    raw_output = result.get("results", {}).get("raw_output")
+    stored_bytes = 0
+    if isinstance(raw_output, list):
+        refs, stored_bytes = _store_files(result["task_id"], raw_output)
+        if refs is not None:
+            result = {**result, "results": {**result["results"], "raw_output": refs}}
+    stored_bytes += len(pack(result))
+    logger.info(f"Stored {stored_bytes} bytes of results for task {result.get('task_id')}")
+    return {**result, "stored_bytes": stored_bytes}
+
+
+def compact_batch(task_id, output):
+    """
+    compact_result for the output of one review subtask: its file results go to
+    the result store, so only references pass through the result backend to the
+    chord callback, which reads them back with expand_batch.
+    """
+    if not isinstance(output.get("results"), list):
+        return output
+    refs, _ = _store_files(task_id, output["results"])
+    return output if refs is None else {**output, "results": refs}
+
+
+def expand_batch(output):
+    if not _is_ref_list(output.get("results")):
+        return output
+    refs = output["results"]
+    return {**output, "results": _expanded_files(refs, _load_files(refs))}
+
+
+def discard_batches(outputs):
+    """Drop the stored file results of review subtasks once the review has been saved under its own keys."""
+    store = get_result_store()
+    keys = [ref["result_key"] for output in outputs if _is_ref_list(output.get("results"))
+            for ref in output["results"] if "result_key" in ref]
+    if store is None or not keys:
+        return
+    if hasattr(store, "delete_many"):
+        store.delete_many(keys)
+    else:
+        for key in keys:
+            store.delete(key)
+
+
+def _file_refs(result):
+    if not isinstance(result, dict):
+        return None
+    raw_output = result.get("results", {}).get("raw_output")
+    return raw_output if _is_ref_list(raw_output) else None
+
+
+def _expanded_files(refs, values):
+    files = []
+    for ref, value in zip(refs, values):
+        if value is None:
+            logger.warning(f"Stored result {ref.get('result_key')} is missing or expired")
+            files.append({"filename": ref.get("filename"), "code_review": "Error: stored result expired"})
+        else:
+            files.append(unpack(value))
+    return files
+
+
+def _expanded(result, refs, values):
+    return {**result, "results": {**result["results"], "raw_output": _expanded_files(refs, values)}}
+
+
+def expand_result(result):
+    """Inverse of compact_result: replace file references with the stored reviews."""
+    refs = _file_refs(result)
+    if refs is None:
+        return result
+    return _expanded(result, refs, _load_files(refs))
+
+
+async def aexpand_result(result):
+    """expand_result for async handlers: every file is read in one MGET on the pooled async client."""
+    refs = _file_refs(result)
+    if refs is None:
+        return result
+    store = get_result_store()
+    if not isinstance(store, RedisCache):
+        return expand_result(result)
+    keys = [f"{store.prefix}:{ref.get('result_key')}" for ref in refs]
+    values = await get_async_redis(RESULT_STORE_REDIS_URL).mget(keys)
+    return _expanded(result, refs, [value if "result_key" in ref else None for ref, value in zip(refs, values)])
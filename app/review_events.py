@@ -0,0 +1,174 @@
+import asyncio
+import os
+import threading
+import orjson
+from dotenv import load_dotenv
+from app.lib.logger import logger
+load_dotenv()
+
+# Seconds the progress events of a review are kept for clients that connect late or reconnect
+REVIEW_EVENTS_TTL = int(os.getenv("REVIEW_EVENTS_TTL", "3600"))
+# Seconds between keep-alive comments on an idle event stream
+REVIEW_EVENTS_KEEPALIVE = float(os.getenv("REVIEW_EVENTS_KEEPALIVE", "15"))
+# Seconds a stream stays open without any new event (e.g. its worker died) before it is closed
+REVIEW_EVENTS_MAX_IDLE = float(os.getenv("REVIEW_EVENTS_MAX_IDLE", "1800"))
+REVIEW_EVENTS_REDIS_URL = os.getenv("REVIEW_EVENTS_REDIS_URL", os.getenv("REDIS_BROKER_URL"))
+
+# Events after which a review publishes nothing more
+TERMINAL_EVENTS = ("completed", "failed")
+
+
+def review_events_key(task_id):
+    return f"review_events:{task_id}"
+
+
+class MemoryEventBus:
+    """Per-process events, used when no Redis is configured (eager tasks, tests)."""
+
+    def __init__(self):
+        self._events = {}
+        self._changed = threading.Condition()
+
+    def publish(self, task_id, event, data):
+        with self._changed:
+            self._events.setdefault(task_id, []).append((event, data))
+            self._changed.notify_all()
+
+    def has_events(self, task_id):
+        with self._changed:
+            return bool(self._events.get(task_id))
+
+    def _wait(self, task_id, seen, timeout):
+        with self._changed:
+            return self._changed.wait_for(lambda: len(self._events.get(task_id, [])) > seen, timeout)
+
+    async def events(self, task_id, after=0):
+        """Yield (id, event, data) from event number `after` on, and None after every idle keep-alive period."""
+        seen = after
+        while True:
+            with self._changed:
+                new = self._events.get(task_id, [])[seen:]
+            for event, data in new:
+                seen += 1
+                yield seen, event, data
+            if not new and not await asyncio.to_thread(self._wait, task_id, seen, REVIEW_EVENTS_KEEPALIVE):
+                yield None
+
+
+class RedisEventBus:
+    """
+    Events of every worker in one Redis list per review, so clients can replay
+    them from any point; a pub/sub message on the same key wakes up the streams
+    following it, which then read the new entries from the list.
+    """
+
+    def __init__(self, url, client=None, async_client=None):
+        self.url = url
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self._async_client = async_client
+
+    @property
+    def async_client(self):
+        # Its own unbounded pool: every open stream holds a pub/sub connection for its
+        # whole lifetime, which must not starve the pool shared by /status and /results
+        if self._async_client is None:
+            import redis.asyncio
+            self._async_client = redis.asyncio.Redis.from_url(self.url)
+        return self._async_client
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose(close_connection_pool=True)
+            self._async_client = None
+
+    def publish(self, task_id, event, data):
+        key = review_events_key(task_id)
+        pipe = self.client.pipeline()
+        pipe.rpush(key, orjson.dumps([event, data]))
+        pipe.expire(key, REVIEW_EVENTS_TTL)
+        pipe.publish(key, b"")
+        pipe.execute()
+
+    def has_events(self, task_id):
+        return bool(self.client.exists(review_events_key(task_id)))
+
+    async def events(self, task_id, after=0):
+        key = review_events_key(task_id)
+        pubsub = self.async_client.pubsub()
+        # Subscribe before reading the list so nothing published in between is missed
+        await pubsub.subscribe(key)
+        try:
+            seen = after
+            while True:
+                for item in await self.async_client.lrange(key, seen, -1):
+                    seen += 1
+                    event, data = orjson.loads(item)
+                    yield seen, event, data
+                if await pubsub.get_message(ignore_subscribe_messages=True, timeout=REVIEW_EVENTS_KEEPALIVE) is None:
+                    yield None
+        finally:
+            await pubsub.unsubscribe(key)
+            await pubsub.aclose()
+
+
+_event_bus = None
+
+
+def get_event_bus():
+    global _event_bus
+    if _event_bus is None:
+        _event_bus = RedisEventBus(REVIEW_EVENTS_REDIS_URL) if REVIEW_EVENTS_REDIS_URL else MemoryEventBus()
+    return _event_bus
+
+
+def set_event_bus(bus):
+    global _event_bus
+    _event_bus = bus
+
+
+async def close_event_bus():
+    if isinstance(_event_bus, RedisEventBus):
+        await _event_bus.aclose()
+
+
+def publish_event(task_id, event, data):
+    """Publish a progress event of review `task_id`; never fails the review."""
+    if task_id is None:
+        return
+    try:
+        get_event_bus().publish(task_id, event, data)
+    except Exception as e:
+        logger.warning(f"Could not publish {event} event for review {task_id}: {e}")
+
+
+def format_sse(event_id, event, data):
+    return f"id: {event_id}\nevent: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
+
+
+async def review_event_stream(task_id, after=0):
+    """
+    Server-Sent Events of review `task_id` from event number `after` on, ending
+    with its outcome, or once no event came for REVIEW_EVENTS_MAX_IDLE seconds.
+    """
+    events = get_event_bus().events(task_id, after)
+    idle = 0.0
+    try:
+        async for item in events:
+            if item is None:
+                idle += REVIEW_EVENTS_KEEPALIVE
+                if idle >= REVIEW_EVENTS_MAX_IDLE:
+                    logger.warning(f"No events for review {task_id} in {idle:.0f}s; closing its stream")
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            idle = 0.0
+            event_id, event, data = item
+            yield format_sse(event_id, event, data)
+            if event in TERMINAL_EVENTS:
+                return
+    finally:
+        # Release the bus subscription now rather than whenever the generator is collected
+        await events.aclose()
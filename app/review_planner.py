@@ -0,0 +1,291 @@
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+from app.prompt import REVIEW_INSTRUCTIONS, make_review_prompt, make_diff_review_prompt, make_batch_review_prompt, render_batch_sections
+from app.lib.logger import logger
+load_dotenv()
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4")
+# Model context window, and the part of it kept free for the JSON reply
+LLM_CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", "8192"))
+LLM_OUTPUT_TOKENS = int(os.getenv("LLM_OUTPUT_TOKENS", "2048"))
+# Small files packed into one request; 1 disables packing
+PACK_MAX_FILES = int(os.getenv("PACK_MAX_FILES", "20"))
+# Shortest prompt prefix OpenAI's prompt cache reuses
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", "1024"))
+
+# Rough tokens-per-character ratio used when the tiktoken encoding cannot be loaded
+FALLBACK_CHARS_PER_TOKEN = 4
+
+_encodings = {}
+_prefix_tokens = {}
+
+
+def get_encoding(model=LLM_MODEL):
+    """
+    tiktoken encoding for `model`, or None when it cannot be loaded (tiktoken
+    downloads encodings on first use). Failures are remembered so the download
+    is not retried for every count.
+    """
+    if model not in _encodings:
+        try:
+            import tiktoken
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"tiktoken encoding for {model} unavailable, estimating token counts: {e}")
+            _encodings[model] = None
+    return _encodings[model]
+
+
+def count_tokens(text, model=LLM_MODEL):
+    encoding = get_encoding(model)
+    if encoding is None:
+        return len(text) // FALLBACK_CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, max_tokens, model=LLM_MODEL):
+    encoding = get_encoding(model)
+    if encoding is None:
+        return text[:max_tokens * FALLBACK_CHARS_PER_TOKEN]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def number_lines(content, start=1):
+    """Prefix every line with its line number, the same way the diff view does."""
+    return [f"{number:>6}   {text}" for number, text in enumerate(content.splitlines(), start=start)]
+
+
+def prefix_tokens(model=LLM_MODEL):
+    """Tokens in the static REVIEW_INSTRUCTIONS prefix, counted once per process and model."""
+    if model not in _prefix_tokens:
+        _prefix_tokens[model] = count_tokens(REVIEW_INSTRUCTIONS, model)
+        logger.info(f"Static review prompt prefix is {_prefix_tokens[model]} tokens for {model}")
+        if _prefix_tokens[model] < PROMPT_CACHE_MIN_TOKENS:
+            logger.warning(
+                f"Static review prompt prefix is below the {PROMPT_CACHE_MIN_TOKENS} tokens the prompt cache "
+                f"needs; no request will be served from it"
+            )
+    return _prefix_tokens[model]
+
+
+def request_budget(model=LLM_MODEL):
+    """Tokens left for file content in one request once the prompt and the reply are accounted for."""
+    overhead = prefix_tokens(model) + max(
+        count_tokens(make_review_prompt("", ""), model),
+        count_tokens(make_diff_review_prompt("", ""), model),
+        count_tokens(make_batch_review_prompt([]), model),
+    )
+    return max(LLM_CONTEXT_TOKENS - LLM_OUTPUT_TOKENS - overhead, 256)
+
+
+@dataclass
+class Segment:
+    """A consecutive run of lines from one file, sized to fit one request."""
+    position: int
+    filename: str
+    mode: str
+    text: str
+    tokens: int
+    part: int = 0
+    # First and last file line in the segment (full mode only; diff lines carry their own numbers)
+    first_line: Optional[int] = None
+    last_line: Optional[int] = None
+
+    def changed_lines(self):
+        """Lines under review: added or removed lines of a diff view, every line of full content."""
+        lines = self.text.splitlines()
+        if self.mode == "diff":
+            return sum(1 for line in lines if line[7:8] in ("+", "-"))
+        return len(lines)
+
+
+@dataclass
+class ReviewRequest:
+    segments: List[Segment] = field(default_factory=list)
+    tokens: int = 0
+
+    def filenames(self):
+        return {segment.filename for segment in self.segments}
+
+    def changed_lines(self):
+        return sum(segment.changed_lines() for segment in self.segments)
+
+    def prompt(self):
+        if len(self.segments) == 1:
+            segment = self.segments[0]
+            prompt_fn = make_diff_review_prompt if segment.mode == "diff" else make_review_prompt
+            return prompt_fn(segment.filename, segment.text)
+        return make_batch_review_prompt([(s.filename, s.mode, s.text) for s in self.segments])
+
+
+def split_file(position, file, budget, model=LLM_MODEL):
+    """
+    Split one file into segments of at most `budget` tokens, cutting only at line
+    boundaries. A single line longer than the budget is truncated.
+    """
+    mode = file.get("mode", "full")
+    filename = file["filename"]
+    if mode == "diff":
+        lines = file["content"].splitlines()
+        numbers = [None] * len(lines)
+    else:
+        lines = number_lines(file["content"])
+        numbers = list(range(1, len(lines) + 1))
+    header_tokens = count_tokens(render_batch_sections([(filename, mode, "")]), model)
+    line_budget = max(budget - header_tokens, 1)
+
+    segments = []
+    current, current_numbers, tokens = [], [], 0
+
+    def flush():
+        if not current:
+            return
+        segments.append(Segment(
+            position=position,
+            filename=filename,
+            mode=mode,
+            text="\n".join(current),
+            tokens=tokens + header_tokens,
+            part=len(segments),
+            first_line=current_numbers[0],
+            last_line=current_numbers[-1],
+        ))
+
+    # Whole file in one go when it fits, which is the common case
+    whole_tokens = count_tokens("\n".join(lines), model) if lines else 0
+    if lines and whole_tokens <= line_budget:
+        current, current_numbers, tokens = lines, numbers, whole_tokens
+        flush()
+        return segments
+
+    for line, number in zip(lines, numbers):
+        line_tokens = count_tokens(line + "\n", model)
+        if line_tokens > line_budget:
+            logger.warning(f"Truncating an overlong line in {filename} to {line_budget} tokens")
+            line = truncate_tokens(line, line_budget, model)
+            line_tokens = line_budget
+        if current and tokens + line_tokens > line_budget:
+            flush()
+            current, current_numbers, tokens = [], [], 0
+        current.append(line)
+        current_numbers.append(number)
+        tokens += line_tokens
+    flush()
+    return segments
+
+
+def pack_segments(segments, budget, max_files=PACK_MAX_FILES):
+    """
+    First-fit-decreasing packing of segments into requests of at most `budget`
+    tokens and `max_files` segments. Two parts of the same file never share a
+    request, so findings can be told apart by filename.
+    """
+    requests = []
+    for segment in sorted(segments, key=lambda s: s.tokens, reverse=True):
+        for request in requests:
+            if (
+                request.tokens + segment.tokens <= budget
+                and len(request.segments) < max_files
+                and segment.filename not in request.filenames()
+            ):
+                break
+        else:
+            request = ReviewRequest()
+            requests.append(request)
+        request.segments.append(segment)
+        request.tokens += segment.tokens
+    # Keep PR order inside and across requests so prompts read naturally
+    for request in requests:
+        request.segments.sort(key=lambda s: (s.position, s.part))
+    requests.sort(key=lambda r: (r.segments[0].position, r.segments[0].part))
+    return requests
+
+
+def plan_requests(files, budget=None, max_files=None, model=LLM_MODEL):
+    """
+    Plan the LLM requests for a batch of files: large files are split by token
+    budget, small files (and the tails of large ones) are packed together.
+    """
+    if budget is None:
+        budget = request_budget(model)
+    if max_files is None:
+        max_files = PACK_MAX_FILES
+    segments = []
+    for position, file in enumerate(files):
+        segments.extend(split_file(position, file, budget, model))
+    requests = pack_segments(segments, budget, max_files)
+    logger.info(f"Planned {len(requests)} LLM request(s) for {len(files)} file(s), {len(segments)} segment(s)")
+    return requests
+
+
+def _match_segment(name, segments):
+    for segment in segments:
+        if segment.filename == name:
+            return segment
+    if isinstance(name, str) and name:
+        for segment in segments:
+            if segment.filename.endswith("/" + name) or name.endswith("/" + segment.filename):
+                return segment
+    if len(segments) == 1:
+        return segments[0]
+    return None
+
+
+def _map_line(segment, issue):
+    """Shift chunk-relative line numbers back to file line numbers (full mode only)."""
+    line = issue.get("line")
+    if segment.first_line is None or not isinstance(line, int):
+        return issue
+    if segment.first_line <= line <= segment.last_line:
+        return issue
+    if 1 <= line <= segment.last_line - segment.first_line + 1:
+        return {**issue, "line": line + segment.first_line - 1}
+    return issue
+
+
+def locate_issue(request, name, issue):
+    """(filename, issue with file line numbers) for one streamed finding, or None if the file is unknown."""
+    segment = _match_segment(name, request.segments)
+    if segment is None:
+        return None
+    return segment.filename, _map_line(segment, issue)
+
+
+def assign_findings(request, response) -> List[Dict[str, Any]]:
+    """
+    Split one LLM response back into per-segment review chunks, in the same
+    {"files": [...], "summary": {...}} shape a single-file review returns.
+    Returns one chunk per segment, in `request.segments` order.
+    """
+    if not isinstance(response, dict) or "error" in response:
+        return [response for _ in request.segments]
+
+    issues = {id(segment): [] for segment in request.segments}
+    critical = {id(segment): 0 for segment in request.segments}
+    for entry in response.get("files", []) or []:
+        if not isinstance(entry, dict):
+            continue
+        segment = _match_segment(entry.get("name"), request.segments)
+        if segment is None:
+            logger.warning(f"LLM returned findings for unknown file {entry.get('name')!r}; dropping them")
+            continue
+        issues[id(segment)].extend(
+            _map_line(segment, issue) for issue in entry.get("issues", []) if isinstance(issue, dict)
+        )
+        if isinstance(entry.get("critical_issues"), int):
+            critical[id(segment)] += entry["critical_issues"]
+
+    chunks = []
+    for segment in request.segments:
+        found = issues[id(segment)]
+        if len(request.segments) == 1:
+            summary = response.get("summary", {})
+        else:
+            summary = {"total_files": 1, "total_issues": len(found), "critical_issues": critical[id(segment)]}
+        chunks.append({"files": [{"name": segment.filename, "issues": found}], "summary": summary})
+    return chunks
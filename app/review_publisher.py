@@ -0,0 +1,102 @@
+import json
+import os
+from dotenv import load_dotenv
+from app.diff import commentable_lines
+from app.github import submit_review
+from app.lib.logger import logger
+load_dotenv()
+
+# GitHub rejects oversized review payloads and comment bodies; batches are split to stay under both
+GITHUB_REVIEW_MAX_COMMENTS = int(os.getenv("GITHUB_REVIEW_MAX_COMMENTS", "100"))
+GITHUB_REVIEW_MAX_BYTES = int(os.getenv("GITHUB_REVIEW_MAX_BYTES", str(512 * 1024)))
+GITHUB_COMMENT_MAX_CHARS = 65536
+
+
+def format_issue(issue):
+    issue_type = issue.get("type", "info").capitalize()
+    description = issue.get("description", "No description")
+    suggestion = issue.get("suggestion", "No suggestion")
+    return f"**[{issue_type}]** {description}\n\n💡 _Suggestion_: {suggestion}"[:GITHUB_COMMENT_MAX_CHARS]
+
+
+class InlineReviewPublisher:
+    """
+    Collects inline findings for a whole PR and publishes them as pull request
+    reviews, one review per batch, splitting only when payload limits require it.
+
+    Findings on lines outside the diff cannot be attached inline; they are kept in
+    `skipped` and listed in the review body instead.
+    """
+
+    def __init__(self, ctx, max_comments=GITHUB_REVIEW_MAX_COMMENTS, max_bytes=GITHUB_REVIEW_MAX_BYTES):
+        self.ctx = ctx
+        self.max_comments = max_comments
+        self.max_bytes = max_bytes
+        self.comments = []
+        self.skipped = []
+        self._commentable = None
+
+    def commentable(self, filename):
+        if self._commentable is None:
+            self._commentable = {
+                f["filename"]: commentable_lines(f.get("patch"))
+                for f in self.ctx.files
+            }
+        return self._commentable.get(filename, set())
+
+    def collect(self, results):
+        for review in results:
+            filename = review.get("filename")
+            chunks = review.get("code_review")
+            if not isinstance(chunks, list):
+                continue
+            for chunk in chunks:
+                if not isinstance(chunk, dict):
+                    continue
+                for file in chunk.get("files", []):
+                    for issue in file.get("issues", []):
+                        self._add(filename, issue)
+        logger.info(f"Collected {len(self.comments)} inline comment(s), {len(self.skipped)} outside the diff")
+
+    def _add(self, filename, issue):
+        line = issue.get("line")
+        if not isinstance(line, int) or line not in self.commentable(filename):
+            self.skipped.append({"path": filename, "line": line, "body": format_issue(issue)})
+            return
+        self.comments.append({"path": filename, "line": line, "body": format_issue(issue)})
+
+    def batches(self):
+        batch, size = [], 0
+        for comment in self.comments:
+            comment_size = len(json.dumps(comment).encode("utf-8"))
+            if batch and (len(batch) >= self.max_comments or size + comment_size > self.max_bytes):
+                yield batch
+                batch, size = [], 0
+            batch.append(comment)
+            size += comment_size
+        if batch:
+            yield batch
+
+    def review_body(self, part, parts):
+        lines = [f"🧪 Inline code review ({len(self.comments)} comment(s))"]
+        if parts > 1:
+            lines[0] += f" - part {part}/{parts}"
+        if part == 1 and self.skipped:
+            lines.append("")
+            lines.append("Findings outside the changed lines:")
+            for comment in self.skipped:
+                first_line = comment["body"].splitlines()[0]
+                lines.append(f"- `{comment['path']}` line {comment['line']}: {first_line}")
+        return "\n".join(lines)[:GITHUB_COMMENT_MAX_CHARS]
+
+    def publish(self):
+        batches = list(self.batches())
+        if not batches and not self.skipped:
+            logger.info("No inline findings to publish.")
+            return []
+        if not batches:
+            batches = [[]]
+        responses = []
+        for part, batch in enumerate(batches, start=1):
+            responses.append(submit_review(self.ctx, batch, body=self.review_body(part, len(batches))))
+        return responses
@@ -0,0 +1,123 @@
+import os
+import orjson
+from dotenv import load_dotenv
+from app.diff import map_line
+from app.lib.cache import make_cache
+from app.lib.logger import logger
+load_dotenv()
+
+# Last reviewed head and per-file results per PR, so new pushes are reviewed incrementally
+INCREMENTAL_REVIEW = os.getenv("INCREMENTAL_REVIEW", "true").lower() in ("1", "true", "yes")
+REVIEW_STATE_MAX_BYTES = int(os.getenv("REVIEW_STATE_MAX_BYTES", str(16 * 1024 * 1024)))
+REVIEW_STATE_BACKEND = os.getenv("REVIEW_STATE_BACKEND", "redis")  # none | redis | sqlite | disk
+REVIEW_STATE_REDIS_URL = os.getenv("REVIEW_STATE_REDIS_URL", os.getenv("REDIS_BROKER_URL"))
+REVIEW_STATE_SQLITE_PATH = os.getenv("REVIEW_STATE_SQLITE_PATH", "/tmp/code-review/review-state.sqlite3")
+REVIEW_STATE_DIR = os.getenv("REVIEW_STATE_DIR", "/tmp/code-review/review-state")
+REVIEW_STATE_TTL = int(os.getenv("REVIEW_STATE_TTL", str(30 * 24 * 3600)))
+
+_review_state_store = None
+
+
+def get_review_state_store():
+    global _review_state_store
+    if _review_state_store is None:
+        _review_state_store = make_cache(
+            REVIEW_STATE_MAX_BYTES,
+            backend=REVIEW_STATE_BACKEND,
+            redis_url=REVIEW_STATE_REDIS_URL,
+            redis_prefix="review_state",
+            disk_dir=REVIEW_STATE_DIR,
+            ttl=REVIEW_STATE_TTL,
+            sqlite_path=REVIEW_STATE_SQLITE_PATH,
+        )
+    return _review_state_store
+
+
+def set_review_state_store(store):
+    global _review_state_store
+    _review_state_store = store
+
+
+def review_state_key(owner, repo, pr_number):
+    return f"{owner}/{repo}#{pr_number}"
+
+
+def load_review_state(ctx):
+    """
+    The state saved by the last completed review of this PR:
+    {"head_sha": ..., "results": {filename: file_result}, "skipped": [...]}, or None.
+    """
+    if not INCREMENTAL_REVIEW:
+        return None
+    raw = get_review_state_store().get(review_state_key(ctx.owner, ctx.repo, ctx.pr_number))
+    if raw is None:
+        return None
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError as e:
+        logger.warning(f"Discarding unreadable review state for PR #{ctx.pr_number}: {e}")
+        return None
+
+
+def save_review_state(ctx, results, skipped=()):
+    if not INCREMENTAL_REVIEW:
+        return
+    state = {"head_sha": ctx.head_sha, "results": {r["filename"]: r for r in results}, "skipped": list(skipped)}
+    get_review_state_store().set(review_state_key(ctx.owner, ctx.repo, ctx.pr_number), orjson.dumps(state))
+    logger.info(f"Saved review state for PR #{ctx.pr_number} at {ctx.head_sha}")
+
+
+def carry_over(result, patch):
+    """
+    Move a file's stored findings through `patch` (old head -> new head). Findings
+    on lines the patch rewrote are dropped; they are reviewed again.
+    """
+    chunks = result.get("code_review")
+    if not isinstance(chunks, list):
+        return []
+    carried = []
+    for chunk in chunks:
+        if not isinstance(chunk, dict) or "error" in chunk:
+            continue
+        files = []
+        kept = 0
+        for file in chunk.get("files", []):
+            issues = []
+            for issue in file.get("issues", []):
+                line = issue.get("line")
+                new_line = map_line(patch, line) if isinstance(line, int) else None
+                if new_line is not None:
+                    issues.append({**issue, "line": new_line})
+            kept += len(issues)
+            files.append({**file, "issues": issues})
+        summary = dict(chunk.get("summary", {}))
+        summary["total_issues"] = kept
+        critical = summary.get("critical_issues", 0)
+        summary["critical_issues"] = min(critical if isinstance(critical, int) else 0, kept)
+        carried.append({**chunk, "files": files, "summary": summary})
+    return carried
+
+
+def merge_results(pr_files, previous, reviewed, carried):
+    """
+    Combine this run's results with the stored ones, in PR order.
+
+    - files in `carried` ({filename: patch since the last review}) were reviewed
+      on those hunks only, so their stored findings are carried over and the new
+      ones appended;
+    - other files reviewed now replace the stored result;
+    - untouched files keep the stored result.
+    """
+    reviewed_by_name = {r["filename"]: r for r in reviewed}
+    merged = []
+    for f in pr_files:
+        name = f["filename"]
+        new = reviewed_by_name.get(name)
+        old = previous.get(name)
+        if new is not None and old is not None and name in carried and isinstance(new.get("code_review"), list):
+            merged.append({**new, "code_review": carry_over(old, carried[name]) + new["code_review"]})
+        elif new is not None:
+            merged.append(new)
+        elif old is not None:
+            merged.append(old)
+    return merged
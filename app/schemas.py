@@ -1,6 +1,12 @@
 from pydantic import BaseModel
+from typing import List
 
 class AnalyzePRRequest(BaseModel):
     repo_url: str
     pr_number: int
     github_token: str = None
+    # Re-review from scratch, bypassing cached LLM responses
+    force: bool = False
+
+class BulkStatusRequest(BaseModel):
+    task_ids: List[str]
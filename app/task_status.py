@@ -0,0 +1,50 @@
+import asyncio
+import os
+from celery import states
+from celery.backends.redis import RedisBackend
+from dotenv import load_dotenv
+from app.worker import celery_app
+from app.lib.redis_client import get_async_redis
+load_dotenv()
+
+# Task ids accepted by one bulk POST /status request
+STATUS_BULK_MAX = int(os.getenv("STATUS_BULK_MAX", "1000"))
+
+
+def _metas_from_backend(task_ids):
+    metas = []
+    for task_id in task_ids:
+        result = celery_app.AsyncResult(task_id)
+        metas.append({"status": result.state, "result": result.info})
+    return metas
+
+
+async def fetch_task_metas(task_ids):
+    """
+    Stored result meta ({"status", "result", ...}) of every task, in `task_ids`
+    order; None for tasks the backend knows nothing about (still PENDING).
+
+    With the Redis result backend all keys are read in one pipelined round trip
+    on the pooled async client; other backends are asked through AsyncResult in
+    a worker thread.
+    """
+    backend = celery_app.backend
+    if not isinstance(backend, RedisBackend):
+        return await asyncio.to_thread(_metas_from_backend, task_ids)
+    pipe = get_async_redis(backend.url).pipeline(transaction=False)
+    for task_id in task_ids:
+        pipe.get(backend.get_key_for_task(task_id))
+    payloads = await pipe.execute()
+    return [backend.decode_result(payload) if payload is not None else None for payload in payloads]
+
+
+def task_ready(meta):
+    return meta is not None and meta["status"] in states.READY_STATES
+
+
+def status_payload(task_id, meta):
+    status = meta["status"] if meta is not None else states.PENDING
+    if status == "PROGRESS":
+        # Findings streamed so far, published by the task while it runs
+        return {"task_id": task_id, "status": status, "progress": meta["result"]}
+    return {"task_id": task_id, "status": status}
@@ -1,74 +1,488 @@
 from app.worker import celery_app
+from celery import chord
+from celery.signals import task_postrun
+import orjson
+import os
+import threading
 import time
-from app.github import parse_repo_url, fetch_pr_files, fetch_file_content
+from app.github import parse_repo_url, iter_pr_files, fetch_file_content
 import asyncio
-from app.agent_langgraph import build_graph
-from app.github import post_general_pr_comment,get_latest_commit_sha
-from app.utils import generate_github_markdown_review
+import httpx
+from app.agent_langgraph import build_graph, run_graph
+from app.github import PRContext, post_general_pr_comment, get_pr_context, compare_commits
+from app.utils import generate_github_markdown_review, format_skipped_files
+from app.diff import build_diff_view
+from app.blob_cache import get_blob, put_blob
+from app.mirror import CONTENT_SOURCE, MirrorFileNotFound, get_repo_mirror
+from app.review_publisher import InlineReviewPublisher
+from app.triage import TRIAGE_CONFIG_PATH, BinaryContentError, TriageRules
+from app.llm_cache import llm_cache_stats
+from app.llm_usage import llm_usage, log_usage, merge_usage
+from app.review_state import load_review_state, save_review_state, merge_results
+from app.result_store import compact_batch, compact_result, discard_batches, expand_batch
+from app.review_events import publish_event
 from app.lib.logger import logger  
+from app.lib.github_client import get_github_client, run_with_client
+from app.lib.cache import merge_stats, stats_since
+from app.lib.timing import StageTimer
+
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "10"))
+# "diff" reviews only the changed hunks from the files API; "full" fetches whole files
+REVIEW_MODE = os.getenv("REVIEW_MODE", "diff")
+# Unchanged lines kept around each change in diff mode (API patches carry at most 3; mirror diffs any number)
+REVIEW_CONTEXT_LINES = int(os.getenv("REVIEW_CONTEXT_LINES", "3"))
+# Publish findings as inline comments through a single PR review
+INLINE_COMMENTS = os.getenv("INLINE_COMMENTS", "false").lower() in ("1", "true", "yes")
+# Minimum seconds between PROGRESS updates carrying streamed findings
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", "1.0"))
+# Seconds the findings list shared by the review subtasks of one PR is kept
+PROGRESS_TTL = int(os.getenv("PROGRESS_TTL", "3600"))
+# Files per review batch (one summary comment each)
+REVIEW_BATCH_FILES = int(os.getenv("REVIEW_BATCH_FILES", "20"))
+# Review PRs with more than one batch as a chord of subtasks spread over the workers
+REVIEW_CANVAS = os.getenv("REVIEW_CANVAS", "true").lower() in ("1", "true", "yes")
+
+
+async def fetch_files_content(ctx, files_info, concurrency=FETCH_CONCURRENCY,
+                              review_mode=REVIEW_MODE, context_lines=REVIEW_CONTEXT_LINES, read_content=None, patches=None,
+                              rules=None, skipped=None):
+    """
+    Fetch the content of every PR file with at most `concurrency` requests in flight.
+    `files_info` may be a list or an async iterator of file entries; fetching
+    starts as soon as each entry arrives. Files that fail to fetch are skipped;
+    the rest keep their PR order.
+
+    In "diff" mode files that carry a `patch` are reviewed from their hunks without
+    any request; whole-file fetching is the fallback for entries GitHub sends
+    without one (binary or very large diffs).
+
+    `read_content(file_path)` replaces the contents API as the content source and
+    `patches` overrides the API patches by filename (both used by mirror mode).
+
+    With triage `rules`, files are classified from their path and diff stats before
+    anything is fetched and sniffed once their content is known; files triaged out
+    (and binary content) are appended to `skipped` with the reason.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    patches = patches or {}
+    if read_content is None:
+        async def read_content(file_path):
+            return await fetch_file_content(ctx, file_path)
+
+    def skip(file_path, reason):
+        logger.info(f"Skipping file {file_path}: {reason}")
+        if skipped is not None:
+            skipped.append({"filename": file_path, "reason": reason})
+        return None
+
+    async def read_one(f):
+        file_path = f["filename"]
+        reason = rules.classify(f) if rules is not None else None
+        if reason:
+            return skip(file_path, reason)
+        patch = patches.get(file_path) or f.get("patch")
+        if review_mode == "diff" and patch:
+            logger.info(f"Using diff hunks for file: {file_path}")
+            entry = {
+                "filename": file_path,
+                "content": build_diff_view(patch, context_lines),
+                "mode": "diff",
+                "owner": ctx.owner,
+                "repo": ctx.repo,
+                "pr_number": ctx.pr_number
+            }
+        else:
+            # Blob cache tiers may be Redis or disk round trips; keep them off the event loop
+            sha = f.get("sha")
+            content = await asyncio.to_thread(get_blob, sha) if sha else None
+            if content is None:
+                async with semaphore:
+                    try:
+                        content = await read_content(file_path)
+                    except BinaryContentError:
+                        return skip(file_path, "binary")
+                if sha:
+                    await asyncio.to_thread(put_blob, sha, content)
+                logger.info(f"Fetched content for file: {file_path}")
+            entry = {
+                "filename": file_path,
+                "content": content,
+                "mode": "full",
+                "owner": ctx.owner,
+                "repo": ctx.repo,
+                "pr_number": ctx.pr_number
+            }
+        reason = rules.sniff(file_path, entry["content"], entry["mode"]) if rules is not None else None
+        if reason:
+            return skip(file_path, reason)
+        return entry
+
+    async def fetch_one(f):
+        # Any failure on one file (read, triage, a malformed patch) only drops that file
+        try:
+            return await read_one(f)
+        except Exception as e:
+            logger.error(f"Skipping file {f.get('filename')} due to error: {e}")
+            return None
+
+    pending = []
+    try:
+        if hasattr(files_info, "__aiter__"):
+            async for f in files_info:
+                pending.append(asyncio.ensure_future(fetch_one(f)))
+        else:
+            pending = [asyncio.ensure_future(fetch_one(f)) for f in files_info]
+    except Exception:
+        for task in pending:
+            task.cancel()
+        raise
+    fetched = [f for f in await asyncio.gather(*pending) if f is not None]
+    logger.info(f"Fetched {len(fetched)} of {len(pending)} files for PR #{ctx.pr_number}")
+    return fetched
+
+
+class ReviewProgress:
+    """
+    Publishes findings to the task state (state PROGRESS, meta["findings"]) while
+    the LLM is still streaming them, at most once every `interval` seconds.
+
+    Review subtasks publish to the parent review's `task_id` instead. With a
+    `shared` Redis client their findings are appended to one list per review, so
+    the parent's state carries the findings of every subtask, not just the last.
+    """
+
+    def __init__(self, task, interval=PROGRESS_INTERVAL, task_id=None, shared=None):
+        self.task = task
+        self.interval = interval
+        self.task_id = task_id
+        self.shared = shared
+        self.findings = []
+        self._published = 0.0
+        self._shared_count = 0
+        self._lock = threading.Lock()
+
+    def add(self, filename, issue):
+        with self._lock:
+            self.findings.append({"filename": filename, **issue})
+            now = time.monotonic()
+            if now - self._published < self.interval:
+                return
+            self._published = now
+            findings = list(self.findings)
+        self._publish(findings)
+
+    def flush(self):
+        with self._lock:
+            self._published = time.monotonic()
+            findings = list(self.findings)
+        self._publish(findings)
+
+    def _publish(self, findings):
+        try:
+            if self.task_id is not None and self.shared is not None:
+                findings = self._share(findings)
+            self.task.update_state(task_id=self.task_id, state="PROGRESS",
+                                   meta={"findings": findings, "total_findings": len(findings)})
+        except Exception as e:
+            logger.warning(f"Could not publish review progress: {e}")
+
+    def file_reviewed(self, filename, issues, failed=False):
+        """Publish a "file" event to the review's event stream (see app/review_events.py)."""
+        publish_event(self.task_id or self.task.request.id, "file", {"filename": filename, "issues": issues, "failed": failed})
+
+    def _share(self, findings):
+        """Append the findings not shared yet to the review's list and return the whole list."""
+        key = f"review_progress:{self.task_id}"
+        with self._lock:
+            new = findings[self._shared_count:]
+            self._shared_count = max(self._shared_count, len(findings))
+        pipe = self.shared.pipeline()
+        if new:
+            pipe.rpush(key, *[orjson.dumps(f) for f in new])
+        pipe.expire(key, PROGRESS_TTL)
+        pipe.lrange(key, 0, -1)
+        return [orjson.loads(item) for item in pipe.execute()[-1]]
+
+
+async def select_files(files_info, seen, previous=None, changed=None):
+    """
+    Record every PR file entry in `seen` and yield the ones that need reviewing:
+    all of them on a first review; afterwards only files changed since the last
+    reviewed head, files not reviewed before, and files whose review failed.
+    """
+    async def entries():
+        if hasattr(files_info, "__aiter__"):
+            async for f in files_info:
+                yield f
+        else:
+            for f in files_info:
+                yield f
+
+    async for f in entries():
+        seen.append(f)
+        name = f["filename"]
+        if previous is None or name in (changed or {}) or needs_review(previous.get(name)):
+            yield f
+
+
+def is_missing_file(error):
+    """Whether reading a file failed because it does not exist (as opposed to the read itself failing)."""
+    if isinstance(error, MirrorFileNotFound):
+        return True
+    return isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 404
+
+
+def needs_review(result):
+    """Whether a stored file result is missing, failed or was cut short (a truncated, partial reply)."""
+    if result is None or not isinstance(result.get("code_review"), list):
+        return True
+    return any(not isinstance(chunk, dict) or "error" in chunk or chunk.get("partial") for chunk in result["code_review"])
+
+
+def review_batch(files, force, progress):
+    """Review one batch of files; returns their results with the LLM usage and time it took."""
+    usage_before = llm_usage.snapshot()
+    cache_before = llm_cache_stats()
+    timer = StageTimer()
+    with timer.stage("review"):
+        graph, state = build_graph(files, use_cache=not force, on_issue=progress.add, on_file=progress.file_reviewed)
+        final_state = asyncio.run(run_graph(graph, state, {"recursion_limit": 150}))
+        progress.flush()
+    return {"results": final_state["results"], "llm_usage": llm_usage.since(usage_before),
+            "llm_cache": stats_since(cache_before, llm_cache_stats()), "timings": timer.as_dict()}
+
+
+def publish_review(plan, outputs, review_seconds):
+    """
+    Post one summary comment per batch, publish inline comments, merge with the
+    stored review and save it. `outputs` are the review_batch results in batch order.
+    """
+    ctx = PRContext.from_payload(plan["ctx"])
+    github_cache_before = get_github_client().cache_stats()
+    timer = StageTimer()
+    timer.stages = {**plan["timings"], "review": review_seconds}
+    errors = [output["error"] for output in outputs if "error" in output]
+    if errors:
+        return {"status": "failed", "error": errors[0]}
+
+    previous = None
+    if plan["previous_head"] is not None:
+        previous = load_review_state(ctx)
+        if previous is None:
+            logger.warning(f"Stored review of PR #{ctx.pr_number} is gone; saving this run's results only")
+    since = f" (changes since {plan['previous_head'][:7]})" if plan["previous_head"] is not None else ""
+    batch_results = []
+    for idx, output in enumerate(outputs, start=1):
+        batch_results.extend(output["results"])
+        markdown_comments = generate_github_markdown_review(output["results"])
+        if idx == 1 and plan["skipped"]:
+            markdown_comments += "\n\n" + format_skipped_files(plan["skipped"])
+        comment_title = f"🧪 Code Review Summary - Batch {idx}{since}"
+        logger.info(f"Posting PR comment for batch {idx}")
+        with timer.stage("publish"):
+            post_general_pr_comment(ctx, f"{comment_title}\n\n{markdown_comments}")
+    if not outputs and plan["skipped"]:
+        # Triage kept every file away from the LLM; still tell the author what was skipped and why
+        logger.info(f"Posting skipped-files comment for PR #{ctx.pr_number}")
+        with timer.stage("publish"):
+            post_general_pr_comment(ctx, f"🧪 Code Review Summary{since}\n\n{format_skipped_files(plan['skipped'])}")
+
+    if INLINE_COMMENTS:
+        review_publisher = InlineReviewPublisher(ctx)
+        review_publisher.collect(batch_results)
+        try:
+            with timer.stage("publish"):
+                review_publisher.publish()
+        except Exception as e:
+            logger.error(f"Failed to publish inline review: {e}")
+
+    if previous is not None:
+        batch_results = merge_results(plan["pr_files"], previous["results"], batch_results, plan["carried"])
+    with timer.stage("save"):
+        # Skipped files have no stored result, so every run triages them again and this list is complete
+        save_review_state(ctx, batch_results, plan["skipped"])
+
+    # The clients' counters cover the whole worker process; report this review's share only
+    github_cache = merge_stats([plan.get("github_cache", {}), stats_since(github_cache_before, get_github_client().cache_stats())])
+    logger.info(f"GitHub response cache stats: {github_cache}")
+    logger.info(f"LLM response cache stats: {merge_stats(output.get('llm_cache', {}) for output in outputs)}")
+    usage = merge_usage(output["llm_usage"] for output in outputs)
+    log_usage(usage)
+    logger.info(f"Stage timings for PR #{ctx.pr_number}: {timer.as_dict()}")
+    logger.info(f"analyze_pr_task completed for PR #{ctx.pr_number}")
+    return compact_result({
+        "task_id": plan["task_id"],
+        "status": "completed",
+        "results": {
+            "raw_output": batch_results,
+            "skipped": plan["skipped"]
+        },
+        "llm_usage": usage,
+        "timings": timer.as_dict()
+    })
+
 
 @celery_app.task(bind=True)
-def analyze_pr_task(self, repo_url, pr_number, github_token):
+def analyze_pr_task(self, repo_url, pr_number, github_token, force=False):
+    """
+    Plan a PR review: resolve the PR, fetch and triage the files to review and
+    split them into batches. One batch is reviewed and published right here;
+    more are fanned out over the workers as a chord of review_batch_task
+    subtasks with publish_review_task as callback, which inherits this task's id.
+    """
     try:
         logger.info(f"Starting analyze_pr_task for repo_url={repo_url}, pr_number={pr_number}")
         owner, repo = parse_repo_url(repo_url)
         logger.info(f"Parsed repo: owner={owner}, repo={repo}")
-        commit_sha = get_latest_commit_sha(owner, repo, pr_number, github_token)
+        github_cache_before = get_github_client().cache_stats()
+        timer = StageTimer()
+        with timer.stage("context"):
+            ctx = get_pr_context(owner, repo, pr_number, github_token)
+            previous = None if force else load_review_state(ctx)
+        if previous is not None and previous["head_sha"] == ctx.head_sha:
+            logger.info(f"PR #{pr_number} was already reviewed at {ctx.head_sha}; returning stored results")
+            return compact_result({
+                "task_id": self.request.id,
+                "status": "completed",
+                "results": {
+                    "raw_output": list(previous["results"].values()),
+                    "skipped": previous.get("skipped", [])
+                }
+            })
+        changed = {}
+        if previous is not None:
+            with timer.stage("context"):
+                changed = run_with_client(compare_commits(ctx, previous["head_sha"], ctx.head_sha))
+            if changed is None:
+                logger.info(f"Falling back to a full review of PR #{pr_number}")
+                previous, changed = None, {}
+            else:
+                logger.info(f"Incremental review of PR #{pr_number}: {len(changed)} file(s) changed since {previous['head_sha']}")
+        incremental_patches = {name: patch for name, patch in changed.items() if patch}
+        pr_files = []
+
+        skipped = []
+
+        async def load_triage_rules(read_content):
+            # Read from the base branch: a PR must not be able to exempt itself from review
+            try:
+                text = await read_content(TRIAGE_CONFIG_PATH)
+            except Exception as e:
+                if is_missing_file(e):
+                    logger.info(f"No triage config at {TRIAGE_CONFIG_PATH}, using default rules")
+                else:
+                    logger.warning(f"Could not read triage config {TRIAGE_CONFIG_PATH}, using default rules: {e}")
+                text = None
+            return TriageRules.from_config(text)
 
         async def gather_code():
-            files_info = await fetch_pr_files(owner, repo, pr_number, github_token)
-            logger.info(f"Fetched {len(files_info)} files for PR #{pr_number}")
-            all_files = []
-            for f in files_info:
-                file_path = f["filename"]
-                try:
-                    content = await fetch_file_content(owner, repo, file_path, commit_sha, github_token)
-                    logger.info(f"Fetched content for file: {file_path}")
-                    all_files.append({
-                        "filename": file_path,
-                        "content": content,
-                        "owner": owner,
-                        "repo": repo,
-                        "pr_number": pr_number
-                    })
-                except Exception as e:
-                    logger.error(f"Skipping file {file_path} due to error: {e}")
-            return all_files
-
-        files = asyncio.run(gather_code())
-        logger.info(f"Total valid files to review: {len(files)}")
-
-        if not files:
+            files_info = select_files(iter_pr_files(ctx), pr_files, previous and previous["results"], changed)
+            if CONTENT_SOURCE != "mirror":
+                rules = await load_triage_rules(lambda file_path: fetch_file_content(ctx, file_path, ref=ctx.base_sha))
+                return await fetch_files_content(ctx, files_info, patches=incremental_patches, rules=rules, skipped=skipped)
+
+            mirror = get_repo_mirror(owner, repo)
+            has_merge_ref = await asyncio.to_thread(mirror.fetch_pull, pr_number, github_token)
+            base_sha = await asyncio.to_thread(mirror.merge_base, pr_number) if has_merge_ref else None
+            patches = await asyncio.to_thread(mirror.diff, base_sha, ctx.head_sha, REVIEW_CONTEXT_LINES) if base_sha else {}
+
+            async def read_content(file_path):
+                return await mirror.read_file(ctx.head_sha, file_path)
+
+            # Only the pull refs are fetched, so the PR's base commit may be missing; the merge-base stands in for it
+            config_ref = ctx.base_sha if await asyncio.to_thread(mirror.has_commit, ctx.base_sha) else base_sha
+            if config_ref is not None:
+                rules = await load_triage_rules(lambda file_path: mirror.read_file(config_ref, file_path))
+            else:
+                rules = await load_triage_rules(lambda file_path: fetch_file_content(ctx, file_path, ref=ctx.base_sha))
+            return await fetch_files_content(ctx, files_info, read_content=read_content, patches={**patches, **incremental_patches},
+                                             rules=rules, skipped=skipped)
+
+        with timer.stage("fetch"):
+            files = run_with_client(gather_code())
+        logger.info(f"Total valid files to review: {len(files)}, skipped by triage: {len(skipped)}")
+
+        if not files and previous is None and not skipped:
             return {"status": "failed", "error": "No valid files to review."}
 
         def chunked(files, size):
             for i in range(0, len(files), size):
                 yield files[i:i + size]
 
-        batch_results = []
-        for idx, batch in enumerate(chunked(files, 20), start=1):
-            logger.info(f"Processing batch {idx} with {len(batch)} files")
-            graph, state = build_graph(batch)
-            final_state = graph.invoke(state, {"recursion_limit": 150})
-            batch_results.extend(final_state["results"])
-
-            markdown_comments = generate_github_markdown_review(final_state['results'])
-            comment_title = f"🧪 Code Review Summary - Batch {idx}"
-            logger.info(f"Posting PR comment for batch {idx}")
-            post_general_pr_comment(owner, repo, pr_number, f"{comment_title}\n\n{markdown_comments}", github_token)
-
-        logger.info(f"analyze_pr_task completed for PR #{pr_number}")
-        return {
+        plan = {
             "task_id": self.request.id,
-            "status": "completed",
-            "results": {
-                "raw_output": batch_results
-            }
+            "ctx": ctx.to_payload(),
+            "previous_head": previous["head_sha"] if previous is not None else None,
+            "pr_files": [{"filename": f["filename"]} for f in pr_files],
+            # Only files reviewed on the new hunks alone keep their earlier findings
+            "carried": {f["filename"]: incremental_patches[f["filename"]] for f in files
+                        if previous is not None and f.get("mode") == "diff" and f["filename"] in incremental_patches},
+            "skipped": skipped,
+            "timings": timer.as_dict(),
+            "github_cache": stats_since(github_cache_before, get_github_client().cache_stats()),
+            "planned_at": time.time(),
         }
+        batches = list(chunked(files, REVIEW_BATCH_FILES))
+        publish_event(self.request.id, "planned", {"files": len(files), "skipped": len(skipped), "batches": len(batches)})
+        if not REVIEW_CANVAS or len(batches) <= 1:
+            progress = ReviewProgress(self)
+            outputs = []
+            for idx, batch in enumerate(batches, start=1):
+                logger.info(f"Processing batch {idx} with {len(batch)} files")
+                outputs.append(review_batch(batch, force, progress))
+            return publish_review(plan, outputs, sum(output["timings"]["review"] for output in outputs))
 
+        logger.info(f"Fanning out PR #{pr_number} review: {len(batches)} batch(es) of up to {REVIEW_BATCH_FILES} files")
+        workflow = chord(
+            [review_batch_task.s(batch, force, self.request.id) for batch in batches],
+            publish_review_task.s(plan),
+        )
     except Exception as e:
         logger.error(f"Error in analyze_pr_task: {e}")
         return {"status": "failed", "error": str(e)}
+    # Outside the try: replace() ends this task by raising Ignore when running on a worker
+    return self.replace(workflow)
+
+
+@celery_app.task(bind=True)
+def review_batch_task(self, files, force, root_id):
+    """Chord header: review one batch, streaming findings into the parent review's progress."""
+    progress = ReviewProgress(self, task_id=root_id, shared=getattr(self.backend, "client", None))
+    try:
+        logger.info(f"Reviewing batch of {len(files)} files for review {root_id}")
+        # Only references to the file results go through the result backend to the callback
+        return compact_batch(self.request.id, review_batch(files, force, progress))
+    except Exception as e:
+        logger.error(f"Error in review_batch_task: {e}")
+        return {"error": str(e)}
+
+
+@celery_app.task(bind=True)
+def publish_review_task(self, outputs, plan):
+    """Chord callback: publish and save the review once every batch is done."""
+    try:
+        result = publish_review(plan, [expand_batch(output) for output in outputs], time.time() - plan["planned_at"])
+    except Exception as e:
+        logger.error(f"Error in publish_review_task: {e}")
+        return {"status": "failed", "error": str(e)}
+    discard_batches(outputs)
+    return result
+
+
+@task_postrun.connect
+def publish_review_outcome(sender=None, task_id=None, retval=None, state=None, **kwargs):
+    """
+    End a review's event stream with its outcome. A review fanned out as a chord
+    ends in publish_review_task, which runs under the review's task id.
+    """
+    if sender not in (analyze_pr_task, publish_review_task) or state == "IGNORED":
+        return
+    if isinstance(retval, dict) and retval.get("status") == "completed":
+        publish_event(task_id, "completed", {"status": "completed", "stored_bytes": retval.get("stored_bytes")})
+    elif isinstance(retval, dict):
+        publish_event(task_id, "failed", {"status": "failed", "error": retval.get("error")})
+    else:
+        publish_event(task_id, "failed", {"status": "failed", "error": str(retval)})
 
 
 # @celery_app.task(bind=True)
@@ -1,12 +1,34 @@
 import pytest
-from app.prompt import make_review_prompt
-from app.agent_langgraph import collect_result
+import asyncio
+from app.prompt import REVIEW_INSTRUCTIONS, make_review_prompt
 from app.agent_langgraph import cleanup_state
 import json
-from unittest.mock import patch, MagicMock
-from app.agent_langgraph import analyze_file
+from unittest.mock import patch, MagicMock, AsyncMock
+from app.agent_langgraph import build_graph, run_graph
+from app.llm_cache import LLMResponseCache, set_llm_cache
+from app.llm_usage import llm_usage
+from app.lib.cache import LRUCache
 
 
+@pytest.fixture(autouse=True)
+def non_streaming_llm():
+    # Most tests mock ainvoke; streaming has its own tests below
+    with patch("app.agent_langgraph.LLM_STREAM", False):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def fresh_llm_cache():
+    cache = LLMResponseCache(LRUCache())
+    set_llm_cache(cache)
+    yield cache
+    set_llm_cache(None)
+
+def review_file(state):
+    """Review state["current_file"] through the review graph, as the tasks do; returns its file result."""
+    graph, initial = build_graph([state["current_file"]], use_cache=state.get("use_cache", True),
+                                 on_issue=state.get("on_issue"))
+    return asyncio.run(run_graph(graph, initial))["results"][0]
 
 @pytest.fixture
 def sample_state():
@@ -21,37 +43,39 @@ def sample_state():
     }
 
 # ✅ Success: Multiple chunks processed with valid JSON
-@patch("langchain_openai.ChatOpenAI.invoke")
-@patch("app.agent_langgraph.make_review_prompt", wraps=make_review_prompt)
-def test_analyze_file_success_multiple_chunks(mock_prompt, mock_invoke, sample_state):
+@patch("langchain_openai.ChatOpenAI.ainvoke")
+@patch("app.review_planner.request_budget", return_value=3000)
+@patch("app.review_planner.make_review_prompt", wraps=make_review_prompt)
+def test_review_file_success_multiple_chunks(mock_prompt, mock_budget, mock_invoke, sample_state):
     mock_invoke.return_value.content = '{"files": [], "summary": {"total_issues": 0, "critical_issues": 0}}'
 
-    result = analyze_file(sample_state)
-    assert "current_result" in result
-    assert result["current_result"]["filename"] == "sample.py"
-    assert isinstance(result["current_result"]["code_review"], list)
-    assert all(isinstance(c, dict) for c in result["current_result"]["code_review"])
+    result = review_file(sample_state)
+    assert result["filename"] == "sample.py"
+    assert isinstance(result["code_review"], list)
+    assert all(isinstance(c, dict) for c in result["code_review"])
     assert mock_invoke.call_count >= 2  # multiple chunks
     assert mock_prompt.call_count == mock_invoke.call_count
+    assert len(result["code_review"]) == mock_invoke.call_count
 
 # ❌ LLM returns invalid JSON for one chunk
-@patch("langchain_openai.ChatOpenAI.invoke", side_effect=[
+@patch("langchain_openai.ChatOpenAI.ainvoke", side_effect=[
     MagicMock(content='{"files": [], "summary": {"total_issues": 1, "critical_issues": 0}}'),
     MagicMock(content="INVALID_JSON")
 ])
-def test_analyze_file_partial_invalid_json(mock_invoke, sample_state):
-    result = analyze_file(sample_state)
-    reviews = result["current_result"]["code_review"]
+@patch("app.review_planner.request_budget", return_value=3000)
+def test_review_file_partial_invalid_json(mock_budget, mock_invoke, sample_state):
+    result = review_file(sample_state)
+    reviews = result["code_review"]
     assert isinstance(reviews, list)
     # Fix: Ensure fallback chunk error is preserved
     assert any(isinstance(chunk, dict) and "error" in chunk for chunk in reviews)
 
 
 # ❌ Entire prompt call fails (simulate LLM crash)
-@patch("langchain_openai.ChatOpenAI.invoke", side_effect=Exception("LLM crashed"))
-def test_analyze_file_invoke_crash(mock_invoke, sample_state):
-    result = analyze_file(sample_state)
-    reviews = result["current_result"]["code_review"]
+@patch("langchain_openai.ChatOpenAI.ainvoke", side_effect=Exception("LLM crashed"))
+def test_review_file_invoke_crash(mock_invoke, sample_state):
+    result = review_file(sample_state)
+    reviews = result["code_review"]
     assert isinstance(reviews, str) or isinstance(reviews, list)
     
     # If returned as a str due to total failure
@@ -61,11 +85,11 @@ def test_analyze_file_invoke_crash(mock_invoke, sample_state):
         assert any("LLM crashed" in json.dumps(chunk) for chunk in reviews)
 
 
-def test_analyze_file_single_chunk(monkeypatch):
+def test_review_file_single_chunk(monkeypatch):
     mock_response = MagicMock()
     mock_response.content = '{"files": [], "summary": {"total_issues": 0, "critical_issues": 0}}'
 
-    with patch("langchain_openai.ChatOpenAI.invoke", return_value=mock_response):
+    with patch("langchain_openai.ChatOpenAI.ainvoke", return_value=mock_response):
         state = {
             "current_file": {
                 "filename": "quick.py",
@@ -75,12 +99,12 @@ def test_analyze_file_single_chunk(monkeypatch):
                 "pr_number": 1
             }
         }
-        result = analyze_file(state)
-        assert result["current_result"]["filename"] == "quick.py"
+        result = review_file(state)
+        assert result["filename"] == "quick.py"
 
 
 # ✅ Edge Case: Empty file content
-def test_analyze_file_empty_content():
+def test_review_file_empty_content():
     state = {
         "current_file": {
             "filename": "empty.py",
@@ -90,78 +114,12 @@ def test_analyze_file_empty_content():
             "pr_number": 1
         }
     }
-    result = analyze_file(state)
-    assert result["current_result"]["filename"] == "empty.py"
-    assert result["current_result"]["code_review"] == []
-
-# ❌ Critical state missing (missing 'current_file')
-def test_analyze_file_missing_key():
-    bad_state = {}
-    result = analyze_file(bad_state)
-    assert "current_result" in result
-    assert "unknown" in result["current_result"]["filename"]
-    assert "current_file" in result["current_result"]["code_review"]
-
-
-
-
-
-
-
-def test_collect_result_with_current_result():
-    state = {
-        "current_file": {"filename": "file1.py"},
-        "current_result": {"filename": "file1.py", "code_review": "Looks good"},
-        "results": []
-    }
-
-    new_state = collect_result(state)
-
-    assert "current_result" not in new_state
-    assert "results" in new_state
-    assert new_state["results"] == [{"filename": "file1.py", "code_review": "Looks good"}]
-
-def test_collect_result_missing_current_result():
-    state = {
-        "current_file": {"filename": "file2.py"},
-        "results": []
-    }
-
-    new_state = collect_result(state)
-
-    assert "current_result" not in new_state
-    assert "results" in new_state
-    assert new_state["results"] == [{"filename": "file2.py", "code_review": "Error: current_result missing"}]
-
-def test_collect_result_with_exception(monkeypatch):
-    # Simulate a corrupted state (e.g., `results` is not a list)
-    state = {
-        "current_file": {"filename": "file3.py"},
-        "current_result": {"filename": "file3.py", "code_review": "bad"},
-        "results": None  # this will raise an exception when trying to add
-    }
-
-    new_state = collect_result(state)
-
-    assert "error" in new_state
-    assert "current_result" in new_state
-    assert new_state["current_result"]["filename"] == "file3.py"
-    assert "code_review" in new_state["current_result"]
-    assert "TypeError" in new_state["error"] or "unsupported operand" in new_state["error"]
-
+    result = review_file(state)
+    assert result["filename"] == "empty.py"
+    assert result["code_review"] == []
 
 
 
-
-
-
-
-
-
-import pytest
-from app.agent_langgraph import build_graph
-
-
 @pytest.fixture
 def sample_files():
     return [
@@ -210,3 +168,345 @@ def test_should_continue_branching_logic(sample_files):
 
     assert should_continue({"index": 0, "files": [1, 2]}) == "analyze_file"
     assert should_continue({"index": 2, "files": [1, 2]}) == "cleanup_state"
+
+
+# ✅ Diff-mode files use the diff prompt
+@patch("langchain_openai.ChatOpenAI.ainvoke")
+@patch("app.review_planner.make_diff_review_prompt", return_value="diff prompt")
+def test_review_file_diff_mode_uses_diff_prompt(mock_prompt, mock_invoke):
+    mock_invoke.return_value.content = '{"files": [], "summary": {"total_issues": 0, "critical_issues": 0}}'
+    state = {
+        "current_file": {
+            "filename": "diff.py",
+            "content": "@@ lines 1-1 @@\n     1 + x = 2",
+            "mode": "diff",
+            "owner": "octocat",
+            "repo": "repo",
+            "pr_number": 1
+        }
+    }
+    review_file(state)
+    mock_prompt.assert_called_with("diff.py", "@@ lines 1-1 @@\n     1 + x = 2")
+
+
+# ✅ The optional inline-comment node hands every result to the publisher
+@patch("langchain_openai.ChatOpenAI.ainvoke")
+def test_graph_with_inline_comment_node(mock_invoke, sample_files):
+    mock_invoke.return_value.content = '{"files": [], "summary": {"total_issues": 0, "critical_issues": 0}}'
+    publisher = MagicMock()
+    graph, state = build_graph(sample_files, review_publisher=publisher)
+    result = graph.invoke(state)
+    assert len(result["results"]) == len(sample_files)
+    publisher.collect.assert_called_once()
+    assert len(publisher.collect.call_args[0][0]) == len(sample_files)
+
+
+# ✅ Files are analyzed concurrently (bounded) and reduced in file order
+def test_graph_fans_out_with_bounded_concurrency():
+    import threading
+    lock = threading.Lock()
+    in_flight = 0
+    peak = 0
+
+    async def slow_invoke(messages):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        await asyncio.sleep(0.05)
+        with lock:
+            in_flight -= 1
+        return MagicMock(content='{"files": [], "summary": {"total_issues": 0, "critical_issues": 0}}')
+
+    files = [
+        {"filename": f"f{i}.py", "content": "x = 1", "owner": "o", "repo": "r", "pr_number": 1}
+        for i in range(6)
+    ]
+    # One request per file, so every file gets its own branch
+    with patch("app.review_planner.PACK_MAX_FILES", 1), \
+         patch("langchain_openai.ChatOpenAI.ainvoke", side_effect=slow_invoke):
+        graph, state = build_graph(files, max_concurrency=3)
+        result = graph.invoke(state)
+
+    assert [r["filename"] for r in result["results"]] == [f"f{i}.py" for i in range(6)]
+    assert 1 < peak <= 3
+    assert result["index"] == 6
+
+
+def test_graph_with_no_files():
+    graph, state = build_graph([])
+    result = graph.invoke(state)
+    assert result["results"] == []
+
+
+# ✅ Chunks of one file are sent concurrently, capped by LLM_CONCURRENCY, and kept in order
+def test_review_file_chunks_run_concurrently():
+    in_flight = 0
+    peak = 0
+
+    async def slow_invoke(messages):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.02)
+        in_flight -= 1
+        last_line = int(messages[-1].content.splitlines()[-1].split()[0])
+        return MagicMock(content=json.dumps({"summary": {"last_line": last_line}}))
+
+    state = {
+        "current_file": {
+            "filename": "big.py",
+            "content": "\n".join(f"line{i}" for i in range(2500)),
+            "owner": "o", "repo": "r", "pr_number": 1,
+        },
+        "results": [],
+    }
+    with patch("app.agent_langgraph.LLM_CONCURRENCY", 2), \
+         patch("app.review_planner.request_budget", return_value=2000), \
+         patch("langchain_openai.ChatOpenAI.ainvoke", side_effect=slow_invoke), \
+         patch("app.review_planner.make_review_prompt", side_effect=lambda name, code: code):
+        result = review_file(state)
+
+    last_lines = [c["summary"]["last_line"] for c in result["code_review"]]
+    assert len(last_lines) >= 3
+    assert last_lines == sorted(last_lines)
+    assert last_lines[-1] == 2500
+    assert peak == 2
+
+
+# ✅ Small files are packed into one request and findings go back to the right file
+def test_graph_packs_small_files_and_maps_findings(sample_files):
+    reply = {
+        "files": [
+            {"name": "file2.py", "issues": [{"type": "bug", "line": 1, "description": "d", "suggestion": "s"}], "critical_issues": 1},
+            {"name": "file1.py", "issues": []},
+        ],
+        "summary": {"total_files": 2, "total_issues": 1, "critical_issues": 1},
+    }
+    with patch("langchain_openai.ChatOpenAI.ainvoke") as mock_invoke:
+        mock_invoke.return_value.content = json.dumps(reply)
+        graph, state = build_graph(sample_files)
+        result = graph.invoke(state)
+
+    assert mock_invoke.call_count == 1
+    file1, file2 = result["results"]
+    assert file1["filename"] == "file1.py"
+    assert file1["code_review"][0]["files"][0]["issues"] == []
+    assert file2["code_review"][0]["files"][0]["issues"][0]["line"] == 1
+    assert file2["code_review"][0]["summary"] == {"total_files": 1, "total_issues": 1, "critical_issues": 1}
+
+
+# ✅ An identical prompt is answered from the LLM cache; force bypasses the lookup but refreshes it
+def test_llm_cache_hit_and_bypass(fresh_llm_cache):
+    state = {"current_file": {"filename": "a.py", "content": "x = 1", "owner": "o", "repo": "r", "pr_number": 1}}
+    with patch("langchain_openai.ChatOpenAI.ainvoke") as mock_invoke:
+        mock_invoke.return_value.content = '{"files": [], "summary": {"total_issues": 0, "critical_issues": 0}}'
+        review_file(dict(state))
+        second = review_file(dict(state))
+        assert mock_invoke.call_count == 1
+        assert second["code_review"][0]["summary"]["total_issues"] == 0
+
+        mock_invoke.return_value.content = '{"files": [], "summary": {"total_issues": 2, "critical_issues": 0}}'
+        forced = review_file({**state, "use_cache": False})
+        assert mock_invoke.call_count == 2
+        assert forced["code_review"][0]["summary"]["total_issues"] == 2
+        third = review_file(dict(state))
+        assert third["code_review"][0]["summary"]["total_issues"] == 2
+
+    assert fresh_llm_cache.stats()["hits"] == 2
+
+
+# ❌ Replies that are not valid JSON are never cached
+def test_llm_cache_skips_invalid_json(fresh_llm_cache):
+    state = {"current_file": {"filename": "a.py", "content": "x = 1", "owner": "o", "repo": "r", "pr_number": 1}}
+    with patch("langchain_openai.ChatOpenAI.ainvoke") as mock_invoke:
+        mock_invoke.return_value.content = "INVALID_JSON"
+        review_file(dict(state))
+        review_file(dict(state))
+        assert mock_invoke.call_count == 2
+    assert len(fresh_llm_cache.store) == 0
+
+
+def streamed(*pieces):
+    async def astream(messages):
+        for piece in pieces:
+            yield MagicMock(content=piece)
+    return astream
+
+
+# ✅ Streamed issues reach on_issue as they complete, with their file, despite a fence and trailing prose
+def test_streaming_emits_issues_and_tolerates_fences():
+    reply = json.dumps({
+        "files": [{"name": "a.py", "issues": [{"type": "bug", "line": 1, "description": "d", "suggestion": "s"}]}],
+        "summary": {"total_files": 1, "total_issues": 1, "critical_issues": 0},
+    })
+    pieces = ["Sure!\n```json\n"] + [reply[i:i + 7] for i in range(0, len(reply), 7)] + ["\n```\nHope this helps."]
+    seen = []
+    state = {
+        "current_file": {"filename": "a.py", "content": "x = 1", "owner": "o", "repo": "r", "pr_number": 1},
+        "on_issue": lambda filename, issue: seen.append((filename, issue["line"])),
+    }
+    with patch("app.agent_langgraph.LLM_STREAM", True), \
+         patch("langchain_openai.ChatOpenAI.astream", side_effect=streamed(*pieces)):
+        result = review_file(state)
+
+    assert seen == [("a.py", 1)]
+    chunk = result["code_review"][0]
+    assert chunk["files"][0]["issues"][0]["line"] == 1
+    assert chunk["summary"]["total_issues"] == 1
+
+
+# ❌ A reply that breaks off keeps the issues that were already complete
+def test_streaming_truncated_reply_keeps_complete_issues():
+    pieces = ['{"files": [{"name": "a.py", "issues": [{"type": "bug", "line": 1, "description": "d", "suggestion": "s"}, {"type": "st']
+    state = {"current_file": {"filename": "a.py", "content": "x = 1", "owner": "o", "repo": "r", "pr_number": 1}}
+    with patch("app.agent_langgraph.LLM_STREAM", True), \
+         patch("langchain_openai.ChatOpenAI.astream", side_effect=streamed(*pieces)):
+        result = review_file(state)
+
+    chunk = result["code_review"][0]
+    assert [i["line"] for i in chunk["files"][0]["issues"]] == [1]
+    assert "error" not in chunk
+
+
+def fake_model(name, *replies):
+    model = MagicMock(model_name=name, temperature=0)
+    model.ainvoke = AsyncMock(side_effect=[MagicMock(content=r, usage_metadata={"input_tokens": 10, "output_tokens": 5})
+                                           for r in replies])
+    return model
+
+
+CLEAN = '{"files": [{"name": "a.py", "issues": []}], "summary": {"total_files": 1, "total_issues": 0, "critical_issues": 0}}'
+FLAGGED = json.dumps({
+    "files": [{"name": "a.py", "issues": [{"type": "bug", "line": 1, "description": "d", "suggestion": "s"}]}],
+    "summary": {"total_files": 1, "total_issues": 1, "critical_issues": 1},
+})
+
+
+# ✅ A request the screening model finds clean never reaches the review model
+def test_cascade_clean_request_stays_on_screen_model():
+    screen, review = fake_model("small", CLEAN), fake_model("large")
+    state = {"current_file": {"filename": "a.py", "content": "x = 1", "owner": "o", "repo": "r", "pr_number": 1}}
+    before = llm_usage.snapshot()
+    with patch("app.agent_langgraph.LLM_CASCADE", True), \
+         patch("app.agent_langgraph.screen_llm", screen), patch("app.agent_langgraph.llm", review):
+        result = review_file(state)
+
+    assert screen.ainvoke.call_count == 1
+    review.ainvoke.assert_not_called()
+    assert result["code_review"][0]["summary"]["total_issues"] == 0
+    assert llm_usage.since(before) == {"screen": {"requests": 1, "input_tokens": 10, "output_tokens": 5, "cleared": 1}}
+
+
+# ✅ Flagged requests are escalated and the review model's answer is kept
+def test_cascade_escalates_flagged_request():
+    screen, review = fake_model("small", FLAGGED), fake_model("large", FLAGGED.replace('"line": 1', '"line": 2'))
+    state = {"current_file": {"filename": "a.py", "content": "x = 1\ny = 2", "owner": "o", "repo": "r", "pr_number": 1}}
+    before = llm_usage.snapshot()
+    with patch("app.agent_langgraph.LLM_CASCADE", True), \
+         patch("app.agent_langgraph.screen_llm", screen), patch("app.agent_langgraph.llm", review):
+        result = review_file(state)
+
+    assert review.ainvoke.call_count == 1
+    assert result["code_review"][0]["files"][0]["issues"][0]["line"] == 2
+    usage = llm_usage.since(before)
+    assert usage["screen"]["escalated"] == 1
+    assert usage["review"]["requests"] == 1
+
+
+# ✅ Findings of a screening reply that is kept are streamed once, like the review model's
+def test_cascade_kept_screen_reply_streams_findings():
+    from app.agent_langgraph import review_request
+    from app.review_planner import plan_requests
+    screen, review = fake_model("small", FLAGGED), fake_model("large")
+    file = {"filename": "a.py", "content": "x = 1", "owner": "o", "repo": "r", "pr_number": 1}
+    streamed_issues = []
+    with patch("app.agent_langgraph.LLM_CASCADE", True), patch("app.agent_langgraph.CASCADE_ESCALATE_ISSUES", 2), \
+         patch("app.agent_langgraph.screen_llm", screen), patch("app.agent_langgraph.llm", review):
+        chunks = asyncio.run(review_request(plan_requests([file])[0], 1, False,
+                                            lambda name, issue: streamed_issues.append((name, issue["line"]))))
+
+    review.ainvoke.assert_not_called()
+    assert streamed_issues == [("a.py", 1)]
+    assert [i["line"] for i in chunks[0]["files"][0]["issues"]] == [1]
+
+
+# ❌ Requests above the complexity threshold, or with an unusable screening reply, go to the review model
+@pytest.mark.parametrize("max_lines, screen_replies, screened", [(1, [], 0), (150, ["INVALID_JSON"], 1)])
+def test_cascade_escalates_complex_or_failed_screening(max_lines, screen_replies, screened):
+    screen, review = fake_model("small", *screen_replies), fake_model("large", CLEAN)
+    state = {"current_file": {"filename": "a.py", "content": "x = 1\ny = 2", "owner": "o", "repo": "r", "pr_number": 1}}
+    with patch("app.agent_langgraph.LLM_CASCADE", True), patch("app.agent_langgraph.CASCADE_MAX_LINES", max_lines), \
+         patch("app.agent_langgraph.screen_llm", screen), patch("app.agent_langgraph.llm", review):
+        result = review_file(state)
+
+    assert screen.ainvoke.call_count == screened
+    assert review.ainvoke.call_count == 1
+    assert "error" not in result["code_review"][0]
+
+
+# ✅ Every request starts with the same static system prefix; only the suffix carries the file
+def test_requests_share_static_prompt_prefix():
+    review = fake_model("large")
+    review.ainvoke.side_effect = [
+        MagicMock(content=CLEAN, usage_metadata={"input_tokens": 10, "output_tokens": 5}),
+        MagicMock(content=CLEAN, usage_metadata={
+            "input_tokens": 1200, "output_tokens": 5, "input_token_details": {"cache_read": 1024},
+        }),
+    ]
+    before = llm_usage.snapshot()
+    with patch("app.agent_langgraph.llm", review):
+        for name in ("a.py", "b.py"):
+            state = {"current_file": {"filename": name, "content": "x = 1", "owner": "o", "repo": "r", "pr_number": 1}}
+            review_file(state)
+
+    first, second = (c.args[0] for c in review.ainvoke.call_args_list)
+    assert first[0].content == second[0].content == REVIEW_INSTRUCTIONS
+    assert "a.py" in first[1].content and "b.py" in second[1].content
+    assert "a.py" not in REVIEW_INSTRUCTIONS
+    usage = llm_usage.since(before)["review"]
+    assert usage["input_tokens"] == 1210
+    assert usage["cached_input_tokens"] == 1024
+
+
+# ✅ on_file reports every file once, after all of its parts are reviewed
+def test_file_progress_reports_each_file_once():
+    from app.agent_langgraph import FileProgress
+    seen = []
+    a0, a1, b = MagicMock(position=0), MagicMock(position=0), MagicMock(position=1)
+    requests = [MagicMock(segments=[a0]), MagicMock(segments=[a1, b])]
+    progress = FileProgress([{"filename": "a.py"}, {"filename": "b.py"}], requests, lambda *args: seen.append(args))
+
+    progress([a0], [{"files": [{"name": "a.py", "issues": [{}, {}]}]}])
+    assert seen == []
+    progress([a1, b], [{"error": "boom"}, {"files": [{"name": "b.py", "issues": [{}]}]}])
+    assert seen == [("a.py", 2, True), ("b.py", 1, False)]
+
+
+@patch("langchain_openai.ChatOpenAI.ainvoke")
+def test_graph_reports_reviewed_files(mock_invoke, sample_files):
+    mock_invoke.return_value.content = '{"files": [], "summary": {"total_issues": 0, "critical_issues": 0}}'
+    seen = []
+    graph, state = build_graph(sample_files, on_file=lambda *args: seen.append(args))
+    graph.invoke(state)
+    assert sorted(seen) == [("file1.py", 0, False), ("file2.py", 0, False)]
+
+
+# ✅ Per-loop LLM HTTP pools are closed before their event loop ends
+def test_loop_model_pools_closed_with_their_loop():
+    from app.agent_langgraph import loop_model, run_graph, _loop_models
+    from langchain_openai import ChatOpenAI
+    model = ChatOpenAI(model="gpt-4o-mini", api_key="sk-test")
+    graph = MagicMock()
+    clients = []
+
+    async def invoke(state, config=None):
+        loop_model(model)
+        clients.append(next(client for (loop, _), (_, client) in _loop_models.items() if loop is asyncio.get_running_loop()))
+        return state
+
+    graph.ainvoke = invoke
+    asyncio.run(run_graph(graph, {}))
+    asyncio.run(run_graph(graph, {}))
+    assert len(clients) == 2 and all(client.is_closed for client in clients)
+    assert not [key for key in _loop_models if key[1] == id(model)]
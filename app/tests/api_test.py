@@ -1,10 +1,22 @@
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
+from app.dedup import MemoryDedupStore, set_dedup_store
+from app.github import PRContext
 
 client = TestClient(app)
 
+@pytest.fixture(autouse=True)
+def dedup_store():
+    # Fresh in-process claims, and a PR head resolved without calling GitHub
+    store = MemoryDedupStore()
+    set_dedup_store(store)
+    ctx = PRContext(owner="Himangshu1086", repo="Experten", pr_number=5, token="t", head_sha="head1", base_sha="base")
+    with patch("app.api.get_pr_context", return_value=ctx) as mock_ctx:
+        yield mock_ctx
+    set_dedup_store(None)
+
 @pytest.fixture
 def fake_request_payload():
     return {
@@ -14,7 +26,7 @@ def fake_request_payload():
     }
 
 # ✅ Success path for /analyze-pr
-@patch("app.api.analyze_pr_task.delay")
+@patch("app.api.analyze_pr_task.apply_async")
 def test_analyze_pr_success(mock_delay, fake_request_payload):
     mock_task = MagicMock()
     mock_task.id = "test-task-id"
@@ -26,13 +38,23 @@ def test_analyze_pr_success(mock_delay, fake_request_payload):
     assert response.json()["task_id"] == "test-task-id"
     mock_delay.assert_called_once()
 
+# ✅ force is passed through so the task can bypass the LLM cache
+@patch("app.api.analyze_pr_task.apply_async")
+def test_analyze_pr_force_flag(mock_delay, fake_request_payload):
+    mock_delay.return_value = MagicMock(id="forced")
+    client.post("/analyze-pr", json={**fake_request_payload, "force": True})
+    mock_delay.assert_called_once()
+    assert mock_delay.call_args.kwargs["args"] == (
+        fake_request_payload["repo_url"], fake_request_payload["pr_number"], fake_request_payload["github_token"], True
+    )
+
 # ✅ Invalid payload (missing required fields)
 def test_analyze_pr_invalid_payload_missing_field():
     response = client.post("/analyze-pr", json={"repo_url": "https://github.com/test/repo"})
     assert response.status_code == 422  # Pydantic validation error
 
-# ✅ Celery delay() raises an exception
-@patch("app.api.analyze_pr_task.delay", side_effect=Exception("Mock Celery failure"))
+# ✅ Celery apply_async() raises an exception
+@patch("app.api.analyze_pr_task.apply_async", side_effect=Exception("Mock Celery failure"))
 def test_analyze_pr_celery_error(mock_delay, fake_request_payload):
     with pytest.raises(Exception) as exc_info:
         client.post("/analyze-pr", json=fake_request_payload)
@@ -40,7 +62,7 @@ def test_analyze_pr_celery_error(mock_delay, fake_request_payload):
 
 # ✅ Logger is called in /analyze-pr
 @patch("app.api.logger.info")
-@patch("app.api.analyze_pr_task.delay")
+@patch("app.api.analyze_pr_task.apply_async")
 def test_analyze_pr_logs_called(mock_delay, mock_logger, fake_request_payload):
     mock_task = MagicMock()
     mock_task.id = "log-test-task"
@@ -55,12 +77,8 @@ def test_analyze_pr_logs_called(mock_delay, mock_logger, fake_request_payload):
     )
 
 # ✅ Success path for /status/{task_id}
-@patch("app.api.celery_app.AsyncResult")
-def test_status_check(mock_async_result):
-    mock_result = MagicMock()
-    mock_result.status = "PENDING"
-    mock_async_result.return_value = mock_result
-
+@patch("app.api.fetch_task_metas", new_callable=AsyncMock, return_value=[None])
+def test_status_check(mock_metas):
     response = client.get("/status/some-task-id")
     assert response.status_code == 200
     assert response.json() == {
@@ -68,37 +86,175 @@ def test_status_check(mock_async_result):
         "status": "PENDING"
     }
 
+# ✅ /status/{task_id} includes streamed findings while the task runs
+@patch("app.api.fetch_task_metas", new_callable=AsyncMock)
+def test_status_includes_progress(mock_metas):
+    mock_metas.return_value = [{"status": "PROGRESS", "result": {"findings": [{"filename": "a.py", "line": 1}], "total_findings": 1}}]
+
+    response = client.get("/status/some-task-id")
+    assert response.json()["progress"]["total_findings"] == 1
+
 # ✅ /results/{task_id} when ready = True and result = dict
-@patch("app.api.celery_app.AsyncResult")
-def test_results_ready_with_data(mock_async_result):
-    mock_result = MagicMock()
-    mock_result.ready.return_value = True
-    mock_result.result = {"status": "completed", "data": "done"}
-    mock_async_result.return_value = mock_result
+@patch("app.api.fetch_task_metas", new_callable=AsyncMock)
+def test_results_ready_with_data(mock_metas):
+    mock_metas.return_value = [{"status": "SUCCESS", "result": {"status": "completed", "data": "done"}}]
 
     response = client.get("/results/test-task-id")
     assert response.status_code == 200
     assert response.json()["status"] == "completed"
 
 # ✅ /results/{task_id} when ready = True and result = None
-@patch("app.api.celery_app.AsyncResult")
-def test_results_ready_empty_result(mock_async_result):
-    mock_result = MagicMock()
-    mock_result.ready.return_value = True
-    mock_result.result = None
-    mock_async_result.return_value = mock_result
+@patch("app.api.fetch_task_metas", new_callable=AsyncMock)
+def test_results_ready_empty_result(mock_metas):
+    mock_metas.return_value = [{"status": "SUCCESS", "result": None}]
 
     response = client.get("/results/test-task-id")
     assert response.status_code == 200
     assert response.json() is None
 
 # ✅ /results/{task_id} when not ready
-@patch("app.api.celery_app.AsyncResult")
-def test_results_not_ready(mock_async_result):
-    mock_result = MagicMock()
-    mock_result.ready.return_value = False
-    mock_async_result.return_value = mock_result
+@patch("app.api.fetch_task_metas", new_callable=AsyncMock)
+def test_results_not_ready(mock_metas):
+    mock_metas.return_value = [{"status": "PROGRESS", "result": {}}]
 
     response = client.get("/results/wait-task-id")
     assert response.status_code == 202
     assert response.json() == {"detail": "Task not yet complete"}
+
+
+# ✅ Repeated requests for the same head return the task already enqueued
+@patch("app.api.celery_app.AsyncResult")
+@patch("app.api.analyze_pr_task.apply_async")
+def test_analyze_pr_deduplicates_same_head(mock_apply, mock_async_result, fake_request_payload):
+    mock_apply.side_effect = lambda args, task_id: MagicMock(id=task_id)
+    mock_async_result.return_value = MagicMock(status="STARTED")
+
+    first = client.post("/analyze-pr", json=fake_request_payload).json()
+    second = client.post("/analyze-pr", json=fake_request_payload).json()
+
+    assert mock_apply.call_count == 1
+    assert first["deduplicated"] is False
+    assert second == {"task_id": first["task_id"], "deduplicated": True}
+
+
+# ✅ A new head sha, or force, starts a new review; later duplicates join the forced one
+@patch("app.api.celery_app.AsyncResult")
+@patch("app.api.analyze_pr_task.apply_async")
+def test_analyze_pr_new_head_or_force_enqueues(mock_apply, mock_async_result, dedup_store, fake_request_payload):
+    mock_apply.side_effect = lambda args, task_id: MagicMock(id=task_id)
+    mock_async_result.return_value = MagicMock(status="SUCCESS", result={"status": "completed"})
+
+    first = client.post("/analyze-pr", json=fake_request_payload).json()
+    forced = client.post("/analyze-pr", json={**fake_request_payload, "force": True}).json()
+    again = client.post("/analyze-pr", json=fake_request_payload).json()
+    dedup_store.return_value = PRContext(owner="o", repo="r", pr_number=5, token="t", head_sha="head2", base_sha="b")
+    pushed = client.post("/analyze-pr", json=fake_request_payload).json()
+
+    assert mock_apply.call_count == 3
+    assert forced["task_id"] != first["task_id"]
+    assert again == {"task_id": forced["task_id"], "deduplicated": True}
+    assert pushed["deduplicated"] is False
+
+
+# ❌ A failed earlier review is not handed out again
+@patch("app.api.celery_app.AsyncResult")
+@patch("app.api.analyze_pr_task.apply_async")
+def test_analyze_pr_retries_failed_review(mock_apply, mock_async_result, fake_request_payload):
+    mock_apply.side_effect = lambda args, task_id: MagicMock(id=task_id)
+    mock_async_result.return_value = MagicMock(status="SUCCESS", result={"status": "failed", "error": "boom"})
+
+    first = client.post("/analyze-pr", json=fake_request_payload).json()
+    second = client.post("/analyze-pr", json=fake_request_payload).json()
+    assert mock_apply.call_count == 2
+    assert second["task_id"] != first["task_id"]
+
+
+# ❌ Unresolvable heads are enqueued without deduplication; failed enqueues release their claim
+@patch("app.api.analyze_pr_task.apply_async")
+def test_analyze_pr_dedup_fallbacks(mock_apply, dedup_store, fake_request_payload):
+    mock_apply.side_effect = [Exception("broker down"), MagicMock(id="retry")]
+    with pytest.raises(Exception):
+        client.post("/analyze-pr", json=fake_request_payload)
+    assert client.post("/analyze-pr", json=fake_request_payload).json() == {"task_id": "retry", "deduplicated": False}
+
+    dedup_store.side_effect = Exception("bad credentials")
+    mock_apply.side_effect = None
+    mock_apply.return_value = MagicMock(id="no-dedup")
+    assert client.post("/analyze-pr", json=fake_request_payload).json()["task_id"] == "no-dedup"
+
+
+# ✅ /results/{task_id} expands per-file result references
+@patch("app.api.aexpand_result", new_callable=AsyncMock, side_effect=lambda result: {**result, "expanded": True})
+@patch("app.api.fetch_task_metas", new_callable=AsyncMock, return_value=[{"status": "SUCCESS", "result": {"status": "completed"}}])
+def test_results_expanded(mock_metas, mock_expand):
+    assert client.get("/results/test-task-id").json() == {"status": "completed", "expanded": True}
+
+
+# ✅ /events/{task_id} streams the review's events, resuming after Last-Event-ID
+def test_events_stream():
+    from app.review_events import MemoryEventBus, set_event_bus
+    bus = MemoryEventBus()
+    bus.publish("t1", "planned", {"files": 1})
+    bus.publish("t1", "file", {"filename": "a.py", "issues": 0, "failed": False})
+    bus.publish("t1", "completed", {"status": "completed"})
+    set_event_bus(bus)
+    try:
+        response = client.get("/events/t1")
+        resumed = client.get("/events/t1", headers={"Last-Event-ID": "2"})
+    finally:
+        set_event_bus(None)
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text.count("event: ") == 3
+    assert resumed.text == 'id: 3\nevent: completed\ndata: {"status":"completed"}\n\n'
+
+
+# ✅ Reviews that finished without (or past) their events get their outcome as one event
+@patch("app.api.celery_app.AsyncResult")
+def test_events_for_finished_review(mock_async_result):
+    from app.review_events import MemoryEventBus, set_event_bus
+    mock_async_result.return_value = MagicMock(ready=lambda: True, status="SUCCESS", result={"status": "failed", "error": "boom"})
+    set_event_bus(MemoryEventBus())
+    try:
+        response = client.get("/events/old-task")
+    finally:
+        set_event_bus(None)
+    assert response.text == 'id: 0\nevent: failed\ndata: {"status":"failed","error":"boom"}\n\n'
+
+
+# ❌ Unknown task ids get a 404 instead of an endless keep-alive stream; enqueued ones are known at once
+@patch("app.api.celery_app.AsyncResult")
+@patch("app.api.analyze_pr_task.apply_async")
+def test_events_unknown_task(mock_apply, mock_async_result, fake_request_payload):
+    from app.review_events import MemoryEventBus, set_event_bus
+    mock_async_result.return_value = MagicMock(ready=lambda: False, status="PENDING")
+    mock_apply.return_value = MagicMock(id="queued-task")
+    bus = MemoryEventBus()
+    set_event_bus(bus)
+    try:
+        assert client.get("/events/no-such-task").status_code == 404
+        with patch("app.api.REVIEW_DEDUP", False):
+            task_id = client.post("/analyze-pr", json=fake_request_payload).json()["task_id"]
+        assert bus._events[mock_apply.call_args.kwargs["task_id"]] == [("queued", {})]
+    finally:
+        set_event_bus(None)
+    assert task_id == "queued-task"
+
+
+# ✅ Bulk POST /status resolves every task id with one lookup
+@patch("app.api.fetch_task_metas", new_callable=AsyncMock)
+def test_bulk_status(mock_metas):
+    mock_metas.return_value = [{"status": "SUCCESS", "result": {}}, None, {"status": "PROGRESS", "result": {"total_findings": 2}}]
+    response = client.post("/status", json={"task_ids": ["a", "b", "c", "a"]})
+    mock_metas.assert_awaited_once_with(["a", "b", "c"])
+    assert response.json() == {"statuses": [
+        {"task_id": "a", "status": "SUCCESS"},
+        {"task_id": "b", "status": "PENDING"},
+        {"task_id": "c", "status": "PROGRESS", "progress": {"total_findings": 2}},
+    ]}
+
+
+# ❌ Bulk requests over STATUS_BULK_MAX are rejected
+@patch("app.api.STATUS_BULK_MAX", 2)
+def test_bulk_status_too_many():
+    response = client.post("/status", json={"task_ids": ["a", "b", "c"]})
+    assert response.status_code == 400
@@ -0,0 +1,63 @@
+import json
+from app.benchmark import FakeChat, FakeGitHub, StandInConfig, percentiles, run_benchmark, synthetic_pr
+
+
+# ✅ Synthetic PRs run end to end through the task against both stand-ins
+def test_run_benchmark_end_to_end():
+    prs = [synthetic_pr(n, files=3, lines=24) for n in (1, 2)]
+    report = run_benchmark(prs, concurrency=2, force=True)
+
+    assert report["completed"] == 2
+    assert report["failed"] == 0
+    assert report["prs_per_minute"] > 0
+    assert set(report["latency"]) >= {"total", "context", "fetch", "review", "publish"}
+    assert report["latency"]["total"]["p50"] <= report["latency"]["total"]["p99"]
+    assert report["peak_rss_mb"] > 0
+    assert report["requests"]["github"]["GET pulls"] == 2
+    assert report["requests"]["github"]["POST issues"] == 2
+    assert report["requests"]["chat"]["POST chat/completions"] == report["llm_usage"]["review"]["requests"]
+    assert report["llm_usage"]["review"]["output_tokens"] > 0
+
+
+# ❌ Injected GitHub errors fail the affected PRs and are reported
+def test_run_benchmark_reports_failures():
+    prs = [synthetic_pr(1, files=1, lines=12)]
+    report = run_benchmark(prs, github_config=StandInConfig(error_rate=1.0), force=True)
+    assert report["completed"] == 0
+    assert report["failed"] == 1
+    assert "502" in report["errors"][0]
+
+
+# ✅ PR files are paginated with Link headers like the real API
+def test_fake_github_paginates_files():
+    github = FakeGitHub([synthetic_pr(1, files=5, lines=12)])
+    path = "/repos/bench/service/pulls/1/files"
+    status, headers, body = github.handle("GET", path, {"per_page": ["2"], "page": ["1"]}, {}, b"")
+    assert status == 200
+    assert len(json.loads(body)) == 2
+    assert 'page=2>; rel="next"' in headers["Link"] and 'page=3>; rel="last"' in headers["Link"]
+    assert "content" not in json.loads(body)[0]
+
+
+# ✅ The chat stand-in answers with a review of every file in the prompt
+def test_fake_chat_reviews_each_file():
+    chat = FakeChat(issues_per_file=2)
+    review = chat.review("Now review:\n\nFile: a.py\nDiff:\n     3 + x = 1\n\nFile: b.py\nCode:\n     1   y = 2\n")
+    assert [f["name"] for f in review["files"]] == ["a.py", "b.py"]
+    assert [i["line"] for i in review["files"][0]["issues"]] == [3, 3]
+    assert review["summary"]["total_issues"] == 4
+
+
+def test_percentiles_nearest_rank():
+    assert percentiles(list(range(1, 101))) == {"p50": 50, "p90": 90, "p99": 99}
+    assert percentiles([]) == {}
+
+
+# ✅ Only a repeated system prompt of at least 1024 tokens is reported as cached
+def test_fake_chat_caches_only_long_shared_prefixes():
+    chat = FakeChat()
+    short = [{"role": "system", "content": "s" * 2048}, {"role": "user", "content": "u" * 8000}]
+    long = [{"role": "system", "content": "l" * 4608}, {"role": "user", "content": "u"}]
+    cached = lambda messages: chat.usage(messages, "", "{}")["prompt_tokens_details"]["cached_tokens"]
+    assert [cached(short), cached(short)] == [0, 0]
+    assert [cached(long), cached(long)] == [0, 1152]
@@ -0,0 +1,119 @@
+import os
+import time
+import pytest
+from unittest.mock import MagicMock, patch
+from app.lib.cache import LRUCache, DiskCache, RedisCache, SQLiteCache, TieredCache, make_cache, merge_stats, stats_since
+
+# ✅ LRU evicts least recently used entries once over the byte budget
+def test_lru_evicts_by_size():
+    cache = LRUCache(max_bytes=10)
+    cache.set("a", b"12345")
+    cache.set("b", b"12345")
+    cache.get("a")
+    cache.set("c", b"12345")
+    assert cache.get("a") == b"12345"
+    assert cache.get("b") is None
+    assert cache.size == 10
+
+# ✅ Values larger than the whole budget are not cached
+def test_lru_skips_oversized_values():
+    cache = LRUCache(max_bytes=4)
+    cache.set("a", b"12345")
+    assert len(cache) == 0
+
+# ✅ Hit/miss counters
+def test_lru_counters():
+    cache = LRUCache()
+    cache.get("x")
+    cache.set("x", b"1")
+    cache.get("x")
+    assert (cache.hits, cache.misses) == (1, 1)
+
+# ✅ Per-task stats are the difference of two snapshots, summed over tasks
+def test_stats_since_and_merge():
+    before = {"hits": 10, "misses": 5, "hit_rate": 0.66}
+    delta = stats_since(before, {"hits": 13, "misses": 6, "hit_rate": 0.68})
+    assert delta == {"hits": 3, "misses": 1, "hit_rate": 0.75}
+    assert merge_stats([delta, {"hits": 0, "misses": 4}, {}]) == {"hits": 3, "misses": 5, "hit_rate": 0.375}
+    assert stats_since(before, before)["hit_rate"] == 0.0
+
+# ✅ Disk tier round-trips and evicts oldest files over budget
+def test_disk_cache_eviction(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=10)
+    cache.set("a", b"12345")
+    os.utime(cache._path("a"), (1, 1))
+    cache.set("b", b"12345")
+    cache.set("c", b"12345")
+    assert cache.get("a") is None
+    assert cache.get("c") == b"12345"
+
+# ✅ Disk TTL counts from the write, not the last read, so hot entries still expire
+def test_disk_cache_ttl_is_absolute(tmp_path):
+    cache = DiskCache(str(tmp_path), ttl=60)
+    cache.set("a", b"1")
+    path = cache._path("a")
+    now = time.time()
+    os.utime(path, (now, now - 50))
+    assert cache.get("a") == b"1"
+    assert os.stat(path).st_mtime == pytest.approx(now - 50)
+    assert os.stat(path).st_atime >= now - 1
+    os.utime(path, (now, now - 61))
+    assert cache.get("a") is None
+    assert not os.path.exists(path)
+
+# ❌ Failed disk writes (disk full, read-only) are logged, leave no tmp file and never raise
+def test_disk_cache_set_swallows_os_errors(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    with patch("app.lib.cache.os.replace", side_effect=OSError(28, "No space left on device")):
+        cache.set("k", b"v")
+    assert cache.get("k") is None
+    assert not any(p.name.endswith(".tmp") for p in tmp_path.rglob("*"))
+
+# ✅ Redis tier sets a TTL and swallows connection errors
+def test_redis_cache_ttl_and_errors():
+    client = MagicMock()
+    cache = RedisCache("redis://unused", "blob", ttl=60, client=client)
+    cache.set("k", b"v")
+    client.set.assert_called_once_with("blob:k", b"v", ex=60)
+    client.mget.return_value = [b"v", None]
+    assert cache.get_many(["k", "x"]) == [b"v", None]
+    cache.set_many({"a": b"1", "b": b"2"})
+    client.pipeline.return_value.set.assert_any_call("blob:b", b"2", ex=60)
+    client.pipeline.return_value.execute.assert_called_once()
+    client.get.side_effect = Exception("down")
+    assert cache.get("k") is None
+
+# ✅ Tiered cache backfills the memory tier from the slower tier
+def test_tiered_cache_backfills(tmp_path):
+    memory = LRUCache()
+    disk = DiskCache(str(tmp_path))
+    disk.set("k", b"v")
+    cache = TieredCache(memory, disk)
+    assert cache.get("k") == b"v"
+    assert memory.get("k") == b"v"
+    assert cache.stats()["DiskCache"]["hits"] == 1
+
+def test_make_cache_memory_only():
+    cache = make_cache(1024, backend="none")
+    assert len(cache.tiers) == 1
+
+
+# ✅ SQLite tier evicts least recently used entries over budget and expires by TTL
+def test_sqlite_cache_eviction_and_ttl(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), max_bytes=10)
+    cache.set("a", b"12345")
+    cache.set("b", b"12345")
+    cache._conn.execute("UPDATE entries SET accessed = 1 WHERE key = 'a'")
+    cache.set("c", b"12345")
+    assert cache.get("a") is None
+    assert cache.get("c") == b"12345"
+    assert len(cache) == 2
+
+    cache.ttl = 60
+    cache._conn.execute("UPDATE entries SET created = 1 WHERE key = 'c'")
+    assert cache.get("c") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+def test_make_cache_sqlite(tmp_path):
+    cache = make_cache(1024, backend="sqlite", sqlite_path=str(tmp_path / "c.sqlite3"))
+    assert isinstance(cache.tiers[1], SQLiteCache)
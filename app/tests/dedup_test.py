@@ -0,0 +1,29 @@
+from unittest.mock import MagicMock
+from app.dedup import MemoryDedupStore, RedisDedupStore, claim_review, release_review, set_dedup_store
+
+
+# ✅ The first claim wins; later ones get its task id until released
+def test_claim_review_memory_store():
+    set_dedup_store(MemoryDedupStore())
+    assert claim_review("k", "t1") is None
+    assert claim_review("k", "t2") == "t1"
+    assert claim_review("k", "t3", reusable=lambda task_id: False) is None
+    release_review("k", "t1")
+    assert claim_review("k", "t4") == "t3"
+    release_review("k", "t3")
+    assert claim_review("k", "t5") is None
+    set_dedup_store(None)
+
+
+# ✅ Redis claims use SET NX and decode the holder's id
+def test_redis_dedup_store():
+    client = MagicMock()
+    client.set.side_effect = [True, False]
+    client.get.return_value = b"t1"
+    store = RedisDedupStore("redis://unused", client=client)
+
+    assert store.claim("k", "t1", 60) is None
+    client.set.assert_called_with("k", "t1", nx=True, ex=60)
+    assert store.claim("k", "t2", 60) == "t1"
+    store.release("k", "t1")
+    client.register_script.return_value.assert_called_once_with(keys=["k"], args=["t1"])
@@ -0,0 +1,57 @@
+from app.diff import parse_patch, trim_context, build_diff_view, added_lines, map_line
+
+PATCH = """@@ -10,7 +10,8 @@ def handler():
+ a
+ b
+ c
+-old
++new
++extra
+ d
+ e
+ f"""
+
+# ✅ Hunks carry correct old/new line numbers
+def test_parse_patch_line_numbers():
+    hunks = parse_patch(PATCH)
+    assert len(hunks) == 1
+    hunk = hunks[0]
+    assert hunk[0] == (" ", 10, 10, "a")
+    assert hunk[3] == ("-", 13, None, "old")
+    assert hunk[4] == ("+", None, 13, "new")
+    assert hunk[5] == ("+", None, 14, "extra")
+    assert hunk[-1] == (" ", 16, 17, "f")
+
+# ✅ Context is trimmed around changes
+def test_trim_context():
+    hunk = parse_patch(PATCH)[0]
+    trimmed = trim_context(hunk, 1)
+    assert len(trimmed) == 1
+    assert [line[3] for line in trimmed[0]] == ["c", "old", "new", "extra", "d"]
+
+# ✅ Distant changes split into separate hunks
+def test_trim_context_splits_distant_changes():
+    patch = "@@ -1,9 +1,9 @@\n-x\n+y\n 1\n 2\n 3\n 4\n 5\n-z\n+w"
+    trimmed = trim_context(parse_patch(patch)[0], 1)
+    assert len(trimmed) == 2
+
+# ✅ Rendered view shows new-file numbers only for lines that exist in the new file
+def test_build_diff_view():
+    view = build_diff_view(PATCH, context_lines=0)
+    assert "@@ lines 13-14 @@" in view
+    assert "    13 + new" in view
+    assert "       - old" in view
+
+# ✅ Added lines
+def test_added_lines():
+    assert added_lines(PATCH) == {13, 14}
+    assert added_lines(None) == set()
+
+
+# ✅ Old lines move through a patch: shifted below changes, None where rewritten
+def test_map_line():
+    assert map_line(PATCH, 5) == 5
+    assert map_line(PATCH, 11) == 11
+    assert map_line(PATCH, 13) is None
+    assert map_line(PATCH, 14) == 15
+    assert map_line(PATCH, 40) == 41
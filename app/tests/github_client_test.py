@@ -0,0 +1,153 @@
+import pytest
+import httpx
+from unittest.mock import patch
+from app.lib.github_client import GitHubClient, get_github_client, set_github_client, close_github_client, run_with_client
+
+
+@pytest.fixture
+def recorded():
+    return []
+
+
+@pytest.fixture
+def gh_client(recorded):
+    def handler(request):
+        recorded.append(request)
+        return httpx.Response(200, json={"ok": True})
+    return GitHubClient(base_url="https://api.example.com", transport=httpx.MockTransport(handler))
+
+
+# ✅ Auth and accept headers are added to every request
+def test_request_adds_shared_headers(gh_client, recorded):
+    resp = gh_client.request("GET", "/repos/user/repo", "ghp_xxx")
+    assert resp.json() == {"ok": True}
+    assert recorded[0].url == "https://api.example.com/repos/user/repo"
+    assert recorded[0].headers["Authorization"] == "Bearer ghp_xxx"
+    assert recorded[0].headers["Accept"] == "application/vnd.github.v3+json"
+
+
+# ✅ Sync calls share one pooled httpx.Client
+def test_sync_client_is_reused(gh_client):
+    gh_client.request("GET", "/a", "t")
+    first = gh_client.client
+    gh_client.request("GET", "/b", "t")
+    assert gh_client.client is first
+
+
+# ✅ Async calls in the same loop share one pooled httpx.AsyncClient
+@pytest.mark.asyncio
+async def test_async_client_is_reused_within_loop(gh_client, recorded):
+    await gh_client.arequest("GET", "/a", "t")
+    first = gh_client.async_client
+    await gh_client.arequest("GET", "/b", "t")
+    assert gh_client.async_client is first
+    assert len(recorded) == 2
+    await gh_client.aclose()
+
+
+# ✅ Pool limits are configurable
+def test_pool_limits_configurable():
+    client = GitHubClient(max_connections=7, max_keepalive_connections=3, keepalive_expiry=5)
+    assert client.limits.max_connections == 7
+    assert client.limits.max_keepalive_connections == 3
+    assert client.limits.keepalive_expiry == 5
+
+
+# ✅ HTTP/2 falls back to HTTP/1.1 when h2 is missing
+@patch("app.lib.github_client._http2_available", return_value=False)
+def test_http2_fallback_without_h2(mock_h2):
+    client = GitHubClient(http2=True)
+    assert client.http2 is False
+
+
+# ✅ Process-wide singleton
+def test_get_github_client_singleton():
+    set_github_client(None)
+    try:
+        assert get_github_client() is get_github_client()
+    finally:
+        close_github_client()
+
+
+# ✅ Repeat GETs become conditional requests and 304s are served from cache
+def test_conditional_requests_served_from_cache():
+    from app.lib.cache import LRUCache
+    from app.lib.github_client import ResponseCache
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304, headers={"ETag": '"v1"'})
+        return httpx.Response(200, json={"head": {"sha": "abc"}}, headers={"ETag": '"v1"'})
+
+    client = GitHubClient(transport=httpx.MockTransport(handler), response_cache=ResponseCache(LRUCache()))
+    first = client.request("GET", "/repos/u/r/pulls/1", "t")
+    second = client.request("GET", "/repos/u/r/pulls/1", "t")
+
+    assert first.json() == second.json() == {"head": {"sha": "abc"}}
+    assert second.status_code == 200
+    assert second.headers["x-from-cache"] == "1"
+    assert "If-None-Match" not in seen[0].headers
+    assert seen[1].headers["If-None-Match"] == '"v1"'
+    assert client.cache_stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+# ✅ Async requests read and write the response cache off the event loop
+def test_async_response_cache_off_loop():
+    import asyncio
+    import threading
+    from app.lib.cache import LRUCache
+    from app.lib.github_client import ResponseCache
+    threads = []
+
+    class RecordingStore(LRUCache):
+        def get(self, key):
+            threads.append(threading.get_ident())
+            return super().get(key)
+
+        def set(self, key, value):
+            threads.append(threading.get_ident())
+            super().set(key, value)
+
+    def handler(request):
+        return httpx.Response(200, json={"ok": True}, headers={"ETag": '"v1"'})
+
+    client = GitHubClient(transport=httpx.MockTransport(handler), response_cache=ResponseCache(RecordingStore()))
+
+    async def fetch():
+        await client.arequest("GET", "/a", "t")
+        await client.async_client.aclose()
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(fetch())
+    assert len(threads) == 2 and loop_thread not in threads
+
+
+# ✅ Cache entries are scoped per token and query string; POSTs are never cached
+def test_response_cache_key_scoping():
+    from app.lib.github_client import ResponseCache
+    cache = ResponseCache(None)
+    key = cache.key("GET", "https://api.github.com/x", {"page": 1}, "a", "json")
+    assert key != cache.key("GET", "https://api.github.com/x", {"page": 1}, "b", "json")
+    assert key != cache.key("GET", "https://api.github.com/x", {"page": 2}, "a", "json")
+    assert cache.key("POST", "https://api.github.com/x", None, "a", "json") is None
+
+
+# ✅ run_with_client closes the async pool it opened before the loop ends
+def test_run_with_client_closes_loop_pool(gh_client, recorded):
+    pools = []
+
+    async def fetch():
+        await gh_client.arequest("GET", "/a", "t")
+        pools.append(gh_client.async_client)
+        return "done"
+
+    set_github_client(gh_client)
+    try:
+        assert run_with_client(fetch()) == "done"
+        assert run_with_client(fetch()) == "done"
+    finally:
+        set_github_client(None)
+    assert len(pools) == 2 and all(pool.is_closed for pool in pools)
+    assert gh_client._async_clients == {}
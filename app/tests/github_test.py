@@ -1,59 +1,141 @@
 import pytest
 import base64
+import httpx
 from unittest.mock import patch, MagicMock
+from app.lib.github_client import GitHubClient, set_github_client
 from app.github import (
+    PRContext,
+    get_pr_context,
     parse_repo_url,
     fetch_pr_files,
+    iter_pr_files,
     fetch_file_content,
+    compare_commits,
     post_general_pr_comment,
     post_inline_comment,
+    submit_review,
     get_latest_commit_sha
 )
 
+@pytest.fixture
+def ctx():
+    return PRContext(owner="user", repo="repo", pr_number=1, token="ghp_xxx", head_sha="abc123", base_sha="base000")
+
 # === parse_repo_url ===
 def test_parse_repo_url():
     owner, repo = parse_repo_url("https://github.com/user/repo-name")
     assert owner == "user"
     assert repo == "repo-name"
 
-# === fetch_pr_files ===
+# === fetch_pr_files / iter_pr_files ===
+@pytest.fixture
+def paged_github():
+    """Serve /pulls/1/files as `total` entries split into GitHub-style pages."""
+    requests = []
+
+    def install(total, with_last=True):
+        def handler(request):
+            requests.append(request)
+            per_page = int(request.url.params.get("per_page", 30))
+            page = int(request.url.params.get("page", 1))
+            last = max(1, -(-total // per_page))
+            entries = [{"filename": f"file{i}.py"} for i in range((page - 1) * per_page, min(page * per_page, total))]
+            base = "https://api.github.com/repos/user/repo/pulls/1/files"
+            links = []
+            if page < last:
+                links.append(f'<{base}?per_page={per_page}&page={page + 1}>; rel="next"')
+                if with_last:
+                    links.append(f'<{base}?per_page={per_page}&page={last}>; rel="last"')
+            headers = {"Link": ", ".join(links)} if links else {}
+            return httpx.Response(200, json=entries, headers=headers)
+        set_github_client(GitHubClient(transport=httpx.MockTransport(handler)))
+        return requests
+
+    yield install
+    set_github_client(None)
+
 @pytest.mark.asyncio
-@patch("httpx.AsyncClient.get")
-async def test_fetch_pr_files(mock_get):
-    mock_response = MagicMock()
-    mock_response.status_code = 200
-    mock_response.json.return_value = [{"filename": "file.py"}]
-    mock_get.return_value = mock_response
+async def test_fetch_pr_files(paged_github, ctx):
+    requests = paged_github(1)
+    result = await fetch_pr_files(ctx)
+    assert result == [{"filename": "file0.py"}]
+    assert requests[0].url.params["per_page"] == "100"
 
-    result = await fetch_pr_files("user", "repo", 1, "ghp_xxx")
-    assert result == [{"filename": "file.py"}]
+@pytest.mark.asyncio
+async def test_iter_pr_files_prefetches_all_pages_in_order(paged_github, ctx):
+    requests = paged_github(250)
+    names = [f["filename"] async for f in iter_pr_files(ctx)]
+    assert names == [f"file{i}.py" for i in range(250)]
+    assert len(ctx.files) == 250
+    assert sorted(r.url.params["page"] for r in requests) == ["1", "2", "3"]
+
+@pytest.mark.asyncio
+async def test_iter_pr_files_follows_next_links(paged_github, ctx):
+    requests = paged_github(150, with_last=False)
+    names = [f["filename"] async for f in iter_pr_files(ctx)]
+    assert names == [f"file{i}.py" for i in range(150)]
+    assert len(requests) == 2
 
 # === fetch_file_content ===
+@pytest.fixture
+def github_transport():
+    """Route the shared GitHub client through an httpx.MockTransport handler."""
+    def install(handler):
+        set_github_client(GitHubClient(transport=httpx.MockTransport(handler)))
+    yield install
+    set_github_client(None)
+
 @pytest.mark.asyncio
-@patch("httpx.AsyncClient.get")
-async def test_fetch_file_content(mock_get):
-    mock_response = MagicMock()
-    mock_response.status_code = 200
+async def test_fetch_file_content(github_transport, ctx):
     encoded = base64.b64encode(b'print("hello")').decode("utf-8")
-    mock_response.json.return_value = {"content": encoded}
-    mock_get.return_value = mock_response
+    requests = []
 
-    content = await fetch_file_content("user", "repo", "file.py", "37dwd2e3" ,"ghp_xxx")
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json={"content": encoded})
+    github_transport(handler)
+
+    content = await fetch_file_content(ctx, "file.py")
+    assert requests[0].url.params["ref"] == "abc123"
     assert content.strip() == 'print("hello")'
 
+# === compare_commits ===
+@pytest.mark.asyncio
+async def test_compare_commits(github_transport, ctx):
+    def handler(request):
+        assert request.url.path == "/repos/user/repo/compare/old111...abc123"
+        return httpx.Response(200, json={"status": "ahead", "files": [{"filename": "a.py", "patch": "@@ -1 +1 @@\n-x\n+y"}, {"filename": "b.png"}]})
+    github_transport(handler)
+    assert await compare_commits(ctx, "old111", "abc123") == {"a.py": "@@ -1 +1 @@\n-x\n+y", "b.png": None}
+
+# ❌ Old head gone after a force-push: no incremental diff
+@pytest.mark.asyncio
+async def test_compare_commits_unavailable(github_transport, ctx):
+    github_transport(lambda request: httpx.Response(404, json={"message": "Not Found"}))
+    assert await compare_commits(ctx, "gone000", "abc123") is None
+
+# ❌ Rebased or force-pushed onto a new base: the old head still exists but has diverged
+@pytest.mark.asyncio
+async def test_compare_commits_diverged(github_transport, ctx):
+    github_transport(lambda request: httpx.Response(200, json={
+        "status": "diverged", "files": [{"filename": "a.py", "patch": "@@ -1 +1 @@\n-x\n+y"}]
+    }))
+    assert await compare_commits(ctx, "old111", "abc123") is None
+
+
 # === post_general_pr_comment ===
-@patch("httpx.post")
-def test_post_general_pr_comment_success(mock_post):
+@patch("httpx.Client.request")
+def test_post_general_pr_comment_success(mock_post, ctx):
     mock_response = MagicMock()
     mock_response.status_code = 201
     mock_response.json.return_value = {"id": 123}
     mock_post.return_value = mock_response
 
-    response = post_general_pr_comment("user", "repo", 1, "Hello PR!", "ghp_xxx")
+    response = post_general_pr_comment(ctx, "Hello PR!")
     assert response["id"] == 123
 
-@patch("httpx.post")
-def test_post_general_pr_comment_failure(mock_post):
+@patch("httpx.Client.request")
+def test_post_general_pr_comment_failure(mock_post, ctx):
     mock_response = MagicMock()
     mock_response.status_code = 400
     mock_response.text = "Bad Request"
@@ -61,34 +143,48 @@ def test_post_general_pr_comment_failure(mock_post):
     mock_post.return_value = mock_response
 
     with pytest.raises(Exception):
-        post_general_pr_comment("user", "repo", 1, "Test", "ghp_xxx")
+        post_general_pr_comment(ctx, "Test")
 
 # === get_latest_commit_sha ===
-@patch("httpx.get")
-def test_get_latest_commit_sha(mock_get):
-    mock_response = MagicMock()
-    mock_response.status_code = 200
-    mock_response.json.return_value = {"head": {"sha": "abc123"}}
-    mock_get.return_value = mock_response
+def test_get_latest_commit_sha(github_transport):
+    github_transport(lambda request: httpx.Response(200, json={"head": {"sha": "abc123"}}))
 
     sha = get_latest_commit_sha("user", "repo", 1, "ghp_xxx")
     assert sha == "abc123"
 
+# === get_pr_context ===
+def test_get_pr_context(github_transport):
+    github_transport(lambda request: httpx.Response(200, json={
+        "title": "Fix it",
+        "head": {"sha": "abc123", "ref": "feature"},
+        "base": {"sha": "base000", "ref": "main"},
+    }))
+
+    ctx = get_pr_context("user", "repo", 1, "ghp_xxx")
+    assert (ctx.head_sha, ctx.base_sha, ctx.head_ref, ctx.base_ref, ctx.title) == ("abc123", "base000", "feature", "main", "Fix it")
+
 # === post_inline_comment ===
-@patch("app.github.get_latest_commit_sha", return_value="abc123")
-@patch("httpx.post")
-def test_post_inline_comment_success(mock_post, mock_sha):
+@patch("httpx.Client.request")
+def test_post_inline_comment_success(mock_post, ctx):
     mock_response = MagicMock()
     mock_response.status_code = 201
     mock_response.json.return_value = {"id": "comment-id"}
     mock_post.return_value = mock_response
 
-    response = post_inline_comment("user", "repo", 1, "file.py", 10, "Nice line!", "ghp_xxx")
+    response = post_inline_comment(ctx, "file.py", 10, "Nice line!")
     assert response["id"] == "comment-id"
+    # The head sha comes from the context, not from another metadata request
+    assert mock_post.call_count == 1
+    assert mock_post.call_args.kwargs["json"]["commit_id"] == "abc123"
+    # A single-line comment carries no range
+    assert "start_line" not in mock_post.call_args.kwargs["json"]
+
+    post_inline_comment(ctx, "file.py", 12, "Nice block!", start_line=10)
+    data = mock_post.call_args.kwargs["json"]
+    assert (data["start_line"], data["start_side"], data["line"]) == (10, "RIGHT", 12)
 
-@patch("app.github.get_latest_commit_sha", return_value="abc123")
-@patch("httpx.post")
-def test_post_inline_comment_failure(mock_post, mock_sha):
+@patch("httpx.Client.request")
+def test_post_inline_comment_failure(mock_post, ctx):
     mock_response = MagicMock()
     mock_response.status_code = 422
     mock_response.text = "Unprocessable"
@@ -96,4 +192,20 @@ def test_post_inline_comment_failure(mock_post, mock_sha):
     mock_post.return_value = mock_response
 
     with pytest.raises(Exception):
-        post_inline_comment("user", "repo", 1, "file.py", 99, "Invalid line!", "ghp_xxx")
+        post_inline_comment(ctx, "file.py", 99, "Invalid line!")
+
+# === submit_review ===
+@patch("httpx.Client.request")
+def test_submit_review_single_request(mock_post, ctx):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = {"id": 7}
+    mock_post.return_value = mock_response
+
+    comments = [{"path": "a.py", "line": i, "body": "x"} for i in range(1, 4)]
+    assert submit_review(ctx, comments, body="summary")["id"] == 7
+    assert mock_post.call_count == 1
+    payload = mock_post.call_args.kwargs["json"]
+    assert payload["commit_id"] == "abc123"
+    assert len(payload["comments"]) == 3
+    assert all(c["side"] == "RIGHT" for c in payload["comments"])
@@ -0,0 +1,29 @@
+from app.lib.json_stream import JSONItemStream
+
+REPLY = '{"files": [{"name": "a.py", "issues": [{"line": 1, "description": "uses \\"}\\" braces"}]}, {"name": "b.py", "issues": [{"line": 2}]}], "summary": {"total_issues": 2}}'
+
+
+# ✅ Items are emitted the moment they close, labelled with their file
+def test_items_emitted_incrementally():
+    stream = JSONItemStream()
+    emitted = []
+    for ch in REPLY:
+        emitted.extend(stream.feed(ch))
+    assert emitted == [("a.py", {"line": 1, "description": 'uses "}" braces'}), ("b.py", {"line": 2})]
+    assert stream.document()["summary"] == {"total_issues": 2}
+
+
+# ✅ Prose and fences around the object are ignored
+def test_fenced_reply():
+    stream = JSONItemStream()
+    stream.feed("Here you go:\n```json\n" + REPLY + "\n```\nAnything else?")
+    assert len(stream.items) == 2
+    assert stream.document()["files"][1]["name"] == "b.py"
+
+
+# ❌ An unfinished object has no document but keeps completed items
+def test_truncated_reply():
+    stream = JSONItemStream()
+    stream.feed(REPLY[:REPLY.index("b.py")])
+    assert stream.document() is None
+    assert [label for label, _ in stream.items] == ["a.py"]
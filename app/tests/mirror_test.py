@@ -0,0 +1,100 @@
+import asyncio
+import os
+import subprocess
+import pytest
+from unittest.mock import patch
+from app.mirror import MirrorFileNotFound, RepoMirror, evict_mirrors, split_diff
+
+
+def git(cwd, *args):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+@pytest.fixture
+def source_repo(tmp_path):
+    """A local repository laid out like GitHub: refs/pull/1/head and refs/pull/1/merge."""
+    src = tmp_path / "src"
+    src.mkdir()
+    git(src, "init", "-q", "-b", "main")
+    git(src, "config", "user.email", "t@example.com")
+    git(src, "config", "user.name", "t")
+    (src / "app.py").write_text("\n".join(f"line {i}" for i in range(20)) + "\n")
+    git(src, "add", ".")
+    git(src, "commit", "-q", "-m", "base")
+    base = git(src, "rev-parse", "HEAD")
+    git(src, "checkout", "-q", "-b", "feature")
+    (src / "app.py").write_text("\n".join(f"line {i}" if i != 10 else "changed" for i in range(20)) + "\n")
+    (src / "new.py").write_text("print('new')\n")
+    git(src, "add", ".")
+    git(src, "commit", "-q", "-m", "feature")
+    head = git(src, "rev-parse", "HEAD")
+    git(src, "checkout", "-q", "main")
+    git(src, "merge", "-q", "--no-ff", "-m", "merge", "feature")
+    git(src, "update-ref", "refs/pull/1/head", head)
+    git(src, "update-ref", "refs/pull/1/merge", "HEAD")
+    return {"url": f"file://{src}", "base": base, "head": head}
+
+
+# ✅ Fetch a PR head into the mirror, derive the base and read blobs/diffs locally
+def test_mirror_fetch_read_and_diff(tmp_path, source_repo):
+    mirror = RepoMirror(source_repo["url"], root=str(tmp_path / "mirrors"))
+    assert mirror.fetch_pull(1) is True
+    assert mirror.merge_base(1) == source_repo["base"]
+
+    content = asyncio.run(mirror.read_file(source_repo["head"], "new.py"))
+    assert content == "print('new')\n"
+
+    patches = mirror.diff(source_repo["base"], source_repo["head"], context_lines=1)
+    assert set(patches) == {"app.py", "new.py"}
+    assert patches["app.py"].startswith("@@ -10,3 +10,3 @@")
+    assert "+changed" in patches["app.py"]
+
+    # A second fetch is incremental and reuses the same mirror
+    assert mirror.fetch_pull(1) is True
+
+
+# ❌ Missing files raise instead of returning garbage
+def test_mirror_read_missing_file(tmp_path, source_repo):
+    mirror = RepoMirror(source_repo["url"], root=str(tmp_path / "mirrors"))
+    mirror.fetch_pull(1)
+    with pytest.raises(MirrorFileNotFound):
+        asyncio.run(mirror.read_file(source_repo["head"], "missing.py"))
+    assert mirror.has_commit(source_repo["head"])
+    assert not mirror.has_commit("1234567890123456789012345678901234567890")
+
+
+# ✅ Least recently used mirrors are evicted over the disk budget
+def test_evict_mirrors(tmp_path):
+    for name, mtime in (("old.git", 1), ("new.git", 2)):
+        path = tmp_path / name
+        path.mkdir()
+        (path / "pack").write_bytes(b"x" * 100)
+        os.utime(path, (mtime, mtime))
+    evict_mirrors(str(tmp_path), budget=150)
+    assert not (tmp_path / "old.git").exists()
+    assert (tmp_path / "new.git").exists()
+
+
+# ✅ A mirror being read is never evicted from under the reader
+def test_evict_skips_mirror_being_read(tmp_path, source_repo):
+    root = str(tmp_path / "mirrors")
+    mirror = RepoMirror(source_repo["url"], root=root)
+    mirror.fetch_pull(1)
+    exec_git = asyncio.create_subprocess_exec
+
+    async def evict_then_exec(*args, **kwargs):
+        evict_mirrors(root, budget=0)
+        return await exec_git(*args, **kwargs)
+
+    with patch("app.mirror.asyncio.create_subprocess_exec", side_effect=evict_then_exec):
+        content = asyncio.run(mirror.read_file(source_repo["head"], "new.py"))
+    assert content == "print('new')\n"
+    assert os.path.isdir(mirror.path)
+
+    evict_mirrors(root, budget=0)
+    assert not os.path.isdir(mirror.path)
+
+
+def test_split_diff_deleted_file():
+    output = "diff --git a/gone.py b/gone.py\ndeleted file mode 100644\n--- a/gone.py\n+++ /dev/null\n@@ -1 +0,0 @@\n-x"
+    assert split_diff(output) == {"gone.py": "@@ -1 +0,0 @@\n-x"}
@@ -0,0 +1,100 @@
+import httpx
+from unittest.mock import patch
+from app.lib.rate_limit import RateLimiter, MemoryRateLimitStore, token_key
+from app.lib.github_client import GitHubClient
+
+
+def response(status=200, **headers):
+    return httpx.Response(status, headers=headers)
+
+
+# ✅ No delay while the budget is healthy
+@patch("app.lib.rate_limit.time.time", return_value=1000.0)
+def test_no_delay_with_plenty_of_budget(mock_time):
+    limiter = RateLimiter(MemoryRateLimitStore(), pace_below=100)
+    limiter.update("t", response(**{"X-RateLimit-Remaining": "4000", "X-RateLimit-Reset": "4600"}))
+    assert limiter.delay("t") == 0
+    assert limiter.delay("t") == 0
+
+# ✅ Low budget is spread evenly until the reset time
+@patch("app.lib.rate_limit.time.time", return_value=1000.0)
+def test_low_budget_is_paced(mock_time):
+    limiter = RateLimiter(MemoryRateLimitStore(), pace_below=100)
+    limiter.update("t", response(**{"X-RateLimit-Remaining": "10", "X-RateLimit-Reset": "1100"}))
+    assert limiter.delay("t") == 0
+    assert limiter.delay("t") == 10.0
+    # Other tokens have their own budget
+    assert limiter.delay("other") == 0
+
+# ✅ Retry-After blocks every caller of that token
+@patch("app.lib.rate_limit.time.time", return_value=1000.0)
+def test_retry_after_blocks_token(mock_time):
+    limiter = RateLimiter(MemoryRateLimitStore())
+    limiter.update("t", response(429, **{"Retry-After": "30"}))
+    assert limiter.delay("t") == 30.0
+
+# ✅ A spent budget delays even the first caller until the reset
+@patch("app.lib.rate_limit.time.time", return_value=1000.0)
+def test_spent_budget_waits_for_reset(mock_time):
+    limiter = RateLimiter(MemoryRateLimitStore())
+    limiter.update("t", response(**{"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "1100"}))
+    assert limiter.delay("t") == 100.0
+    assert limiter.delay("t") == 100.0
+    # Once the window has reset, the request goes out and its response refreshes the budget
+    mock_time.return_value = 1200.0
+    assert limiter.delay("t") == 0
+
+# ✅ Delays are capped
+@patch("app.lib.rate_limit.time.time", return_value=1000.0)
+def test_delay_is_capped(mock_time):
+    limiter = RateLimiter(MemoryRateLimitStore(), max_delay=5)
+    limiter.update("t", response(403, **{"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "5000"}))
+    assert limiter.delay("t") == 5
+
+def test_is_rate_limited():
+    assert RateLimiter.is_rate_limited(response(429))
+    assert RateLimiter.is_rate_limited(response(403, **{"X-RateLimit-Remaining": "0"}))
+    assert not RateLimiter.is_rate_limited(response(403))
+    assert token_key("a") != token_key("b")
+
+# ✅ The client waits and retries instead of failing on a rate-limited response
+@patch("app.lib.github_client.time.sleep")
+def test_client_retries_rate_limited_request(mock_sleep):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"Retry-After": "2"})
+        return httpx.Response(200, json={"ok": True})
+
+    client = GitHubClient(transport=httpx.MockTransport(handler), rate_limiter=RateLimiter(MemoryRateLimitStore()))
+    resp = client.request("GET", "/rate", "t")
+    assert resp.status_code == 200
+    assert len(calls) == 2
+    assert mock_sleep.call_args[0][0] > 1
+
+
+# ✅ Async requests consult the limiter's store off the event loop
+def test_async_client_keeps_limiter_off_the_loop():
+    import asyncio
+    import threading
+    limiter = RateLimiter(MemoryRateLimitStore())
+    threads = []
+    for name in ("delay", "update"):
+        real = getattr(limiter, name)
+
+        def traced(*args, real=real):
+            threads.append(threading.get_ident())
+            return real(*args)
+        setattr(limiter, name, traced)
+    client = GitHubClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, json={})), rate_limiter=limiter)
+
+    async def run():
+        resp = await client.arequest("GET", "/rate", "t")
+        await client.aclose()
+        return resp, threading.get_ident()
+
+    resp, loop_thread = asyncio.run(run())
+    assert resp.status_code == 200
+    assert len(threads) == 2 and loop_thread not in threads
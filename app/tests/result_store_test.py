@@ -0,0 +1,102 @@
+import asyncio
+import orjson
+from unittest.mock import AsyncMock, MagicMock, patch
+from kombu.serialization import dumps, loads
+from app.lib.cache import LRUCache
+from app.lib.cache import RedisCache
+from app.lib.redis_client import set_async_redis
+from app.result_store import aexpand_result, compact_result, expand_result, pack, set_result_store, unpack
+
+
+def completed_result(files=3):
+    return {
+        "task_id": "task-1",
+        "status": "completed",
+        "results": {
+            "raw_output": [
+                {"filename": f"file{i}.py", "code_review": [{"files": [{"issues": [{"line": 1, "description": "x" * 200}]}]}]}
+                for i in range(files)
+            ],
+            "skipped": [],
+        },
+    }
+
+
+# ✅ Results round-trip through the registered Celery serializer, smaller than JSON
+def test_msgpack_zstd_serializer_round_trip():
+    result = completed_result(20)
+    content_type, encoding, payload = dumps(result, serializer="msgpack-zstd")
+    assert encoding == "binary"
+    assert len(payload) < len(orjson.dumps(result)) / 4
+    assert loads(payload, content_type, encoding) == result
+    assert unpack(pack({1: "a"})) == {1: "a"}
+    assert loads(orjson.dumps(result), content_type, encoding) == result
+
+
+# ✅ Each file is stored under its own key and expanded back in order
+def test_compact_and_expand_result():
+    store = LRUCache()
+    set_result_store(store)
+    try:
+        result = completed_result()
+        compact = compact_result(result)
+        assert len(store) == 3
+        assert compact["results"]["raw_output"][1] == {"filename": "file1.py", "result_key": "task-1:1:file1.py"}
+        assert compact["stored_bytes"] == sum(len(v) for v in store._data.values()) + len(pack({k: v for k, v in compact.items() if k != "stored_bytes"}))
+        assert expand_result(compact)["results"] == result["results"]
+
+        # ❌ Expired entries come back as errors instead of failing the request
+        store.delete("task-1:0:file0.py")
+        assert expand_result(compact)["results"]["raw_output"][0]["code_review"] == "Error: stored result expired"
+    finally:
+        set_result_store(None)
+
+
+# ✅ Without a shared store results stay inline
+def test_compact_result_inline_without_store():
+    result = completed_result()
+    compact = compact_result(result)
+    assert compact["results"] == result["results"]
+    assert compact["stored_bytes"] > 0
+    assert expand_result(compact) == compact
+
+
+# ✅ Async handlers read every stored file in one MGET on the pooled client
+@patch("app.result_store.RESULT_STORE_REDIS_URL", "redis://results-test:6379/0")
+def test_aexpand_result_uses_one_mget():
+    sync_client = MagicMock()
+    set_result_store(RedisCache("redis://unused", "review_result", client=sync_client))
+    try:
+        result = completed_result(2)
+        compact = compact_result(result)
+        # Every file is written in one pipelined round trip, with its expiry
+        pipe = sync_client.pipeline.return_value
+        pipe.execute.assert_called_once()
+        assert all(c.kwargs["ex"] for c in pipe.set.call_args_list)
+        stored = {c.args[0]: c.args[1] for c in pipe.set.call_args_list}
+        async_client = MagicMock(mget=AsyncMock(side_effect=lambda keys: [stored.get(k) for k in keys]))
+        set_async_redis("redis://results-test:6379/0", async_client)
+        assert asyncio.run(aexpand_result(compact))["results"] == result["results"]
+        async_client.mget.assert_awaited_once_with(["review_result:task-1:0:file0.py", "review_result:task-1:1:file1.py"])
+    finally:
+        set_result_store(None)
+        set_async_redis("redis://results-test:6379/0", None)
+
+
+# ✅ Review subtasks hand only file references to the chord callback, which reads and then drops them
+def test_compact_expand_and_discard_batch():
+    from app.result_store import compact_batch, discard_batches, expand_batch
+    store = LRUCache()
+    set_result_store(store)
+    try:
+        output = {"results": completed_result(2)["results"]["raw_output"], "llm_usage": {}, "timings": {"review": 1.0}}
+        compact = compact_batch("batch-1", output)
+        assert compact["results"] == [{"filename": "file0.py", "result_key": "batch-1:0:file0.py"},
+                                      {"filename": "file1.py", "result_key": "batch-1:1:file1.py"}]
+        assert len(pack(compact)) < len(pack(output))
+        assert expand_batch(compact) == output
+        assert expand_batch({"error": "llm down"}) == {"error": "llm down"}
+        discard_batches([compact, {"error": "llm down"}])
+        assert len(store) == 0
+    finally:
+        set_result_store(None)
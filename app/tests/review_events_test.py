@@ -0,0 +1,102 @@
+import asyncio
+import orjson
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.review_events import MemoryEventBus, RedisEventBus, review_event_stream, set_event_bus
+
+
+async def collect(stream):
+    return [item async for item in stream]
+
+
+# ✅ Streams replay from the requested event, follow live events and end with the outcome
+def test_review_event_stream_memory_bus():
+    bus = MemoryEventBus()
+    set_event_bus(bus)
+    try:
+        bus.publish("t1", "planned", {"files": 2})
+        bus.publish("t1", "file", {"filename": "a.py", "issues": 1, "failed": False})
+
+        async def follow():
+            stream = asyncio.ensure_future(collect(review_event_stream("t1", after=1)))
+            await asyncio.sleep(0.05)
+            bus.publish("t1", "completed", {"status": "completed"})
+            bus.publish("t1", "file", {"filename": "late.py"})
+            return await stream
+
+        events = asyncio.run(follow())
+    finally:
+        set_event_bus(None)
+    assert events == [
+        'id: 2\nevent: file\ndata: {"filename":"a.py","issues":1,"failed":false}\n\n',
+        'id: 3\nevent: completed\ndata: {"status":"completed"}\n\n',
+    ]
+
+
+# ✅ Idle streams send keep-alive comments
+@patch("app.review_events.REVIEW_EVENTS_KEEPALIVE", 0.01)
+def test_review_event_stream_keep_alive():
+    bus = MemoryEventBus()
+    set_event_bus(bus)
+
+    async def first():
+        stream = review_event_stream("idle")
+        item = await stream.__anext__()
+        await stream.aclose()
+        return item
+
+    try:
+        assert asyncio.run(first()) == ": keep-alive\n\n"
+    finally:
+        set_event_bus(None)
+
+
+# ❌ A stream without any event for REVIEW_EVENTS_MAX_IDLE seconds is closed
+@patch("app.review_events.REVIEW_EVENTS_KEEPALIVE", 0.01)
+@patch("app.review_events.REVIEW_EVENTS_MAX_IDLE", 0.03)
+def test_review_event_stream_closes_when_idle():
+    set_event_bus(MemoryEventBus())
+    try:
+        assert asyncio.run(collect(review_event_stream("gone"))) == [": keep-alive\n\n"] * 2
+    finally:
+        set_event_bus(None)
+
+
+# ✅ Redis events go to one list per review plus a wake-up message, in one round trip
+def test_redis_event_bus():
+    client = MagicMock()
+    pubsub = MagicMock(subscribe=AsyncMock(), unsubscribe=AsyncMock(), aclose=AsyncMock(),
+                       get_message=AsyncMock(return_value={"data": b""}))
+    async_client = MagicMock(pubsub=MagicMock(return_value=pubsub))
+    async_client.lrange = AsyncMock(side_effect=[
+        [orjson.dumps(["planned", {"files": 1}])],
+        [orjson.dumps(["completed", {"status": "completed"}])],
+    ])
+    bus = RedisEventBus("redis://unused", client=client, async_client=async_client)
+
+    bus.publish("t1", "planned", {"files": 1})
+    pipe = client.pipeline.return_value
+    pipe.rpush.assert_called_once_with("review_events:t1", orjson.dumps(["planned", {"files": 1}]))
+    pipe.publish.assert_called_once_with("review_events:t1", b"")
+    pipe.execute.assert_called_once()
+
+    set_event_bus(bus)
+    try:
+        events = asyncio.run(collect(review_event_stream("t1")))
+    finally:
+        set_event_bus(None)
+    assert [e.split("\n")[1] for e in events] == ["event: planned", "event: completed"]
+    assert [c.args[1] for c in async_client.lrange.call_args_list] == [0, 1]
+    pubsub.subscribe.assert_awaited_once_with("review_events:t1")
+    pubsub.unsubscribe.assert_awaited_once()
+
+
+# ✅ Event streams use their own connection pool, not the one shared by /status and /results
+def test_redis_event_bus_has_own_pool():
+    from app.lib.redis_client import get_async_redis, set_async_redis
+    url = "redis://events-test:6379/0"
+    bus = RedisEventBus(url, client=MagicMock())
+    try:
+        assert bus.async_client is not get_async_redis(url)
+        assert bus.async_client.connection_pool is not get_async_redis(url).connection_pool
+    finally:
+        set_async_redis(url, None)
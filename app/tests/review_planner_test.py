@@ -0,0 +1,104 @@
+import pytest
+from unittest.mock import patch
+from app.review_planner import plan_requests, split_file, assign_findings, count_tokens, prefix_tokens, request_budget
+from app.prompt import REVIEW_INSTRUCTIONS
+from app.diff import build_diff_view
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens():
+    # Deterministic counts whether or not the tiktoken encoding is available
+    with patch("app.review_planner.get_encoding", return_value=None):
+        yield
+
+
+def small_file(name, lines=3):
+    return {"filename": name, "content": "\n".join(f"x = {i}" for i in range(lines))}
+
+
+# ✅ Large files are split at line boundaries within the budget, keeping file line numbers
+def test_split_file_by_token_budget():
+    segments = split_file(0, small_file("big.py", 400), budget=500)
+    assert len(segments) > 1
+    assert all(s.tokens <= 500 for s in segments)
+    assert segments[0].first_line == 1
+    assert segments[-1].last_line == 400
+    assert all(a.last_line + 1 == b.first_line for a, b in zip(segments, segments[1:]))
+    assert segments[1].text.split("\n")[0].split()[0] == str(segments[1].first_line)
+
+
+# ✅ Small files share requests; parts of one file never do
+def test_plan_packs_small_files():
+    files = [small_file(f"f{i}.py") for i in range(10)] + [small_file("big.py", 400)]
+    requests = plan_requests(files, budget=500, max_files=20)
+    assert sum(len(r.segments) for r in requests) > len(requests)
+    assert all(r.tokens <= 500 for r in requests)
+    for request in requests:
+        names = [s.filename for s in request.segments]
+        assert len(names) == len(set(names))
+    assert count_tokens(requests[0].prompt()) > 0
+
+
+# ✅ max_files=1 disables packing
+def test_plan_without_packing():
+    requests = plan_requests([small_file("a.py"), small_file("b.py")], budget=500, max_files=1)
+    assert [r.segments[0].filename for r in requests] == ["a.py", "b.py"]
+
+
+# ✅ Findings go back to their file; chunk-relative lines are shifted to file lines
+def test_assign_findings_maps_names_and_lines():
+    big = split_file(0, small_file("src/big.py", 400), budget=500)[1]
+    request = plan_requests([small_file("a.py")], budget=500)[0]
+    request.segments.append(big)
+    response = {"files": [
+        {"name": "big.py", "issues": [{"line": 2}, {"line": big.first_line + 1}], "critical_issues": 1},
+        {"name": "unknown.py", "issues": [{"line": 1}]},
+    ]}
+    a_chunk, big_chunk = assign_findings(request, response)
+    assert a_chunk["files"][0]["issues"] == []
+    assert [i["line"] for i in big_chunk["files"][0]["issues"]] == [big.first_line + 1, big.first_line + 1]
+    assert big_chunk["summary"] == {"total_files": 1, "total_issues": 2, "critical_issues": 1}
+
+
+# ❌ A failed request marks every file in it with the error
+def test_assign_findings_error_reaches_every_file():
+    request = plan_requests([small_file("a.py"), small_file("b.py")], budget=500)[0]
+    chunks = assign_findings(request, {"error": "boom"})
+    assert chunks == [{"error": "boom"}, {"error": "boom"}]
+
+
+# ✅ Complexity counts changed diff lines but every line of full content
+def test_changed_lines_by_mode():
+    view = build_diff_view("@@ -1,3 +1,3 @@\n a\n-b\n+c\n d")
+    diff = plan_requests([{"filename": "a.py", "mode": "diff", "content": view}])[0]
+    full = plan_requests([small_file("b.py", 4)])[0]
+    assert diff.changed_lines() == 2
+    assert full.changed_lines() == 4
+
+
+# ✅ The static prompt prefix is counted once and included in the request budget
+def test_prefix_tokens_counted_once():
+    with patch("app.review_planner._prefix_tokens", {}), \
+         patch("app.review_planner.count_tokens", wraps=count_tokens) as mock_count:
+        first = request_budget()
+        second = request_budget()
+        prefix_calls = [c for c in mock_count.call_args_list if c.args[0] == REVIEW_INSTRUCTIONS]
+        assert len(prefix_calls) == 1
+        assert first == second
+        assert prefix_tokens() == count_tokens(REVIEW_INSTRUCTIONS)
+
+
+# ✅ The static prefix is long enough for the provider's prompt cache
+def test_prefix_long_enough_for_prompt_cache():
+    import re
+    # Words and punctuation marks: a lower bound of BPE tokens that needs no tokenizer download
+    assert len(re.findall(r"\w+|[^\w\s]", REVIEW_INSTRUCTIONS)) >= 1024
+
+
+# ❌ A prefix below the prompt cache threshold is warned about
+def test_short_prefix_warns():
+    with patch("app.review_planner._prefix_tokens", {}), \
+         patch("app.review_planner.count_tokens", return_value=500), \
+         patch("app.review_planner.logger.warning") as mock_warning:
+        prefix_tokens()
+    assert "below the 1024 tokens" in mock_warning.call_args[0][0]
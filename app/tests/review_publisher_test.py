@@ -0,0 +1,67 @@
+import pytest
+from unittest.mock import patch
+from app.github import PRContext
+from app.review_publisher import InlineReviewPublisher, format_issue
+
+
+@pytest.fixture
+def ctx():
+    ctx = PRContext(owner="user", repo="repo", pr_number=1, token="t", head_sha="abc123", base_sha="base000")
+    ctx.files = [{"filename": "a.py", "patch": "@@ -1,2 +1,3 @@\n x\n+y\n+z"}]
+    return ctx
+
+
+def results_with_lines(*lines):
+    return [{
+        "filename": "a.py",
+        "code_review": [{
+            "files": [{"name": "a.py", "issues": [
+                {"type": "bug", "line": line, "description": f"issue {line}", "suggestion": "fix"} for line in lines
+            ]}],
+            "summary": {"total_issues": len(lines), "critical_issues": 0}
+        }]
+    }]
+
+
+# ✅ Findings in the diff become inline comments, others are kept for the review body
+def test_collect_splits_commentable_and_skipped(ctx):
+    publisher = InlineReviewPublisher(ctx)
+    publisher.collect(results_with_lines(2, 3, 40))
+    assert [c["line"] for c in publisher.comments] == [2, 3]
+    assert [c["line"] for c in publisher.skipped] == [40]
+
+# ✅ Error placeholders from analyze_file are ignored
+def test_collect_ignores_error_results(ctx):
+    publisher = InlineReviewPublisher(ctx)
+    publisher.collect([{"filename": "a.py", "code_review": "LLM crashed"}, {"filename": "a.py", "code_review": [{"error": "x"}]}])
+    assert publisher.comments == [] and publisher.skipped == []
+
+# ✅ All findings go out in a single review call
+@patch("app.review_publisher.submit_review", return_value={"id": 1})
+def test_publish_single_review(mock_submit, ctx):
+    publisher = InlineReviewPublisher(ctx)
+    publisher.collect(results_with_lines(1, 2, 3, 99))
+    publisher.publish()
+    assert mock_submit.call_count == 1
+    comments = mock_submit.call_args[0][1]
+    assert len(comments) == 3
+    assert "line 99" in mock_submit.call_args.kwargs["body"]
+
+# ✅ Batches split only when limits require it
+def test_batches_split_on_limits(ctx):
+    publisher = InlineReviewPublisher(ctx, max_comments=2)
+    publisher.collect(results_with_lines(1, 2, 3))
+    assert [len(b) for b in publisher.batches()] == [2, 1]
+
+    publisher = InlineReviewPublisher(ctx, max_bytes=1)
+    publisher.collect(results_with_lines(1, 2))
+    assert [len(b) for b in publisher.batches()] == [1, 1]
+
+@patch("app.review_publisher.submit_review")
+def test_publish_nothing(mock_submit, ctx):
+    assert InlineReviewPublisher(ctx).publish() == []
+    assert not mock_submit.called
+
+def test_format_issue():
+    body = format_issue({"type": "bug", "description": "Null deref", "suggestion": "Check it"})
+    assert body.startswith("**[Bug]** Null deref")
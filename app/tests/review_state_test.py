@@ -0,0 +1,48 @@
+import pytest
+from app.github import PRContext
+from app.lib.cache import LRUCache
+from app.review_state import set_review_state_store, load_review_state, save_review_state, carry_over, merge_results
+
+PATCH = "@@ -1,3 +1,4 @@\n a\n+new\n b\n-c\n+C"
+
+
+def review(name, *lines):
+    return {"filename": name, "code_review": [{
+        "files": [{"name": name, "issues": [{"type": "bug", "line": line, "description": "d", "suggestion": "s"} for line in lines]}],
+        "summary": {"total_issues": len(lines), "critical_issues": len(lines)},
+    }]}
+
+
+@pytest.fixture
+def ctx():
+    set_review_state_store(LRUCache())
+    yield PRContext(owner="user", repo="repo", pr_number=7, token="t", head_sha="new222", base_sha="base000")
+    set_review_state_store(None)
+
+
+# ✅ Saved state round-trips per PR
+def test_save_and_load_review_state(ctx):
+    assert load_review_state(ctx) is None
+    save_review_state(ctx, [review("a.py", 1)], [{"filename": "yarn.lock", "reason": "lockfile"}])
+    state = load_review_state(ctx)
+    assert state["head_sha"] == "new222"
+    assert state["results"]["a.py"] == review("a.py", 1)
+    assert state["skipped"] == [{"filename": "yarn.lock", "reason": "lockfile"}]
+
+
+# ✅ Stored findings follow their lines; findings on rewritten lines are dropped
+def test_carry_over_remaps_lines():
+    chunks = carry_over(review("a.py", 1, 2, 3), PATCH)
+    assert [i["line"] for i in chunks[0]["files"][0]["issues"]] == [1, 3]
+    assert chunks[0]["summary"] == {"total_issues": 2, "critical_issues": 2}
+
+
+# ✅ Untouched files keep stored results, incrementally reviewed files get both, PR order kept
+def test_merge_results():
+    pr_files = [{"filename": "a.py"}, {"filename": "b.py"}, {"filename": "c.py"}]
+    previous = {"a.py": review("a.py", 1), "b.py": review("b.py", 9), "gone.py": review("gone.py", 1)}
+    reviewed = [review("a.py", 2), review("c.py", 5)]
+    merged = merge_results(pr_files, previous, reviewed, {"a.py": PATCH})
+    assert [r["filename"] for r in merged] == ["a.py", "b.py", "c.py"]
+    assert [c["files"][0]["issues"][0]["line"] for c in merged[0]["code_review"]] == [1, 2]
+    assert merged[1] == previous["b.py"]
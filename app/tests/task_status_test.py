@@ -0,0 +1,37 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+from celery.backends.redis import RedisBackend
+from app.worker import celery_app
+from app.lib.redis_client import set_async_redis
+from app.task_status import fetch_task_metas, status_payload, task_ready
+
+REDIS_URL = "redis://status-test:6379/0"
+
+
+# ✅ With the Redis backend every task's meta is read in one pipelined round trip
+def test_fetch_task_metas_pipelined():
+    backend = RedisBackend(app=celery_app, url=REDIS_URL)
+    done = backend.encode(backend._get_result_meta({"status": "completed"}, "SUCCESS", None, None, format_date=True))
+    pipe = MagicMock(execute=AsyncMock(return_value=[done, None]))
+    client = MagicMock(pipeline=MagicMock(return_value=pipe))
+    set_async_redis(REDIS_URL, client)
+    try:
+        with patch("app.task_status.celery_app", MagicMock(backend=backend)):
+            metas = asyncio.run(fetch_task_metas(["t1", "t2"]))
+    finally:
+        set_async_redis(REDIS_URL, None)
+
+    client.pipeline.assert_called_once_with(transaction=False)
+    assert [c.args[0] for c in pipe.get.call_args_list] == [b"celery-task-meta-t1", b"celery-task-meta-t2"]
+    pipe.execute.assert_awaited_once()
+    assert metas[0]["status"] == "SUCCESS" and metas[0]["result"] == {"status": "completed"}
+    assert metas[1] is None
+    assert task_ready(metas[0]) and not task_ready(metas[1])
+    assert status_payload("t2", metas[1]) == {"task_id": "t2", "status": "PENDING"}
+
+
+# ✅ Other backends are asked through AsyncResult
+@patch("app.task_status.celery_app")
+def test_fetch_task_metas_other_backend(mock_app):
+    mock_app.AsyncResult.return_value = MagicMock(state="PROGRESS", info={"total_findings": 1})
+    assert asyncio.run(fetch_task_metas(["t1"])) == [{"status": "PROGRESS", "result": {"total_findings": 1}}]
@@ -23,8 +23,8 @@
 # @patch("app.tasks.generate_github_markdown_review", return_value="### Review")
 # @patch("app.tasks.build_graph")
 # @patch("app.tasks.fetch_file_content", return_value="print('hi')")
-# @patch("app.tasks.fetch_pr_files", return_value=[{"filename": "file1.py"}])
-# @patch("app.tasks.get_latest_commit_sha", return_value="abc123")
+# @patch("app.tasks.iter_pr_files", return_value=[{"filename": "file1.py"}])
+# @patch("app.tasks.get_pr_context", return_value=PR_CTX)
 # @patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
 # def test_task_success(mock_parse, mock_sha, mock_fetch_files, mock_file_content, mock_graph_fn, mock_markdown, mock_post, fake_inputs, mock_request):
 #     mock_graph = MagicMock()
@@ -49,7 +49,7 @@
 
 
 # # === ❌ Case 3: get_latest_commit_sha fails ===
-# @patch("app.tasks.get_latest_commit_sha", side_effect=Exception("sha fail"))
+# @patch("app.tasks.get_pr_context", side_effect=Exception("sha fail"))
 # @patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
 # def test_sha_fetch_error(mock_parse, mock_sha, fake_inputs, mock_request):
 #     result = run_wrapped_task(mock_request, fake_inputs["repo_url"], fake_inputs["pr_number"], fake_inputs["github_token"])
@@ -58,8 +58,8 @@
 
 
 # # === ❌ Case 4: fetch_pr_files fails ===
-# @patch("app.tasks.fetch_pr_files", side_effect=Exception("fetch_pr_files error"))
-# @patch("app.tasks.get_latest_commit_sha", return_value="abc123")
+# @patch("app.tasks.iter_pr_files", side_effect=Exception("fetch_pr_files error"))
+# @patch("app.tasks.get_pr_context", return_value=PR_CTX)
 # @patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
 # def test_fetch_pr_files_error(mock_parse, mock_sha, mock_fetch, fake_inputs, mock_request):
 #     result = run_wrapped_task(mock_request, fake_inputs["repo_url"], fake_inputs["pr_number"], fake_inputs["github_token"])
@@ -69,8 +69,8 @@
 
 # # === ❌ Case 5: fetch_file_content fails ===
 # @patch("app.tasks.fetch_file_content", side_effect=Exception("file content error"))
-# @patch("app.tasks.fetch_pr_files", return_value=[{"filename": "file1.py"}])
-# @patch("app.tasks.get_latest_commit_sha", return_value="abc123")
+# @patch("app.tasks.iter_pr_files", return_value=[{"filename": "file1.py"}])
+# @patch("app.tasks.get_pr_context", return_value=PR_CTX)
 # @patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
 # def test_fetch_file_content_error(mock_parse, mock_sha, mock_files, mock_content, fake_inputs, mock_request):
 #     result = run_wrapped_task(mock_request, fake_inputs["repo_url"], fake_inputs["pr_number"], fake_inputs["github_token"])
@@ -81,8 +81,8 @@
 # # === ❌ Case 6: build_graph fails ===
 # @patch("app.tasks.build_graph", side_effect=Exception("graph build error"))
 # @patch("app.tasks.fetch_file_content", return_value="code")
-# @patch("app.tasks.fetch_pr_files", return_value=[{"filename": "file1.py"}])
-# @patch("app.tasks.get_latest_commit_sha", return_value="abc123")
+# @patch("app.tasks.iter_pr_files", return_value=[{"filename": "file1.py"}])
+# @patch("app.tasks.get_pr_context", return_value=PR_CTX)
 # @patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
 # def test_build_graph_error(mock_parse, mock_sha, mock_files, mock_content, mock_build, fake_inputs, mock_request):
 #     result = run_wrapped_task(mock_request, fake_inputs["repo_url"], fake_inputs["pr_number"], fake_inputs["github_token"])
@@ -93,8 +93,8 @@
 # # === ❌ Case 7: graph.invoke fails ===
 # @patch("app.tasks.build_graph")
 # @patch("app.tasks.fetch_file_content", return_value="code")
-# @patch("app.tasks.fetch_pr_files", return_value=[{"filename": "file1.py"}])
-# @patch("app.tasks.get_latest_commit_sha", return_value="abc123")
+# @patch("app.tasks.iter_pr_files", return_value=[{"filename": "file1.py"}])
+# @patch("app.tasks.get_pr_context", return_value=PR_CTX)
 # @patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
 # def test_graph_invoke_error(mock_parse, mock_sha, mock_files, mock_content, mock_build, fake_inputs, mock_request):
 #     mock_graph = MagicMock()
@@ -110,8 +110,8 @@
 # @patch("app.tasks.generate_github_markdown_review", side_effect=Exception("markdown error"))
 # @patch("app.tasks.build_graph")
 # @patch("app.tasks.fetch_file_content", return_value="code")
-# @patch("app.tasks.fetch_pr_files", return_value=[{"filename": "file1.py"}])
-# @patch("app.tasks.get_latest_commit_sha", return_value="abc123")
+# @patch("app.tasks.iter_pr_files", return_value=[{"filename": "file1.py"}])
+# @patch("app.tasks.get_pr_context", return_value=PR_CTX)
 # @patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
 # def test_markdown_gen_fails(mock_parse, mock_sha, mock_files, mock_content, mock_build, mock_md, fake_inputs, mock_request):
 #     mock_graph = MagicMock()
@@ -128,8 +128,8 @@
 # @patch("app.tasks.generate_github_markdown_review", return_value="markdown")
 # @patch("app.tasks.build_graph")
 # @patch("app.tasks.fetch_file_content", return_value="code")
-# @patch("app.tasks.fetch_pr_files", return_value=[{"filename": "file1.py"}])
-# @patch("app.tasks.get_latest_commit_sha", return_value="abc123")
+# @patch("app.tasks.iter_pr_files", return_value=[{"filename": "file1.py"}])
+# @patch("app.tasks.get_pr_context", return_value=PR_CTX)
 # @patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
 # def test_post_comment_fail(mock_parse, mock_sha, mock_files, mock_content, mock_build, mock_md, mock_post, fake_inputs, mock_request):
 #     mock_graph = MagicMock()
@@ -143,8 +143,21 @@
 
 
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from app.tasks import analyze_pr_task
+from app.github import PRContext
+
+from app.lib.cache import LRUCache
+from app.review_state import set_review_state_store
+
+PR_CTX = PRContext(owner="user", repo="repo", pr_number=42, token="ghp_mocked", head_sha="abc123", base_sha="base000")
+
+@pytest.fixture(autouse=True)
+def review_state_store():
+    store = LRUCache()
+    set_review_state_store(store)
+    yield store
+    set_review_state_store(None)
 
 @pytest.fixture
 def fake_inputs():
@@ -166,12 +179,12 @@ def run_wrapped_task(mock_request, *args):
 @patch("app.tasks.generate_github_markdown_review", return_value="### Review")
 @patch("app.tasks.build_graph")
 @patch("app.tasks.fetch_file_content", return_value="print('hi')")
-@patch("app.tasks.fetch_pr_files", return_value=[{"filename": f"file{i}.py"} for i in range(10)])
-@patch("app.tasks.get_latest_commit_sha", return_value="abc123")
+@patch("app.tasks.iter_pr_files", return_value=[{"filename": f"file{i}.py"} for i in range(10)])
+@patch("app.tasks.get_pr_context", return_value=PR_CTX)
 @patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
 def test_task_success(mock_parse, mock_sha, mock_fetch_files, mock_file_content, mock_graph_fn, mock_markdown, mock_post, fake_inputs, mock_request):
     mock_graph = MagicMock()
-    mock_graph.invoke.return_value = {"results": [{"filename": f"file{i}.py", "issues": []} for i in range(10)]}
+    mock_graph.ainvoke = AsyncMock(return_value={"results": [{"filename": f"file{i}.py", "issues": []} for i in range(10)]})
     mock_graph_fn.return_value = (mock_graph, {"files": []})
 
     result = run_wrapped_task(mock_request, fake_inputs["repo_url"], fake_inputs["pr_number"], fake_inputs["github_token"])
@@ -180,7 +193,7 @@ def test_task_success(mock_parse, mock_sha, mock_fetch_files, mock_file_content,
     assert "results" in result
     assert mock_post.call_count == 1
     assert mock_markdown.call_count == 1
-    assert mock_graph.invoke.called
+    assert mock_graph.ainvoke.called
 
 # ❌ Case 2: parse_repo_url fails
 @patch("app.tasks.parse_repo_url", side_effect=Exception("parse error"))
@@ -189,8 +202,8 @@ def test_parse_repo_url_error(mock_parse, fake_inputs, mock_request):
     assert result["status"] == "failed"
     assert "parse error" in result["error"]
 
-# ❌ Case 3: get_latest_commit_sha fails
-@patch("app.tasks.get_latest_commit_sha", side_effect=Exception("sha fail"))
+# ❌ Case 3: get_pr_context fails
+@patch("app.tasks.get_pr_context", side_effect=Exception("sha fail"))
 @patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
 def test_sha_fetch_error(mock_parse, mock_sha, fake_inputs, mock_request):
     result = run_wrapped_task(mock_request, fake_inputs["repo_url"], fake_inputs["pr_number"], fake_inputs["github_token"])
@@ -198,8 +211,8 @@ def test_sha_fetch_error(mock_parse, mock_sha, fake_inputs, mock_request):
     assert "sha fail" in result["error"]
 
 # ❌ Case 4: fetch_pr_files fails
-@patch("app.tasks.fetch_pr_files", side_effect=Exception("fetch_pr_files error"))
-@patch("app.tasks.get_latest_commit_sha", return_value="abc123")
+@patch("app.tasks.iter_pr_files", side_effect=Exception("fetch_pr_files error"))
+@patch("app.tasks.get_pr_context", return_value=PR_CTX)
 @patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
 def test_fetch_pr_files_error(mock_parse, mock_sha, mock_fetch, fake_inputs, mock_request):
     result = run_wrapped_task(mock_request, fake_inputs["repo_url"], fake_inputs["pr_number"], fake_inputs["github_token"])
@@ -208,8 +221,8 @@ def test_fetch_pr_files_error(mock_parse, mock_sha, mock_fetch, fake_inputs, moc
 
 # ❌ Case 5: all files skipped
 @patch("app.tasks.fetch_file_content", side_effect=Exception("file content error"))
-@patch("app.tasks.fetch_pr_files", return_value=[{"filename": "file1.py"}])
-@patch("app.tasks.get_latest_commit_sha", return_value="abc123")
+@patch("app.tasks.iter_pr_files", return_value=[{"filename": "file1.py"}])
+@patch("app.tasks.get_pr_context", return_value=PR_CTX)
 @patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
 def test_all_files_skipped(mock_parse, mock_sha, mock_files, mock_content, fake_inputs, mock_request):
     result = run_wrapped_task(mock_request, fake_inputs["repo_url"], fake_inputs["pr_number"], fake_inputs["github_token"])
@@ -219,8 +232,8 @@ def test_all_files_skipped(mock_parse, mock_sha, mock_files, mock_content, fake_
 # ❌ Case 6: build_graph fails
 @patch("app.tasks.build_graph", side_effect=Exception("graph build error"))
 @patch("app.tasks.fetch_file_content", return_value="code")
-@patch("app.tasks.fetch_pr_files", return_value=[{"filename": "file1.py"}])
-@patch("app.tasks.get_latest_commit_sha", return_value="abc123")
+@patch("app.tasks.iter_pr_files", return_value=[{"filename": "file1.py"}])
+@patch("app.tasks.get_pr_context", return_value=PR_CTX)
 @patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
 def test_build_graph_error(mock_parse, mock_sha, mock_files, mock_content, mock_build, fake_inputs, mock_request):
     result = run_wrapped_task(mock_request, fake_inputs["repo_url"], fake_inputs["pr_number"], fake_inputs["github_token"])
@@ -230,12 +243,12 @@ def test_build_graph_error(mock_parse, mock_sha, mock_files, mock_content, mock_
 # ❌ Case 7: graph.invoke fails
 @patch("app.tasks.build_graph")
 @patch("app.tasks.fetch_file_content", return_value="code")
-@patch("app.tasks.fetch_pr_files", return_value=[{"filename": "file1.py"}])
-@patch("app.tasks.get_latest_commit_sha", return_value="abc123")
+@patch("app.tasks.iter_pr_files", return_value=[{"filename": "file1.py"}])
+@patch("app.tasks.get_pr_context", return_value=PR_CTX)
 @patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
 def test_graph_invoke_error(mock_parse, mock_sha, mock_files, mock_content, mock_build, fake_inputs, mock_request):
     mock_graph = MagicMock()
-    mock_graph.invoke.side_effect = Exception("invoke fail")
+    mock_graph.ainvoke = AsyncMock(side_effect=Exception("invoke fail"))
     mock_build.return_value = (mock_graph, {})
 
     result = run_wrapped_task(mock_request, fake_inputs["repo_url"], fake_inputs["pr_number"], fake_inputs["github_token"])
@@ -246,12 +259,12 @@ def test_graph_invoke_error(mock_parse, mock_sha, mock_files, mock_content, mock
 @patch("app.tasks.generate_github_markdown_review", side_effect=Exception("markdown error"))
 @patch("app.tasks.build_graph")
 @patch("app.tasks.fetch_file_content", return_value="code")
-@patch("app.tasks.fetch_pr_files", return_value=[{"filename": "file1.py"}])
-@patch("app.tasks.get_latest_commit_sha", return_value="abc123")
+@patch("app.tasks.iter_pr_files", return_value=[{"filename": "file1.py"}])
+@patch("app.tasks.get_pr_context", return_value=PR_CTX)
 @patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
 def test_markdown_gen_fails(mock_parse, mock_sha, mock_files, mock_content, mock_build, mock_md, fake_inputs, mock_request):
     mock_graph = MagicMock()
-    mock_graph.invoke.return_value = {"results": [{"filename": "file.py", "issues": []}]}
+    mock_graph.ainvoke = AsyncMock(return_value={"results": [{"filename": "file.py", "issues": []}]})
     mock_build.return_value = (mock_graph, {})
 
     result = run_wrapped_task(mock_request, fake_inputs["repo_url"], fake_inputs["pr_number"], fake_inputs["github_token"])
@@ -263,14 +276,432 @@ def test_markdown_gen_fails(mock_parse, mock_sha, mock_files, mock_content, mock
 @patch("app.tasks.generate_github_markdown_review", return_value="markdown")
 @patch("app.tasks.build_graph")
 @patch("app.tasks.fetch_file_content", return_value="code")
-@patch("app.tasks.fetch_pr_files", return_value=[{"filename": "file1.py"}])
-@patch("app.tasks.get_latest_commit_sha", return_value="abc123")
+@patch("app.tasks.iter_pr_files", return_value=[{"filename": "file1.py"}])
+@patch("app.tasks.get_pr_context", return_value=PR_CTX)
 @patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
 def test_post_comment_fail(mock_parse, mock_sha, mock_files, mock_content, mock_build, mock_md, mock_post, fake_inputs, mock_request):
     mock_graph = MagicMock()
-    mock_graph.invoke.return_value = {"results": [{"filename": "file.py", "issues": []}]}
+    mock_graph.ainvoke = AsyncMock(return_value={"results": [{"filename": "file.py", "issues": []}]})
     mock_build.return_value = (mock_graph, {})
 
     result = run_wrapped_task(mock_request, fake_inputs["repo_url"], fake_inputs["pr_number"], fake_inputs["github_token"])
     assert result["status"] == "failed"
     assert "post fail" in result["error"]
+
+
+import asyncio
+import threading
+from app.tasks import fetch_files_content
+
+# ✅ Concurrent fetch respects the cap, keeps PR order and skips failures
+def test_fetch_files_content_bounded_and_ordered():
+    in_flight = 0
+    peak = 0
+
+    async def fake_fetch(ctx, file_path):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01 * (10 - int(file_path[4:-3])))
+        in_flight -= 1
+        if file_path == "file3.py":
+            raise Exception("boom")
+        return f"content of {file_path}"
+
+    files_info = [{"filename": f"file{i}.py"} for i in range(10)]
+    with patch("app.tasks.fetch_file_content", side_effect=fake_fetch), patch("app.tasks.logger") as mock_logger:
+        files = asyncio.run(fetch_files_content(PR_CTX, files_info, concurrency=3))
+
+    assert peak == 3
+    mock_logger.info.assert_any_call(f"Fetched 9 of 10 files for PR #{PR_CTX.pr_number}")
+    assert [f["filename"] for f in files] == [f"file{i}.py" for i in range(10) if i != 3]
+    assert files[0]["content"] == "content of file0.py"
+
+# ✅ Diff mode builds prompts from patches and only fetches files without one
+def test_fetch_files_content_diff_mode():
+    files_info = [
+        {"filename": "a.py", "patch": "@@ -1,1 +1,1 @@\n-x = 1\n+x = 2"},
+        {"filename": "logo.png"},
+    ]
+    with patch("app.tasks.fetch_file_content", return_value="binary-ish") as mock_fetch:
+        files = asyncio.run(fetch_files_content(PR_CTX, files_info, review_mode="diff"))
+
+    assert mock_fetch.call_count == 1
+    assert files[0]["mode"] == "diff"
+    assert "     1 + x = 2" in files[0]["content"]
+    assert files[1]["mode"] == "full"
+
+# ❌ A file whose diff view or triage fails is dropped without failing the others
+def test_fetch_files_content_isolates_bad_file():
+    from app.diff import build_diff_view
+    from app.triage import TriageRules
+    files_info = [
+        {"filename": "a.py", "patch": "@@ -1 +1 @@\n-a\n+b"},
+        {"filename": "bad.py", "patch": "not a patch"},
+        {"filename": "c.py", "patch": "@@ -1 +1 @@\n-a\n+c"},
+    ]
+
+    def diff_view(patch, context_lines):
+        if patch == "not a patch":
+            raise ValueError("malformed hunk header")
+        return build_diff_view(patch, context_lines)
+
+    rules = TriageRules()
+    sniff = rules.sniff
+    with patch("app.tasks.build_diff_view", side_effect=diff_view), \
+            patch.object(rules, "sniff", side_effect=lambda path, *args: sniff(path, *args) if path != "c.py" else 1 / 0):
+        files = asyncio.run(fetch_files_content(PR_CTX, files_info, review_mode="diff", rules=rules))
+    assert [f["filename"] for f in files] == ["a.py"]
+
+
+# ✅ Full-mode fetches are served from the blob cache by sha
+def test_fetch_files_content_uses_blob_cache():
+    from app.blob_cache import set_blob_cache
+    from app.lib.cache import make_cache
+    set_blob_cache(make_cache(1024 * 1024))
+    try:
+        files_info = [{"filename": "a.py", "sha": "blob1"}]
+        with patch("app.tasks.fetch_file_content", return_value="print('hi')") as mock_fetch:
+            first = asyncio.run(fetch_files_content(PR_CTX, files_info, review_mode="full"))
+            second = asyncio.run(fetch_files_content(PR_CTX, files_info, review_mode="full"))
+        assert mock_fetch.call_count == 1
+        assert first[0]["content"] == second[0]["content"] == "print('hi')"
+
+        # The cache is read and written in a worker thread, off the event loop
+        loop_threads = []
+
+        async def fetch_on_loop():
+            loop_threads.append(threading.get_ident())
+            return await fetch_files_content(PR_CTX, [{"filename": "b.py", "sha": "blob2"}], review_mode="full")
+        with patch("app.tasks.fetch_file_content", return_value="b"), \
+                patch("app.tasks.get_blob", side_effect=lambda sha: loop_threads.append(threading.get_ident())), \
+                patch("app.tasks.put_blob", side_effect=lambda sha, content: loop_threads.append(threading.get_ident())):
+            asyncio.run(fetch_on_loop())
+        assert len(loop_threads) == 3 and loop_threads[0] not in loop_threads[1:]
+    finally:
+        set_blob_cache(None)
+
+# ✅ A custom content source and local patches replace the API
+def test_fetch_files_content_custom_source():
+    async def read_local(file_path):
+        return f"local {file_path}"
+
+    files_info = [{"filename": "a.py"}, {"filename": "b.py", "patch": "@@ -1 +1 @@\n-a\n+b"}]
+    with patch("app.tasks.fetch_file_content") as mock_fetch:
+        files = asyncio.run(fetch_files_content(
+            PR_CTX, files_info, review_mode="diff",
+            read_content=read_local, patches={"b.py": "@@ -1 +1,2 @@\n-a\n+b\n+c"}
+        ))
+    assert not mock_fetch.called
+    assert files[0]["content"] == "local a.py"
+    assert "     2 + c" in files[1]["content"]
+
+
+# ✅ A new push only reviews files changed since the last reviewed head; same head reuses results
+@patch("app.tasks.compare_commits", new_callable=AsyncMock)
+@patch("app.tasks.post_general_pr_comment")
+@patch("app.tasks.build_graph")
+@patch("app.tasks.iter_pr_files")
+@patch("app.tasks.get_pr_context")
+@patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
+def test_incremental_review(mock_parse, mock_ctx, mock_files, mock_build, mock_post, mock_compare, fake_inputs, mock_request):
+    pr_files = [{"filename": f"file{i}.py", "patch": "@@ -0,0 +1 @@\n+x = 1"} for i in range(3)]
+    mock_files.side_effect = lambda ctx: list(pr_files)
+
+    def build(batch, **kwargs):
+        graph = MagicMock()
+        graph.ainvoke = AsyncMock(return_value={"results": [
+            {"filename": f["filename"], "code_review": [{"files": [], "summary": {}}]} for f in batch
+        ]})
+        return graph, {"files": batch}
+    mock_build.side_effect = build
+
+    first_ctx = PRContext(owner="user", repo="repo", pr_number=42, token="t", head_sha="abc123", base_sha="base000")
+    second_ctx = PRContext(owner="user", repo="repo", pr_number=42, token="t", head_sha="def456", base_sha="base000")
+    mock_ctx.side_effect = [first_ctx, second_ctx, second_ctx]
+    mock_compare.return_value = {"file1.py": "@@ -1 +1,2 @@\n x = 1\n+y = 2"}
+    args = (fake_inputs["repo_url"], fake_inputs["pr_number"], fake_inputs["github_token"])
+
+    run_wrapped_task(mock_request, *args)
+    second = run_wrapped_task(mock_request, *args)
+
+    assert [f["filename"] for f in mock_build.call_args[0][0]] == ["file1.py"]
+    mock_compare.assert_called_once_with(second_ctx, "abc123", "def456")
+    assert [r["filename"] for r in second["results"]["raw_output"]] == ["file0.py", "file1.py", "file2.py"]
+
+    third = run_wrapped_task(mock_request, *args)
+    assert mock_build.call_count == 2
+    assert third["results"]["raw_output"] == second["results"]["raw_output"]
+
+
+# ✅ Streamed findings are published to the task state, throttled, and flushed at the end
+def test_review_progress_publishes_findings():
+    from app.tasks import ReviewProgress
+    task = MagicMock()
+    progress = ReviewProgress(task, interval=60)
+    progress.add("a.py", {"line": 1})
+    progress.add("a.py", {"line": 2})
+    assert task.update_state.call_count == 1
+    progress.flush()
+    meta = task.update_state.call_args.kwargs["meta"]
+    assert task.update_state.call_args.kwargs["state"] == "PROGRESS"
+    assert meta["findings"] == [{"filename": "a.py", "line": 1}, {"filename": "a.py", "line": 2}]
+
+
+# ✅ Triage skips files before fetching and reports them; binary content is skipped too
+def test_fetch_files_content_triage():
+    from app.triage import TriageRules, BinaryContentError
+    fetched = []
+
+    async def fake_fetch(ctx, file_path):
+        fetched.append(file_path)
+        if file_path == "blob.dat":
+            raise BinaryContentError("binary content")
+        return "print('ok')"
+
+    files_info = [
+        {"filename": "yarn.lock", "status": "modified"},
+        {"filename": "blob.dat", "status": "modified"},
+        {"filename": "app.py", "status": "modified"},
+    ]
+    skipped = []
+    with patch("app.tasks.fetch_file_content", side_effect=fake_fetch):
+        result = asyncio.run(fetch_files_content(PR_CTX, files_info, review_mode="full", rules=TriageRules(), skipped=skipped))
+
+    assert [f["filename"] for f in result] == ["app.py"]
+    assert "yarn.lock" not in fetched
+    assert sorted(skipped, key=lambda s: s["filename"]) == [
+        {"filename": "blob.dat", "reason": "binary"},
+        {"filename": "yarn.lock", "reason": "lockfile"},
+    ]
+
+
+def fake_build(batch, **kwargs):
+    for f in batch:
+        if kwargs.get("on_file"):
+            kwargs["on_file"](f["filename"], 0, False)
+    graph = MagicMock()
+    graph.ainvoke = AsyncMock(return_value={"results": [
+        {"filename": f["filename"], "code_review": [{"files": [], "summary": {}}]} for f in batch
+    ]})
+    return graph, {"files": batch}
+
+
+# ✅ PRs larger than one batch fan out into review subtasks joined by a publishing callback
+@patch("app.tasks.REVIEW_BATCH_FILES", 2)
+@patch("app.tasks.post_general_pr_comment")
+@patch("app.tasks.build_graph", side_effect=fake_build)
+@patch("app.tasks.iter_pr_files", return_value=[{"filename": f"file{i}.py", "patch": "@@ -0,0 +1 @@\n+x = 1"} for i in range(5)])
+@patch("app.tasks.get_pr_context", return_value=PR_CTX)
+@patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
+def test_large_pr_reviewed_as_chord(mock_parse, mock_ctx, mock_files, mock_build, mock_post, fake_inputs):
+    from app.result_store import expand_batch, expand_result, set_result_store
+    store = LRUCache()
+    set_result_store(store)
+    try:
+        with patch.object(analyze_pr_task, "replace", wraps=analyze_pr_task.replace) as mock_replace, \
+                patch("app.tasks.expand_batch", wraps=expand_batch) as mock_expand:
+            result = expand_result(analyze_pr_task.apply(args=(fake_inputs["repo_url"], 42, "t")).get())
+        # The subtasks hand file references to the callback, which drops them once the review is saved
+        assert all("result_key" in ref for c in mock_expand.call_args_list for ref in c.args[0]["results"])
+        assert mock_expand.call_count == 3
+        assert len(store) == 5
+    finally:
+        set_result_store(None)
+
+    workflow = mock_replace.call_args[0][0]
+    header = getattr(workflow.tasks, "tasks", workflow.tasks)  # a group once the chord is frozen
+    assert [sig.task for sig in header] == ["app.tasks.review_batch_task"] * 3
+    assert workflow.body.task == "app.tasks.publish_review_task"
+    assert mock_build.call_count == 3
+    assert mock_post.call_count == 3
+    assert result["status"] == "completed"
+    assert [r["filename"] for r in result["results"]["raw_output"]] == [f"file{i}.py" for i in range(5)]
+    assert set(result["timings"]) >= {"context", "fetch", "review", "publish", "save"}
+
+
+# ✅ A review publishes its plan, every reviewed file and its outcome as events
+@patch("app.tasks.REVIEW_BATCH_FILES", 2)
+@patch("app.tasks.post_general_pr_comment")
+@patch("app.tasks.build_graph", side_effect=fake_build)
+@patch("app.tasks.iter_pr_files", return_value=[{"filename": f"file{i}.py", "patch": "@@ -0,0 +1 @@\n+x = 1"} for i in range(3)])
+@patch("app.tasks.get_pr_context", return_value=PR_CTX)
+@patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
+def test_review_publishes_progress_events(mock_parse, mock_ctx, mock_files, mock_build, mock_post, fake_inputs):
+    from app.review_events import MemoryEventBus, set_event_bus
+    bus = MemoryEventBus()
+    set_event_bus(bus)
+    try:
+        task_id = analyze_pr_task.apply(args=(fake_inputs["repo_url"], 42, "t")).id
+        mock_parse.side_effect = Exception("bad url")
+        failed_id = analyze_pr_task.apply(args=("nope", 42, "t")).id
+    finally:
+        set_event_bus(None)
+
+    events = bus._events[task_id]
+    assert events[0] == ("planned", {"files": 3, "skipped": 0, "batches": 2})
+    assert sorted(data["filename"] for event, data in events if event == "file") == ["file0.py", "file1.py", "file2.py"]
+    assert events[-1][0] == "completed"
+    assert bus._events[failed_id] == [("failed", {"status": "failed", "error": "bad url"})]
+
+
+# ✅ Missing, failed and truncated (partial) file reviews are reviewed again
+def test_needs_review():
+    from app.tasks import needs_review
+    assert needs_review(None)
+    assert needs_review({"filename": "a.py", "code_review": [{"error": "timeout"}]})
+    assert needs_review({"filename": "a.py", "code_review": [{"files": [], "summary": {}, "partial": True}]})
+    assert not needs_review({"filename": "a.py", "code_review": [{"files": [], "summary": {}}]})
+
+
+# ❌ A PR cannot exempt itself from review through its own triage config
+@patch("app.tasks.post_general_pr_comment")
+@patch("app.tasks.build_graph", side_effect=fake_build)
+@patch("app.tasks.iter_pr_files", return_value=[{"filename": "app.py", "patch": "@@ -0,0 +1 @@\n+x = 1"}])
+@patch("app.tasks.get_pr_context", return_value=PR_CTX)
+@patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
+def test_triage_config_read_from_base(mock_parse, mock_ctx, mock_files, mock_build, mock_post, fake_inputs):
+    async def fetch_content(ctx, file_path, ref=None):
+        return "skip: ['**']" if ref in (None, ctx.head_sha) else "skip: ['docs/**']"
+
+    with patch("app.tasks.fetch_file_content", side_effect=fetch_content) as mock_fetch:
+        result = analyze_pr_task.apply(args=(fake_inputs["repo_url"], 42, "t"), kwargs={"force": True}).get()
+
+    assert mock_fetch.call_args_list[0].kwargs["ref"] == PR_CTX.base_sha
+    assert [f["filename"] for f in mock_build.call_args[0][0]] == ["app.py"]
+    assert result["results"]["skipped"] == []
+
+
+# ✅ A PR whose every file is skipped by triage still gets a comment listing them
+@patch("app.tasks.post_general_pr_comment")
+@patch("app.tasks.build_graph", side_effect=fake_build)
+@patch("app.tasks.fetch_file_content", side_effect=Exception("no triage config"))
+@patch("app.tasks.iter_pr_files", return_value=[{"filename": "yarn.lock"}, {"filename": "logo.png"}])
+@patch("app.tasks.get_pr_context", return_value=PR_CTX)
+@patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
+def test_all_files_skipped_by_triage(mock_parse, mock_ctx, mock_files, mock_fetch, mock_build, mock_post, fake_inputs):
+    result = analyze_pr_task.apply(args=(fake_inputs["repo_url"], 42, "t")).get()
+
+    assert result["status"] == "completed"
+    assert result["results"]["skipped"] == [{"filename": "yarn.lock", "reason": "lockfile"},
+                                            {"filename": "logo.png", "reason": "binary"}]
+    mock_build.assert_not_called()
+    mock_post.assert_called_once()
+    body = mock_post.call_args[0][1]
+    assert "2 file(s) not reviewed" in body
+    assert "`yarn.lock`: lockfile" in body
+
+
+# ✅ A repeat run on the same head reports the same skipped files as the full run
+@patch("app.tasks.post_general_pr_comment")
+@patch("app.tasks.build_graph", side_effect=fake_build)
+@patch("app.tasks.fetch_file_content", side_effect=Exception("no triage config"))
+@patch("app.tasks.iter_pr_files", return_value=[{"filename": "yarn.lock"}, {"filename": "app.py", "patch": "@@ -0,0 +1 @@\n+x = 1"}])
+@patch("app.tasks.get_pr_context", return_value=PR_CTX)
+@patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
+def test_same_head_returns_skipped(mock_parse, mock_ctx, mock_files, mock_fetch, mock_build, mock_post, fake_inputs):
+    first = analyze_pr_task.apply(args=(fake_inputs["repo_url"], 42, "t")).get()
+    second = analyze_pr_task.apply(args=(fake_inputs["repo_url"], 42, "t")).get()
+
+    assert mock_build.call_count == 1
+    assert first["results"]["skipped"] == [{"filename": "yarn.lock", "reason": "lockfile"}]
+    assert second["results"]["skipped"] == first["results"]["skipped"]
+    assert second["results"]["raw_output"] == first["results"]["raw_output"]
+
+
+# ✅ In mirror mode the triage config is read from the merge-base when the base commit was not fetched
+@patch("app.tasks.CONTENT_SOURCE", "mirror")
+@patch("app.tasks.post_general_pr_comment")
+@patch("app.tasks.build_graph", side_effect=fake_build)
+@patch("app.tasks.iter_pr_files", return_value=[{"filename": "docs/a.md"}, {"filename": "app.py"}])
+@patch("app.tasks.get_pr_context", return_value=PR_CTX)
+@patch("app.tasks.parse_repo_url", return_value=("user", "repo"))
+def test_triage_config_read_from_mirror_merge_base(mock_parse, mock_ctx, mock_files, mock_build, mock_post, fake_inputs):
+    mirror = MagicMock()
+    mirror.fetch_pull.return_value = True
+    mirror.merge_base.return_value = "merge-base"
+    mirror.diff.return_value = {}
+    mirror.has_commit.return_value = False
+
+    async def read_file(sha, file_path):
+        if file_path == ".github/code-review.yml":
+            assert sha == "merge-base"
+            return "skip: ['docs/**']"
+        return "print('ok')"
+    mirror.read_file.side_effect = read_file
+
+    with patch("app.tasks.get_repo_mirror", return_value=mirror), patch("app.tasks.get_blob", return_value=None):
+        result = analyze_pr_task.apply(args=(fake_inputs["repo_url"], 42, "t"), kwargs={"force": True}).get()
+
+    mirror.has_commit.assert_called_once_with(PR_CTX.base_sha)
+    assert [f["filename"] for f in mock_build.call_args[0][0]] == ["app.py"]
+    assert result["results"]["skipped"] == [{"filename": "docs/a.md", "reason": "configured"}]
+
+
+# ✅ Only a missing triage config counts as "no config"; failed reads are warned about
+def test_is_missing_file():
+    import httpx
+    from app.mirror import MirrorError, MirrorFileNotFound
+    from app.tasks import is_missing_file
+
+    def status_error(code):
+        request = httpx.Request("GET", "https://api.github.com/x")
+        return httpx.HTTPStatusError("error", request=request, response=httpx.Response(code, request=request))
+
+    assert is_missing_file(status_error(404))
+    assert is_missing_file(MirrorFileNotFound("gone"))
+    assert not is_missing_file(status_error(500))
+    assert not is_missing_file(MirrorError("bad object"))
+
+
+# ❌ A failed review subtask fails the whole review without publishing anything
+@patch("app.tasks.post_general_pr_comment")
+def test_publish_review_task_fails_on_batch_error(mock_post):
+    from app.tasks import publish_review_task, review_batch_task
+    with patch("app.tasks.build_graph", side_effect=Exception("llm down")):
+        failed = review_batch_task.run([{"filename": "a.py"}], False, "root-id")
+    assert failed == {"error": "llm down"}
+
+    plan = {"task_id": "root-id", "ctx": PR_CTX.to_payload(), "previous_head": None, "pr_files": [],
+            "carried": {}, "skipped": [], "timings": {}, "planned_at": 0}
+    ok = {"results": [], "llm_usage": {}, "timings": {"review": 1.0}}
+    result = publish_review_task.run([ok, failed], plan)
+    assert result == {"status": "failed", "error": "llm down"}
+    mock_post.assert_not_called()
+
+
+# ✅ Cache stats logged for a review cover that review only, not the whole worker process
+@patch("app.tasks.save_review_state")
+@patch("app.tasks.post_general_pr_comment")
+def test_publish_review_logs_per_review_cache_stats(mock_post, mock_save):
+    from app.tasks import publish_review
+    client = MagicMock()
+    client.cache_stats.side_effect = [{"hits": 100, "misses": 50}, {"hits": 101, "misses": 51}]
+    plan = {"task_id": "root-id", "ctx": PR_CTX.to_payload(), "previous_head": None, "pr_files": [],
+            "carried": {}, "skipped": [], "timings": {}, "planned_at": 0,
+            "github_cache": {"hits": 2, "misses": 0}}
+    outputs = [{"results": [], "llm_usage": {}, "llm_cache": {"hits": 1, "misses": 1}, "timings": {"review": 1.0}},
+               {"results": [], "llm_usage": {}, "llm_cache": {"hits": 0, "misses": 2}, "timings": {"review": 1.0}}]
+    with patch("app.tasks.get_github_client", return_value=client), patch("app.tasks.INLINE_COMMENTS", False), \
+            patch("app.tasks.logger") as mock_logger:
+        publish_review(plan, outputs, 2.0)
+    mock_logger.info.assert_any_call("GitHub response cache stats: {'hits': 3, 'misses': 1, 'hit_rate': 0.75}")
+    mock_logger.info.assert_any_call("LLM response cache stats: {'hits': 1, 'misses': 3, 'hit_rate': 0.25}")
+
+
+# ✅ Review subtasks share one findings list per review in Redis and publish it to the parent task
+def test_review_progress_shared_between_subtasks():
+    from app.tasks import ReviewProgress
+    task = MagicMock()
+    pipe = task.backend.client.pipeline.return_value
+    pipe.execute.return_value = [2, True, [b'{"filename":"other.py","line":9}', b'{"filename":"a.py","line":1}']]
+    progress = ReviewProgress(task, interval=60, task_id="root-id", shared=task.backend.client)
+    progress.add("a.py", {"line": 1})
+
+    pipe.rpush.assert_called_once_with("review_progress:root-id", b'{"filename":"a.py","line":1}')
+    kwargs = task.update_state.call_args.kwargs
+    assert kwargs["task_id"] == "root-id"
+    assert kwargs["meta"]["findings"] == [{"filename": "other.py", "line": 9}, {"filename": "a.py", "line": 1}]
+
+    progress.flush()
+    assert pipe.rpush.call_count == 1
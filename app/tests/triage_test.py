@@ -0,0 +1,62 @@
+import pytest
+from app.triage import TriageRules, BinaryContentError, decode_text, path_matches
+
+
+# ✅ Patterns without a slash match the file name anywhere; "**/" matches at any depth
+def test_path_matches():
+    assert path_matches("web/package-lock.json", "package-lock.json")
+    assert path_matches("vendor/lib/a.go", "vendor/**")
+    assert path_matches("src/vendor/lib/a.go", "**/vendor/**")
+    assert not path_matches("src/vendors.py", "**/vendor/**")
+
+
+# ✅ Path rules and diff stats classify files before any fetch
+@pytest.mark.parametrize("entry, reason", [
+    ({"filename": "yarn.lock", "status": "modified", "additions": 10, "deletions": 2}, "lockfile"),
+    ({"filename": "static/app.min.js", "status": "added"}, "minified"),
+    ({"filename": "src/__snapshots__/view.test.js.snap", "status": "modified"}, "snapshot"),
+    ({"filename": "third_party/x/y.c", "status": "modified"}, "vendored"),
+    ({"filename": "api/service_pb2.py", "status": "modified"}, "generated"),
+    ({"filename": "docs/logo.png", "status": "added"}, "binary"),
+    ({"filename": "old.py", "status": "removed", "additions": 0, "deletions": 9}, "removed"),
+    ({"filename": "moved.py", "status": "renamed", "additions": 0, "deletions": 0}, "renamed"),
+    ({"filename": "data.xyz", "status": "added", "additions": 0, "deletions": 0}, "binary"),
+    ({"filename": "huge.py", "status": "modified", "additions": 9000, "deletions": 0, "patch": "@@"}, "too_large"),
+    ({"filename": "app/main.py", "status": "modified", "additions": 3, "deletions": 1, "patch": "@@"}, None),
+    ({"filename": "moved.py", "status": "renamed", "additions": 1, "deletions": 0, "patch": "@@"}, None),
+])
+def test_classify(entry, reason):
+    assert TriageRules().classify(entry) == reason
+
+
+# ✅ Per-repo config adds skips, re-includes defaults and overrides limits
+def test_repo_config():
+    rules = TriageRules.from_config("skip: ['docs/**']\ninclude: ['vendor/ours/**']\nmax_changes: 10\n")
+    assert rules.classify({"filename": "docs/guide.py"}) == "configured"
+    assert rules.classify({"filename": "vendor/ours/lib.py"}) is None
+    assert rules.classify({"filename": "a.py", "additions": 8, "deletions": 5, "patch": "@@"}) == "too_large"
+
+
+# ❌ Unreadable config falls back to the defaults
+def test_repo_config_invalid():
+    rules = TriageRules.from_config("skip: [unclosed")
+    assert rules.include == []
+    assert rules.classify({"filename": "yarn.lock"}) == "lockfile"
+
+
+# ✅ Content sniff catches generated headers and minified text
+def test_sniff():
+    rules = TriageRules()
+    assert rules.sniff("a.go", "// Code generated by protoc. DO NOT EDIT.\npackage a\n") == "generated"
+    assert rules.sniff("a.js", "var a=1;" * 200) == "minified"
+    assert rules.sniff("a.py", "def f():\n    return 1\n") is None
+    assert rules.sniff("a.py", "x" * 10, "full") is None
+
+
+# ❌ Binary content is refused instead of crashing on decode
+def test_decode_text():
+    assert decode_text("héllo".encode("utf-8")) == "héllo"
+    with pytest.raises(BinaryContentError):
+        decode_text(b"\x89PNG\r\n\x1a\n\x00\x00")
+    with pytest.raises(BinaryContentError):
+        decode_text(b"\xff\xfe\xfa")
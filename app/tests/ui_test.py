@@ -0,0 +1,27 @@
+import re
+import shutil
+import subprocess
+import pytest
+from app.ui import review_pr_form
+
+
+def page_script():
+    return re.search(r"<script>(.*)</script>", review_pr_form(), re.S).group(1)
+
+
+# ✅ Every element the script looks up exists on the page
+def test_review_pr_script_references_existing_elements():
+    page = review_pr_form()
+    ids = set(re.findall(r'id="([^"]+)"', page))
+    used = set(re.findall(r"getElementById\('([^']+)'\)", page_script()))
+    assert used <= ids
+    assert "statusBtn" not in page
+
+
+# ✅ The page script parses
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+def test_review_pr_script_parses(tmp_path):
+    path = tmp_path / "review_pr.js"
+    path.write_text(page_script())
+    result = subprocess.run(["node", "--check", str(path)], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
@@ -95,3 +95,12 @@ def test_logger_calls(mock_logger, sample_review_data):
     mock_logger.info.assert_any_call("Summary for frontend/src/App.js: 2 issues, 1 critical.")
     mock_logger.info.assert_any_call("Completed generating GitHub markdown review.")
     assert mock_logger.debug.call_count >= 2
+
+
+# ✅ Skipped files are listed with their triage reason
+def test_format_skipped_files():
+    from app.utils import format_skipped_files
+    md = format_skipped_files([{"filename": "yarn.lock", "reason": "lockfile"}, {"filename": "big.py", "reason": "too_large"}])
+    assert "2 file(s) not reviewed" in md
+    assert "- `yarn.lock`: lockfile" in md
+    assert "- `big.py`: too large" in md
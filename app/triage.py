@@ -0,0 +1,145 @@
+import fnmatch
+import os
+import posixpath
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+import yaml
+from dotenv import load_dotenv
+from app.lib.logger import logger
+load_dotenv()
+
+# Per-repo skip rules, read from the PR base branch so a PR cannot exempt itself:
+#   skip: ["docs/**", "*.generated.ts"]      extra patterns to skip
+#   include: ["vendor/our-lib/**"]           review these even if a default rule skips them
+#   max_changes: 3000                        override TRIAGE_MAX_CHANGES
+TRIAGE_CONFIG_PATH = os.getenv("TRIAGE_CONFIG_PATH", ".github/code-review.yml")
+# Extra skip patterns for every repo, comma separated
+TRIAGE_SKIP_PATTERNS = [p.strip() for p in os.getenv("TRIAGE_SKIP_PATTERNS", "").split(",") if p.strip()]
+# Files with more changed lines than this, or more bytes of content, are not sent to the LLM
+TRIAGE_MAX_CHANGES = int(os.getenv("TRIAGE_MAX_CHANGES", "5000"))
+TRIAGE_MAX_BYTES = int(os.getenv("TRIAGE_MAX_BYTES", str(512 * 1024)))
+
+# Bytes inspected by the content sniff
+SNIFF_BYTES = 8192
+
+DEFAULT_SKIP_RULES = [
+    ("lockfile", [
+        "package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock",
+        "Pipfile.lock", "Cargo.lock", "Gemfile.lock", "composer.lock", "go.sum", "mix.lock", "pubspec.lock",
+    ]),
+    ("minified", ["*.min.js", "*.min.css", "*.map"]),
+    ("snapshot", ["*.snap", "**/__snapshots__/**"]),
+    ("vendored", ["vendor/**", "**/vendor/**", "third_party/**", "**/third_party/**", "node_modules/**", "**/node_modules/**"]),
+    ("generated", ["*_pb2.py", "*_pb2_grpc.py", "*.pb.go", "*.generated.*", "*.g.dart", "dist/**", "build/**"]),
+    ("binary", [
+        "*.png", "*.jpg", "*.jpeg", "*.gif", "*.ico", "*.webp", "*.bmp", "*.pdf", "*.zip", "*.gz", "*.tgz",
+        "*.tar", "*.jar", "*.war", "*.woff", "*.woff2", "*.ttf", "*.eot", "*.otf", "*.mp3", "*.mp4", "*.mov",
+        "*.so", "*.dll", "*.dylib", "*.exe", "*.bin", "*.pyc", "*.class", "*.wasm", "*.sqlite3", "*.db",
+    ]),
+]
+
+# Markers code generators leave near the top of their output
+GENERATED_MARKERS = ("@generated", "DO NOT EDIT", "Code generated by", "auto-generated", "autogenerated")
+# Average line length beyond which text is treated as minified
+MINIFIED_LINE_LENGTH = 500
+
+
+class BinaryContentError(ValueError):
+    """File content is not UTF-8 text."""
+
+
+def path_matches(path, pattern):
+    """
+    Glob match for repo paths. Patterns without a "/" match the file name in any
+    directory; a leading "**/" matches at any depth.
+    """
+    if "/" not in pattern:
+        return fnmatch.fnmatchcase(posixpath.basename(path), pattern)
+    if pattern.startswith("**/"):
+        pattern = pattern[3:]
+        return fnmatch.fnmatchcase(path, pattern) or fnmatch.fnmatchcase(path, "*/" + pattern)
+    return fnmatch.fnmatchcase(path, pattern)
+
+
+@dataclass
+class TriageRules:
+    skip: List[Tuple[str, List[str]]] = field(default_factory=lambda: list(DEFAULT_SKIP_RULES))
+    include: List[str] = field(default_factory=list)
+    max_changes: int = TRIAGE_MAX_CHANGES
+    max_bytes: int = TRIAGE_MAX_BYTES
+
+    @classmethod
+    def from_config(cls, text):
+        """Default rules extended by a repo's YAML config; unreadable configs are ignored."""
+        rules = cls()
+        if TRIAGE_SKIP_PATTERNS:
+            rules.skip.append(("configured", TRIAGE_SKIP_PATTERNS))
+        if not text:
+            return rules
+        try:
+            config = yaml.safe_load(text) or {}
+        except yaml.YAMLError as e:
+            logger.warning(f"Ignoring unreadable triage config: {e}")
+            return rules
+        if not isinstance(config, dict):
+            logger.warning("Ignoring triage config that is not a mapping")
+            return rules
+        skip = [str(p) for p in config.get("skip") or []]
+        if skip:
+            rules.skip.append(("configured", skip))
+        rules.include = [str(p) for p in config.get("include") or []]
+        if isinstance(config.get("max_changes"), int):
+            rules.max_changes = config["max_changes"]
+        if isinstance(config.get("max_bytes"), int):
+            rules.max_bytes = config["max_bytes"]
+        return rules
+
+    def classify(self, entry) -> Optional[str]:
+        """
+        Reason to skip a PR file entry before anything is fetched, or None to review
+        it. Uses the path and the diff stats from the files API.
+        """
+        path = entry["filename"]
+        status = entry.get("status")
+        additions = entry.get("additions")
+        deletions = entry.get("deletions")
+        if status == "removed":
+            return "removed"
+        if status == "renamed" and not additions and not deletions:
+            return "renamed"
+        if not any(path_matches(path, p) for p in self.include):
+            for reason, patterns in self.skip:
+                if any(path_matches(path, p) for p in patterns):
+                    return reason
+        if additions is not None and deletions is not None:
+            if additions + deletions > self.max_changes:
+                return "too_large"
+            # GitHub sends binary files with a change count of zero and no patch
+            if additions + deletions == 0 and not entry.get("patch") and status in ("added", "modified"):
+                return "binary"
+        return None
+
+    def sniff(self, path, text, mode="full") -> Optional[str]:
+        """Reason to skip based on a cheap look at the content (or diff view), or None."""
+        if len(text.encode("utf-8")) > self.max_bytes:
+            return "too_large"
+        if any(path_matches(path, p) for p in self.include):
+            return None
+        head = text[:SNIFF_BYTES]
+        lines = head.splitlines()
+        # Generators put their marker in the file header, which only full content shows
+        if mode == "full" and any(marker in line for line in lines[:5] for marker in GENERATED_MARKERS):
+            return "generated"
+        if lines and len(head) / len(lines) > MINIFIED_LINE_LENGTH:
+            return "minified"
+        return None
+
+
+def decode_text(data: bytes) -> str:
+    """Decode file content as UTF-8, refusing binary data (NUL bytes or invalid UTF-8)."""
+    if b"\0" in data[:SNIFF_BYTES]:
+        raise BinaryContentError("binary content")
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError as e:
+        raise BinaryContentError(f"not UTF-8 text: {e}") from e
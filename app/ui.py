@@ -122,7 +122,6 @@ def review_pr_form():
       </form>
       <div id="result"></div>
       <div class="api-buttons">
-        <button id="statusBtn" type="button" disabled>Check Status</button>
         <button id="reviewBtn" type="button" disabled>Get Result</button>
       </div>
       <div id="status"></div>
@@ -130,6 +129,56 @@ def review_pr_form():
     </div>
     <script>
       let lastTaskId = null;
+      let events = null;
+
+      function showStatus(text, color, weight) {
+        const statusDiv = document.getElementById('status');
+        statusDiv.textContent = text;
+        statusDiv.style.color = color || '';
+        statusDiv.style.fontWeight = weight || '';
+      }
+
+      async function showResult() {
+        document.getElementById('review-result').textContent = 'Fetching result...';
+        try {
+          const response = await fetch('/results/' + lastTaskId);
+          const result = await response.json();
+          document.getElementById('review-result').textContent = 'Result: ' + JSON.stringify(result, null, 2);
+        } catch (err) {
+          document.getElementById('review-result').textContent = 'Error: ' + err;
+        }
+      }
+
+      // Progress is pushed over one Server-Sent Events connection; nothing is polled
+      function followProgress(taskId) {
+        if (events) events.close();
+        let total = null;
+        let reviewed = 0;
+        let findings = 0;
+        showStatus('Status: PENDING', '#f59e42', '600'); // orange-600
+        events = new EventSource('/events/' + taskId);
+        events.addEventListener('planned', function(e) {
+          total = JSON.parse(e.data).files;
+          showStatus('Status: REVIEWING 0/' + total + ' files', '#f59e42', '600');
+        });
+        events.addEventListener('file', function(e) {
+          const file = JSON.parse(e.data);
+          reviewed += 1;
+          findings += file.issues;
+          showStatus('Status: REVIEWING ' + reviewed + '/' + (total === null ? '?' : total) + ' files, '
+            + findings + ' finding(s) - last: ' + file.filename, '#f59e42', '600');
+        });
+        events.addEventListener('completed', function() {
+          events.close();
+          showStatus('Status: SUCCESS', '#22c55e', '600'); // green-500
+          showResult();
+        });
+        events.addEventListener('failed', function(e) {
+          events.close();
+          const error = JSON.parse(e.data).error;
+          showStatus('Status: FAILURE' + (error ? ' - ' + error : ''), '#ef4444', '600'); // red-500
+        });
+      }
 
       document.getElementById('analyzeForm').addEventListener('submit', async function(e) {
         e.preventDefault();
@@ -152,54 +201,16 @@ def review_pr_form():
           const result = await response.json();
           document.getElementById('result').textContent = 'Task ID: ' + result.task_id;
           lastTaskId = result.task_id;
-          document.getElementById('statusBtn').disabled = false;
           document.getElementById('reviewBtn').disabled = false;
+          followProgress(result.task_id);
         } catch (err) {
           document.getElementById('result').textContent = 'Error: ' + err;
         }
       });
 
-      document.getElementById('statusBtn').addEventListener('click', async function() {
-        if (!lastTaskId) return;
-        const statusDiv = document.getElementById('status');
-        statusDiv.textContent = 'Checking status...';
-        statusDiv.style.color = '';
-        statusDiv.style.fontWeight = '';
-        try {
-          const response = await fetch('/status/' + lastTaskId);
-          const result = await response.json();
-          let color = '';
-          let weight = '600';
-          if (result.status === 'PENDING') {
-            color = '#f59e42'; // orange-600
-          } else if (result.status === 'SUCCESS' || result.status === 'completed') {
-            color = '#22c55e'; // green-500
-          } else if (result.status === 'FAILURE' || result.status === 'failed') {
-            color = '#ef4444'; // red-500
-          } else {
-            color = '#222';
-            weight = '400';
-          }
-          statusDiv.textContent = 'Status: ' + result.status;
-          statusDiv.style.color = color;
-          statusDiv.style.fontWeight = weight;
-        } catch (err) {
-          statusDiv.textContent = 'Error: ' + err;
-          statusDiv.style.color = '#ef4444';
-          statusDiv.style.fontWeight = '600';
-        }
-      });
-
       document.getElementById('reviewBtn').addEventListener('click', async function() {
         if (!lastTaskId) return;
-        document.getElementById('review-result').textContent = 'Fetching result...';
-        try {
-          const response = await fetch('/results/' + lastTaskId);
-          const result = await response.json();
-          document.getElementById('review-result').textContent = 'Result: ' + JSON.stringify(result, null, 2);
-        } catch (err) {
-          document.getElementById('review-result').textContent = 'Error: ' + err;
-        }
+        showResult();
       });
     </script>
     </body>
@@ -38,3 +38,12 @@ def generate_github_markdown_review(data):
 
     logger.info("Completed generating GitHub markdown review.")
     return "\n".join(lines)
+
+
+def format_skipped_files(skipped):
+    """Markdown list of the files triage kept away from the LLM, with the reason for each."""
+    lines = [f"<details><summary>⏭️ {len(skipped)} file(s) not reviewed</summary>", ""]
+    for entry in skipped:
+        lines.append(f"- `{entry['filename']}`: {entry['reason'].replace('_', ' ')}")
+    lines.append("</details>")
+    return "\n".join(lines)
@@ -1,6 +1,9 @@
 from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown
 import os
 from dotenv import load_dotenv
+from app.lib.github_client import set_github_client, close_github_client
+from app.result_store import celery_result_config
 
 load_dotenv()
 
@@ -12,4 +15,18 @@ celery_app = Celery(
     backend=REDIS_BROKER
 )
 
+# Compact, compressed results that expire (see app/result_store.py)
+celery_app.conf.update(**celery_result_config())
+
 celery_app.autodiscover_tasks(['app'])
+
+
+@worker_process_init.connect
+def init_github_client(**kwargs):
+    # Never reuse sockets inherited from the parent process after fork
+    set_github_client(None)
+
+
+@worker_process_shutdown.connect
+def shutdown_github_client(**kwargs):
+    close_github_client()